@@ -1,8 +1,14 @@
+import os
 import sys
 from PyQt6.QtWidgets import QApplication
-from ui import ImageClassifierApp
+from telemetry import setup_logging
 
 def main():
+    # Логи вместо вывода в консоль: OLENI_LOG_LEVEL=DEBUG показывает класс каждого изображения,
+    # OLENI_LOG_FORMAT=json - по строке JSON на запись. Настройка до импорта ultralytics в ui
+    setup_logging(os.environ.get('OLENI_LOG_LEVEL', 'INFO'), os.environ.get('OLENI_LOG_FORMAT') == 'json')
+    from ui import ImageClassifierApp
+
     app = QApplication(sys.argv)
     ex = ImageClassifierApp()
     ex.show()
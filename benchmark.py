@@ -0,0 +1,423 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from classifier import batched, DEFAULT_BATCH_SIZE
+from preprocessing import IMAGE_EXTENSIONS
+from telemetry import group_stages, setup_logging
+
+
+# Размеченная папка: подпапки с названиями классов
+LABELS = {'Олень': 0, 'Кабарга': 1, 'Косуля': 2, 'deer': 0, 'muskdeer': 1, 'roe': 2}
+
+
+def list_images(folder, limit=None):
+    file_paths = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+    return file_paths[:limit] if limit else file_paths
+
+
+def list_labelled_images(folder, limit=None):
+    samples = []
+    for class_folder in sorted(os.listdir(folder)):
+        if class_folder in LABELS and os.path.isdir(os.path.join(folder, class_folder)):
+            samples.extend((file_path, LABELS[class_folder]) for file_path in list_images(os.path.join(folder, class_folder)))
+    return samples[:limit] if limit else samples
+
+
+# Синтетические кадры фотоловушки: размер, число и зерно генератора фиксированы, чтобы прогоны были сравнимы
+SYNTHETIC_FOLDER = os.path.join('benchmark_data', 'synthetic')
+SYNTHETIC_COUNT = 64
+SYNTHETIC_SIZE = (1920, 1080)
+SYNTHETIC_SEED = 0
+
+# Метрики для сравнения с базовым прогоном: раздел, поля ключа, метрика, True - больше значит лучше
+COMPARED_METRICS = [
+    ('cold_start', ('backend', 'precision'), 'seconds', False),
+    ('model_latency', ('backend', 'precision', 'model', 'batch_size'), 'ms_per_image', False),
+    ('pipeline', ('backend', 'precision', 'batch_size', 'workers'), 'images_per_second', True),
+    ('pipeline', ('backend', 'precision', 'batch_size', 'workers'), 'peak_rss_bytes', False),
+]
+DEFAULT_TOLERANCE = 0.1
+
+
+def make_synthetic_image(rng, width, height):
+    # Фон с градиентом и шумом, несколько эллипсов в роли животных
+    import cv2
+    import numpy as np
+
+    gradient = np.linspace(40, 160, height, dtype=np.float32)[:, None, None]
+    image = gradient + rng.normal(0, 25, (height, width, 3)).astype(np.float32)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+    for _ in range(rng.integers(0, 4)):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        axes = (int(rng.integers(width // 30, width // 8)), int(rng.integers(height // 30, height // 8)))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.ellipse(image, center, axes, float(rng.integers(0, 180)), 0, 360, color, -1)
+    return image
+
+
+def make_synthetic_folder(folder=SYNTHETIC_FOLDER, count=SYNTHETIC_COUNT, size=SYNTHETIC_SIZE, seed=SYNTHETIC_SEED):
+    # Уже созданные файлы не перезаписываются: при тех же параметрах содержимое совпадает
+    import cv2
+    import numpy as np
+
+    os.makedirs(folder, exist_ok=True)
+    file_paths = []
+    for index in range(count):
+        file_path = os.path.join(folder, f"synthetic_{index:05d}.jpg")
+        if not os.path.exists(file_path):
+            rng = np.random.default_rng([seed, index])
+            cv2.imwrite(file_path, make_synthetic_image(rng, *size), [cv2.IMWRITE_JPEG_QUALITY, 90])
+        file_paths.append(file_path)
+    return file_paths
+
+
+def peak_rss():
+    # Пиковая память процесса и самого большого из завершившихся дочерних процессов (пула) в байтах
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss в Linux - килобайты
+        return {'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+                'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale}
+    try:
+        import psutil
+    except ImportError:
+        return {'self': None, 'children': None}
+    memory = psutil.Process().memory_info()
+    return {'self': getattr(memory, 'peak_wset', memory.rss), 'children': None}
+
+
+def environment():
+    info = {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+    try:
+        import torch
+        info['torch'] = torch.__version__
+        info['cuda'] = torch.cuda.get_device_name(0) if torch.cuda.is_available() else None
+    except ImportError:
+        pass
+    try:
+        info['commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                        check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        info['commit'] = None
+    return info
+
+
+def run_predictor(predictor, file_paths, batch_size):
+    start = time.perf_counter()
+    predictions = []
+    for final_classes in predictor.predict_batches(list(batched(file_paths, batch_size))):
+        predictions.extend(final_classes)
+    return predictions, time.perf_counter() - start
+
+
+def benchmark_workers(file_paths, worker_counts, batch_size, threads_per_worker=None):
+    # Скорость классификации в зависимости от числа процессов.
+    # Результаты каждого режима сверяются с последовательным
+    from ensemble import EnsembleModel
+    from parallel import ParallelEnsemble
+
+    ensemble_model = EnsembleModel()
+    run_predictor(ensemble_model, file_paths[:batch_size], batch_size)  # прогрев
+    reference, elapsed = run_predictor(ensemble_model, file_paths, batch_size)
+    rows = [{'workers': 1, 'images_per_second': len(file_paths) / elapsed, 'identical': True}]
+
+    for workers in worker_counts:
+        if workers <= 1:
+            continue
+        pool = ParallelEnsemble(workers, threads_per_worker)
+        try:
+            # Первый прогон загружает модели во всех процессах
+            run_predictor(pool, file_paths[:batch_size * workers], batch_size)
+            predictions, elapsed = run_predictor(pool, file_paths, batch_size)
+        finally:
+            pool.close()
+        rows.append({'workers': workers, 'images_per_second': len(file_paths) / elapsed, 'identical': predictions == reference})
+    return rows
+
+
+def benchmark_cascade(samples, thresholds, batch_size, metric='margin'):
+    # Точность и скорость каскадного режима для разных порогов по сравнению с полным ансамблем
+    from ensemble import EnsembleModel
+
+    file_paths = [file_path for file_path, _ in samples]
+    labels = [label for _, label in samples]
+    ensemble_model = EnsembleModel()
+    run_predictor(ensemble_model, file_paths[:batch_size], batch_size)  # прогрев
+
+    rows = []
+    for threshold in [None] + list(thresholds):
+        ensemble_model.set_cascade(threshold, metric)
+        ensemble_model.reset_stats()
+        predictions, elapsed = run_predictor(ensemble_model, file_paths, batch_size)
+        first_stage = ensemble_model.cascade_stats['first_stage']
+        rows.append({
+            'threshold': threshold,
+            'accuracy': sum(p == label for p, label in zip(predictions, labels)) / len(labels),
+            'images_per_second': len(file_paths) / elapsed,
+            'first_stage_exit_rate': first_stage / len(file_paths) if threshold is not None else 0.0,
+        })
+    return rows
+
+
+def _isolated_entry(connection, function, args):
+    setup_logging('WARNING')
+    try:
+        result = function(*args)
+    except Exception as e:
+        result = {'error': f"{type(e).__name__}: {e}"}
+    connection.send(result)
+    connection.close()
+
+
+def run_isolated(function, *args):
+    # Каждый замер идет в новом процессе: холодный старт и пиковая память не зависят от предыдущих замеров
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_isolated_entry, args=(sender, function, args))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {'error': f"benchmark process exited with code {process.exitcode}"}
+    process.join()
+    return result
+
+
+def measure_cold_start(backend, precision):
+    # Импорт torch/ultralytics и загрузка весов с fuse() для каждой модели ансамбля
+    start = time.perf_counter()
+    from session import EnsembleSession
+    imported = time.perf_counter()
+    session = EnsembleSession(backend=backend, precision=precision, cache_path=None)
+    session.get_ensemble()
+    loaded = time.perf_counter()
+    models = [{'model': os.path.basename(model_path), 'load_seconds': stats['load_time'],
+               'weights_bytes': stats['weights_bytes']} for model_path, stats in session.registry.stats.items()]
+    session.close()
+    return {'backend': backend, 'precision': precision, 'seconds': loaded - start, 'import_seconds': imported - start,
+            'load_seconds': loaded - imported, 'models': models, 'peak_rss_bytes': peak_rss()['self']}
+
+
+def measure_model_latency(file_paths, backend, precision, batch_sizes, repeats):
+    # Время одного вызова predict каждой модели на заранее подготовленных входах, без декодирования и кэша
+    from ensemble import EnsembleModel
+
+    ensemble_model = EnsembleModel(backend=backend, precision=precision)
+    prepared = [ensemble_model.prepare_inputs(file_path) for file_path in file_paths[:max(batch_sizes)]]
+    rows = []
+    for kind, wrapper, position in (('detector', ensemble_model.od_model, 0), ('classifier', ensemble_model.clf_model, 1)):
+        for index, model_path in enumerate(wrapper.model_paths):
+            for batch_size in batch_sizes:
+                inputs = [inputs[position] for inputs in prepared[:batch_size]]
+                wrapper.run_model(index, inputs)  # прогрев
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    wrapper.run_model(index, inputs)
+                elapsed = (time.perf_counter() - start) / repeats
+                rows.append({'backend': backend, 'precision': precision, 'model': os.path.basename(model_path),
+                             'kind': kind, 'batch_size': len(inputs), 'ms_per_batch': elapsed * 1000,
+                             'ms_per_image': elapsed * 1000 / len(inputs)})
+    return rows
+
+
+def measure_pipeline(folder, backend, precision, batch_size, workers, output_mode):
+    # Полный classify_images в одном процессе (или с пулом): чтение, инференс, объединение, копирование и запись.
+    # Кэш результатов выключен, модели загружаются и прогреваются до начала замера
+    from classifier import classify_images
+    from session import EnsembleSession
+
+    session = EnsembleSession(backend=backend, precision=precision, cache_path=None)
+    predictor = session.get_pool(workers) if workers > 1 else session.get_ensemble()
+    warmup = list_images(folder, batch_size * workers)
+    for _ in predictor.predict_batches(list(batched(warmup, batch_size))):
+        pass
+
+    progress = {'done': 0}
+
+    def on_batch(results, done, total):
+        progress['done'] = done
+
+    output = tempfile.mkdtemp(prefix='oleni_benchmark_')
+    try:
+        start = time.perf_counter()
+        classify_images(folder, output, 0.5, batch_size=batch_size, session=session, on_batch=on_batch,
+                        workers=workers, output_mode=output_mode)
+        elapsed = time.perf_counter() - start
+        stages = group_stages(predictor.timer.summary())
+    finally:
+        session.close()
+        shutil.rmtree(output, ignore_errors=True)
+    rss = peak_rss()
+    return {'backend': backend, 'precision': precision, 'batch_size': batch_size, 'workers': workers,
+            'images': progress['done'], 'seconds': elapsed,
+            'images_per_second': progress['done'] / elapsed if elapsed > 0 else 0.0,
+            'peak_rss_bytes': rss['self'], 'worker_peak_rss_bytes': rss['children'] if workers > 1 else None, **stages}
+
+
+def run_suite(folder, backends, batch_sizes, worker_counts, repeats=5, output_mode='copy'):
+    # backends - список пар (среда выполнения, точность)
+    file_paths = list_images(folder)
+    results = {'environment': environment(), 'folder': folder, 'images': len(file_paths),
+               'cold_start': [], 'model_latency': [], 'pipeline': []}
+    for backend, precision in backends:
+        print(f"{backend}/{precision}: cold start")
+        results['cold_start'].append(run_isolated(measure_cold_start, backend, precision))
+        print(f"{backend}/{precision}: model latency")
+        latency = run_isolated(measure_model_latency, file_paths, backend, precision, batch_sizes, repeats)
+        results['model_latency'].extend(latency if isinstance(latency, list) else [latency])
+        for batch_size in batch_sizes:
+            for workers in worker_counts:
+                print(f"{backend}/{precision}: pipeline, batch {batch_size}, {workers} workers")
+                results['pipeline'].append(run_isolated(measure_pipeline, folder, backend, precision, batch_size,
+                                                        workers, output_mode))
+    return results
+
+
+def compare_results(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    # Строки с изменением каждой метрики и флагом регрессии (ухудшение больше tolerance)
+    rows = []
+    for section, key_fields, metric, higher_is_better in COMPARED_METRICS:
+        reference = {tuple(row.get(field) for field in key_fields): row for row in baseline.get(section, [])}
+        for row in current.get(section, []):
+            key = tuple(row.get(field) for field in key_fields)
+            base = reference.get(key)
+            if base is None or not row.get(metric) or not base.get(metric):
+                continue
+            change = row[metric] / base[metric] - 1
+            regression = -change > tolerance if higher_is_better else change > tolerance
+            rows.append({'section': section, 'key': key, 'metric': metric, 'baseline': base[metric],
+                         'current': row[metric], 'change': change, 'regression': regression})
+    return rows
+
+
+def print_comparison(rows):
+    print(f"{'section':<14}{'configuration':<44}{'metric':<20}{'baseline':>12}{'current':>12}{'change':>9}")
+    for row in rows:
+        key = '/'.join(str(value) for value in row['key'])
+        flag = '  REGRESSION' if row['regression'] else ''
+        print(f"{row['section']:<14}{key:<44}{row['metric']:<20}{row['baseline']:>12.2f}{row['current']:>12.2f}"
+              f"{row['change'] * 100:>8.1f}%{flag}")
+
+
+def print_suite(results):
+    for row in results['cold_start']:
+        if 'error' in row:
+            print(f"cold start: {row['error']}")
+            continue
+        print(f"cold start {row['backend']}/{row['precision']}: {row['seconds']:.2f} s "
+              f"(import {row['import_seconds']:.2f} s, load {row['load_seconds']:.2f} s)")
+    print(f"{'backend':<14}{'model':<32}{'batch':>6}{'ms/image':>10}")
+    for row in results['model_latency']:
+        if 'error' in row:
+            print(f"model latency: {row['error']}")
+            continue
+        print(f"{row['backend'] + '/' + row['precision']:<14}{row['model']:<32}{row['batch_size']:>6}{row['ms_per_image']:>10.1f}")
+    print(f"{'backend':<14}{'batch':>6}{'workers':>8}{'images/s':>10}{'peak MB':>9}"
+          f"{'decode':>8}{'infer':>8}{'fusion':>8}{'io':>8}")
+    for row in results['pipeline']:
+        if 'error' in row:
+            print(f"pipeline: {row['error']}")
+            continue
+        groups = row['groups']
+        peak = f"{row['peak_rss_bytes'] / 2 ** 20:.0f}" if row['peak_rss_bytes'] is not None else 'n/a'
+        print(f"{row['backend'] + '/' + row['precision']:<14}{row['batch_size']:>6}{row['workers']:>8}"
+              f"{row['images_per_second']:>10.2f}{peak:>9}{groups['decode']:>8.2f}{groups['inference']:>8.2f}"
+              f"{groups['fusion']:>8.2f}{groups['io']:>8.2f}")
+
+
+def parse_backend(value):
+    # pt, onnx/fp16, openvino/int8
+    backend, _, precision = value.partition('/')
+    return backend, precision or 'fp32'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замер скорости классификации')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    workers_parser = subparsers.add_parser('workers', help='скорость в зависимости от числа процессов')
+    workers_parser.add_argument('folder', help='папка с изображениями')
+    workers_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='число процессов')
+    workers_parser.add_argument('--threads-per-worker', type=int, default=None)
+
+    cascade_parser = subparsers.add_parser('cascade', help='точность и скорость каскадного режима')
+    cascade_parser.add_argument('folder', help='папка с подпапками Олень/Кабарга/Косуля')
+    cascade_parser.add_argument('--thresholds', type=float, nargs='+', default=[0.1, 0.2, 0.3, 0.5])
+    cascade_parser.add_argument('--metric', choices=['margin', 'entropy'], default='margin')
+
+    for subparser in (workers_parser, cascade_parser):
+        subparser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        subparser.add_argument('--limit', type=int, default=None, help='ограничить число изображений')
+
+    suite_parser = subparsers.add_parser('suite', help='холодный старт, задержка моделей и скорость classify_images')
+    suite_parser.add_argument('folder', nargs='?', default=None,
+                              help=f'папка с изображениями (по умолчанию синтетические кадры в {SYNTHETIC_FOLDER})')
+    suite_parser.add_argument('--synthetic-count', type=int, default=SYNTHETIC_COUNT)
+    suite_parser.add_argument('--backends', nargs='+', default=['pt'], help='например pt onnx/fp16 openvino/int8')
+    suite_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 16])
+    suite_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2])
+    suite_parser.add_argument('--repeats', type=int, default=5, help='повторов при замере задержки моделей')
+    suite_parser.add_argument('--output-mode', choices=['copy', 'hardlink', 'reflink', 'symlink', 'manifest'], default='copy')
+    suite_parser.add_argument('--json', default='benchmark.json', help='файл для результатов')
+    suite_parser.add_argument('--baseline', default=None, help='JSON предыдущего прогона для сравнения')
+    suite_parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='допустимое ухудшение, доля')
+
+    compare_parser = subparsers.add_parser('compare', help='сравнить два JSON-файла результатов')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.command in ('suite', 'compare'):
+        if args.command == 'suite':
+            folder = args.folder
+            if folder is None:
+                folder = SYNTHETIC_FOLDER
+                make_synthetic_folder(folder, args.synthetic_count)
+            current = run_suite(folder, [parse_backend(value) for value in args.backends], args.batch_sizes,
+                                args.workers, args.repeats, args.output_mode)
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(current, f, ensure_ascii=False, indent=2)
+            print_suite(current)
+            print(f"Results saved to {args.json}")
+            baseline_path = args.baseline
+        else:
+            with open(args.current, encoding='utf-8') as f:
+                current = json.load(f)
+            baseline_path = args.baseline
+        if baseline_path is None:
+            return 0
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare_results(current, baseline, args.tolerance)
+        print_comparison(rows)
+        return 1 if any(row['regression'] for row in rows) else 0
+
+    if args.command == 'workers':
+        file_paths = list_images(args.folder, args.limit)
+        rows = benchmark_workers(file_paths, args.workers, args.batch_size, args.threads_per_worker)
+        print(f"{'workers':>8}{'images/s':>12}{'identical':>11}")
+        for row in rows:
+            print(f"{row['workers']:>8}{row['images_per_second']:>12.2f}{str(row['identical']):>11}")
+    else:
+        samples = list_labelled_images(args.folder, args.limit)
+        rows = benchmark_cascade(samples, args.thresholds, args.batch_size, args.metric)
+        print(f"{'threshold':>10}{'accuracy':>10}{'images/s':>12}{'exit rate':>11}")
+        for row in rows:
+            threshold = 'full' if row['threshold'] is None else f"{row['threshold']:.2f}"
+            print(f"{threshold:>10}{row['accuracy']:>10.3f}{row['images_per_second']:>12.2f}{row['first_stage_exit_rate']:>11.2f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
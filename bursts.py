@@ -0,0 +1,166 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import cv2
+import numpy as np
+
+# Кадры одной серии: из одной папки, снятые с разницей не больше BURST_MAX_GAP секунд
+# и отличающиеся по dHash не больше чем на BURST_MAX_DISTANCE бит из 64
+BURST_MAX_GAP = 10
+BURST_MAX_DISTANCE = 12
+BURST_MAX_SIZE = 20
+BURST_REPRESENTATIVES = 2
+METADATA_WORKERS = 8
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_DATETIME = 306
+EXIF_IFD = 0x8769
+
+
+def exif_timestamp(file_path):
+    # Время съемки из EXIF, без него - время изменения файла
+    try:
+        from PIL import Image
+        with Image.open(file_path) as image:
+            exif = image.getexif()
+            value = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+        if value:
+            return datetime.strptime(str(value).strip('\x00 '), '%Y:%m:%d %H:%M:%S').timestamp()
+    except (ImportError, OSError, ValueError):
+        pass
+    return os.path.getmtime(file_path)
+
+
+def dhash(file_path, size=8):
+    # Разностный хэш: уменьшенное в 8 раз при декодировании серое изображение, сравнение соседних пикселей
+    data = np.fromfile(file_path, dtype=np.uint8)
+    image = cv2.imdecode(data, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        return None
+    small = cv2.resize(image, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def frame_metadata(file_path):
+    return exif_timestamp(file_path), dhash(file_path)
+
+
+def hamming(first, second):
+    return bin(first ^ second).count('1')
+
+
+def group_bursts(file_paths, max_gap=BURST_MAX_GAP, max_distance=BURST_MAX_DISTANCE, max_size=BURST_MAX_SIZE,
+                 workers=METADATA_WORKERS):
+    # Разбивает кадры на серии срабатываний фотоловушки. Возвращает списки путей,
+    # внутри серии - по времени съемки. Кадр без хэша (не декодируется) образует отдельную серию
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        metadata = dict(zip(file_paths, executor.map(frame_metadata, file_paths)))
+    ordered = sorted(file_paths, key=lambda path: (os.path.dirname(path), metadata[path][0], path))
+
+    bursts = []
+    previous = None
+    for file_path in ordered:
+        timestamp, frame_hash = metadata[file_path]
+        if (previous is not None and os.path.dirname(previous) == os.path.dirname(file_path)
+                and len(bursts[-1]) < max_size and timestamp - metadata[previous][0] <= max_gap
+                and frame_hash is not None and metadata[previous][1] is not None
+                and hamming(frame_hash, metadata[previous][1]) <= max_distance):
+            bursts[-1].append(file_path)
+        else:
+            bursts.append([file_path])
+        previous = file_path
+    return bursts
+
+
+def representatives(burst, count=BURST_REPRESENTATIVES):
+    # Кадры из середины count равных частей серии
+    if len(burst) <= count:
+        return list(burst)
+    return [burst[int((index + 0.5) * len(burst) / count)] for index in range(count)]
+
+
+def pack_bursts(bursts, batch_size):
+    # Батчи из целых серий: серия не разрезается между батчами, длинная серия идет отдельным батчом
+    batches, current = [], []
+    for burst in bursts:
+        if current and len(current) + len(burst) > batch_size:
+            batches.append(current)
+            current = []
+        current.extend(burst)
+    if current:
+        batches.append(current)
+    return batches
+
+
+class BurstClassifier:
+    # Режим серий поверх любого предсказателя с predict_batches, predict_batch и last_scores
+    # (EnsembleModel, ParallelEnsemble, RemoteEnsemble). Ансамбль запускается на представительных кадрах серии; если их классы совпали,
+    # класс переносится на остальные кадры, иначе остальные кадры классифицируются по отдельности.
+    # В оценки каждого кадра добавляется 'event' - первый кадр серии, у перенесенных - 'propagated_from'
+    def __init__(self, predictor, bursts, count=BURST_REPRESENTATIVES):
+        self.predictor = predictor
+        self.count = count
+        self.bursts = {burst[0]: burst for burst in bursts}
+        self.event_of = {file_path: burst[0] for burst in bursts for file_path in burst}
+        self.last_scores = []
+
+    def predict(self, file_paths):
+        predictions = self.predictor.predict_batch(file_paths)
+        return {file_path: (prediction, scores)
+                for file_path, prediction, scores in zip(file_paths, predictions, self.predictor.last_scores)}
+
+    def samples(self, file_paths):
+        # Серии батча по порядку и их представительные кадры
+        events = list(dict.fromkeys(self.event_of[file_path] for file_path in file_paths))
+        return events, {event: representatives(self.bursts[event], self.count) for event in events}
+
+    def predict_batch(self, file_paths):
+        return next(self.predict_batches([file_paths]))
+
+    def predict_batches(self, batches):
+        # Представительные кадры идут через predict_batches предсказателя, поэтому пул процессов
+        # держит в работе несколько батчей сразу. Кадры серий с расхождением досчитываются отдельным вызовом
+        pending = deque()
+
+        def sample_batches():
+            for file_paths in batches:
+                events, samples = self.samples(file_paths)
+                pending.append((file_paths, events, samples))
+                yield [file_path for event in events for file_path in samples[event]]
+
+        predictions = self.predictor.predict_batches(sample_batches())
+        try:
+            for batch_predictions in predictions:
+                file_paths, events, samples = pending.popleft()
+                sample_paths = [file_path for event in events for file_path in samples[event]]
+                results = {file_path: (prediction, scores) for file_path, prediction, scores
+                           in zip(sample_paths, batch_predictions, self.predictor.last_scores)}
+                yield self.spread(file_paths, events, samples, results)
+        finally:
+            predictions.close()
+
+    def spread(self, file_paths, events, samples, results):
+        # Переносит классы представительных кадров на остальные кадры серий
+        remaining = []
+        for event in events:
+            classes = {results[file_path][0] for file_path in samples[event]}
+            others = [file_path for file_path in self.bursts[event] if file_path not in results]
+            # Нечитаемый представительный кадр (None) не дает класса серии, остальные кадры классифицируются отдельно
+            if len(classes) > 1 or None in classes:
+                remaining.extend(others)
+                continue
+            # Оценки переносятся от самого уверенного представительного кадра
+            source = max(samples[event],
+                         key=lambda file_path: (results[file_path][1].get('uncertainty') or {}).get('confidence', 0.0))
+            for file_path in others:
+                results[file_path] = (results[source][0], dict(results[source][1], propagated_from=source))
+        if remaining:
+            results.update(self.predict(remaining))
+
+        self.predictor.timer.count('bursts', len(events))
+        self.predictor.timer.count('burst_frames', len(file_paths))
+        self.predictor.timer.count('burst_propagated', sum('propagated_from' in (results[path][1] or {}) for path in file_paths))
+        self.last_scores = [None if results[file_path][1] is None else dict(results[file_path][1], event=self.event_of[file_path])
+                            for file_path in file_paths]
+        return [results[file_path][0] for file_path in file_paths]
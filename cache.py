@@ -0,0 +1,128 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.oleni_minpriroda', 'results_cache.sqlite')
+DEFAULT_MAX_ENTRIES = 500_000
+
+
+def file_hash(file_path, chunk_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def bytes_hash(data):
+    # Тот же ключ, что и file_hash, для уже прочитанного содержимого файла
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+class ResultCache:
+    # Кэш сырых выходов моделей на диске. Ключ - хэш содержимого файла и fingerprint конфигурации
+    # (веса, среда выполнения, точность). Записи других конфигураций хранятся, чтобы при смене backend
+    # или компьютера не считать файлы заново; записи устаревших весов не читаются и уходят по LRU
+    def __init__(self, path, fingerprint, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Соединение используется из потока классификации и из GUI, поэтому защищено блокировкой
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "content_hash TEXT NOT NULL, fingerprint TEXT NOT NULL, raw BLOB NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL, PRIMARY KEY (content_hash, fingerprint))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+        self.connection.commit()
+        self.evict()
+
+    def file_key(self, file_path):
+        return file_hash(file_path)
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.connection.execute(
+                    f"SELECT content_hash, raw FROM results WHERE fingerprint = ? AND content_hash IN ({placeholders})",
+                    [self.fingerprint, *chunk],
+                ).fetchall()
+                found.update((content_hash, pickle.loads(raw)) for content_hash, raw in rows)
+            if found:
+                self.connection.executemany(
+                    "UPDATE results SET last_access = ? WHERE fingerprint = ? AND content_hash = ?",
+                    [(time.time(), self.fingerprint, key) for key in found],
+                )
+                self.connection.commit()
+        self.hits += len(found)
+        self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, items):
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, raw in items.items():
+            data = pickle.dumps(raw, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((key, self.fingerprint, data, len(data), now))
+        with self._lock:
+            self.connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", rows)
+            self.connection.commit()
+
+    def evict(self):
+        # Вызывается при открытии и в конце запуска, а не на каждый батч.
+        # Удаляются самые давно использованные записи любых конфигураций сверх лимитов
+        with self._lock:
+            if self.max_entries is not None:
+                self.connection.execute(
+                    "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            if self.max_bytes is not None:
+                total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+                while total > self.max_bytes:
+                    rows = self.connection.execute("SELECT rowid, size FROM results ORDER BY last_access LIMIT 1000").fetchall()
+                    if not rows:
+                        break
+                    removed = []
+                    for rowid, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        removed.append((rowid,))
+                        total -= size
+                    self.connection.executemany("DELETE FROM results WHERE rowid = ?", removed)
+            self.connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self.connection.execute("DELETE FROM results")
+            self.connection.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': size}
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self.connection.close()
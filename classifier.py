@@ -1,51 +1,240 @@
+import logging
 import os
-import shutil
-from ensemble import EnsembleModel
-import pandas as pd
+import time
+from collections import Counter, deque
+from session import get_default_session
+from bursts import BurstClassifier, group_bursts, pack_bursts
+from output import FilePlacer, flat_name
+from review import DEFAULT_REVIEW_METRIC, DEFAULT_REVIEW_THRESHOLD, needs_review
+from scanner import prefetch_batches, scan_images
+from writer import ResultWriter
 
+DEFAULT_BATCH_SIZE = 16
+CLASS_FOLDERS = ['Олень', 'Кабарга', 'Косуля', 'Низкая уверенность']
+EMPTY_FOLDER = 'Нет животных'
+DEFAULT_PREFILTER_CONFIDENCE = 0.25
 
+logger = logging.getLogger(__name__)
 
-def classify_images(current_folder, classified_folder_path, confidence_threshold):
+
+def class_folders(classified_folder_path, with_empty=False):
+    folders = CLASS_FOLDERS + [EMPTY_FOLDER] if with_empty else CLASS_FOLDERS
+    return [os.path.join(classified_folder_path, folder) for folder in folders]
+
+
+def batched(items, batch_size):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def classify_images(current_folder, classified_folder_path, confidence_threshold, batch_size=DEFAULT_BATCH_SIZE, session=None,
+                    on_batch=None, should_stop=None, workers=1, threads_per_worker=None, cascade_threshold=None,
+                    prefilter_confidence=None, crop_classify=False, details_format='csv', resume=False,
+                    output_mode='copy', io_workers=4, recursive=True, review_threshold=DEFAULT_REVIEW_THRESHOLD,
+                    review_metric=DEFAULT_REVIEW_METRIC, bursts=False, on_report=None):
+    # on_batch(results, done, total) вызывается после каждого батча,
+    # should_stop() проверяется между батчами и позволяет прервать обработку.
+    # При workers > 1 батчи обрабатываются пулом процессов, каждый со своей копией ансамбля.
+    # cascade_threshold включает каскадный режим: тяжелые классификаторы запускаются только для неуверенных кадров.
+    # prefilter_confidence включает предфильтр: кадры без животных сразу попадают в папку 'Нет животных'.
+    # crop_classify - классификаторы получают вырезанных детектором животных, в animals.csv пишется каждое животное.
+    # Результаты дописываются в папку classified_folder_path после каждого батча (см. ResultWriter),
+    # resume=True пропускает изображения, уже записанные в result.csv прерванным запуском.
+    # recursive - искать изображения во вложенных папках, файлы отбираются по сигнатуре формата.
+    # output_mode - как файлы попадают в папки классов: copy, hardlink, reflink, symlink или manifest (см. FilePlacer)
+    # Кадры, у которых оценка review_metric ниже review_threshold, попадают в 'Низкая уверенность';
+    # в result.csv для них пишется предсказанный класс. None - ручная проверка выключена.
+    # bursts - режим серий: кадры одного срабатывания классифицируются по нескольким представительным кадрам
+    # (см. BurstClassifier), в events.csv пишется класс каждой серии. С crop_classify не используется.
+    # on_report(text) получает итоговый отчет: способы размещения файлов, кэш и каскад сессии, время этапов
     deer_path = os.path.join(classified_folder_path, 'Олень')
     musk_deer_path = os.path.join(classified_folder_path, 'Кабарга')
     roe_deer_path = os.path.join(classified_folder_path, 'Косуля')
     uncertain_path = os.path.join(classified_folder_path, 'Низкая уверенность')
+    empty_path = os.path.join(classified_folder_path, EMPTY_FOLDER)
+    with_empty = prefilter_confidence is not None or crop_classify
+    bursts = bursts and not crop_classify
 
-    ensemble_model = EnsembleModel(alpha=0.5, confidence=confidence_threshold)
-    data = []
+    if session is None:
+        session = get_default_session()
+
+    writer = None
+    placer = None
     try:
-        for path in [classified_folder_path, deer_path, musk_deer_path, roe_deer_path, uncertain_path]:
+        session.set_cascade(cascade_threshold)
+        session.set_prefilter(prefilter_confidence)
+        if workers > 1:
+            ensemble_model = session.get_pool(workers, threads_per_worker, alpha=0.5, confidence=confidence_threshold)
+        else:
+            ensemble_model = session.get_ensemble(alpha=0.5, confidence=confidence_threshold)
+        ensemble_model.reset_stats()
+
+        for path in [classified_folder_path] + class_folders(classified_folder_path, with_empty):
             if not os.path.exists(path):
                 os.makedirs(path)
+        writer = ResultWriter(classified_folder_path, details_format, resume, with_animals=crop_classify, with_events=bursts)
 
-        for file_name in os.listdir(current_folder):
-            file_path = os.path.join(current_folder, file_name)
-            if not os.path.exists(file_path):
-                print(f"File not found: {file_path}")
+        file_names = []
+        # Папка результатов может лежать внутри исходной (<папка>/classified): копии прошлых запусков не классифицируются
+        for file_path in scan_images(current_folder, recursive, exclude=[classified_folder_path]):
+            # Для вложенных папок станций и дат имя - путь относительно исходной папки
+            file_name = os.path.relpath(file_path, current_folder)
+            if file_name in writer.done:
                 continue
+            file_names.append(file_name)
+        skipped = len(writer.done)
+        if skipped:
+            logger.info("Resuming: %d images already classified", skipped)
+        done = 0
+        animal_counts = Counter()
+        event_counts = Counter()
+        pending = deque()
+        placer = FilePlacer(classified_folder_path, output_mode, io_workers, resume)
+
+        def finish_batch(futures, rows, animal_rows, review_rows, event_rows, batch_results, skipped):
+            # Батч записывается в result.csv только после того, как его файлы размещены.
+            # Пропущенные нечитаемые файлы в result.csv не попадают, но считаются обработанными для прогресса
+            with ensemble_model.timer.stage('copy'):
+                for future in futures:
+                    future.result()
+            with ensemble_model.timer.stage('write'):
+                writer.write(rows, animal_rows, review_rows, event_rows)
+            ensemble_model.timer.count('files_placed', len(rows))
+            ensemble_model.timer.count('rows_written', len(rows))
+            logger.info("Batch classified", extra={'fields': {'done': done + len(rows) + skipped,
+                                                             'total': len(file_names)}})
+            if on_batch is not None:
+                on_batch(batch_results, done + len(rows) + skipped, len(file_names))
+            return len(rows) + skipped
+
+        model_names = {0: 'Олень', 1: 'Кабарга', 2: 'Косуля', 3: EMPTY_FOLDER}
+        for_csv = {'Кабарга': 0, 'Косуля': 1, 'Олень': 2, EMPTY_FOLDER: 3}
+
+        path_batches = [[os.path.join(current_folder, file_name) for file_name in batch]
+                        for batch in batched(file_names, batch_size)]
+        predictor = ensemble_model
+        if bursts:
+            # Батчи собираются из целых серий, чтобы серия записывалась в результаты целиком
+            with ensemble_model.timer.stage('bursts'):
+                burst_list = group_bursts([os.path.join(current_folder, file_name) for file_name in file_names])
+            path_batches = pack_bursts(burst_list, batch_size)
+            predictor = BurstClassifier(ensemble_model, burst_list)
+        name_batches = [[os.path.relpath(file_path, current_folder) for file_path in batch] for batch in path_batches]
+
+        # Процессы пула и сервер читают файлы сами, для одного процесса чтение идет в фоновых потоках.
+        # В режиме серий большинство кадров не декодируется, поэтому они заранее не читаются
+        if workers > 1 or session.server_url is not None or bursts:
+            image_batches = path_batches
+        else:
+            image_batches = prefetch_batches(path_batches, with_key=ensemble_model.cache is not None)
+        if crop_classify:
+            predictions = predictor.predict_crops_batches(image_batches)
+        else:
+            predictions = predictor.predict_batches(image_batches)
+
+        for batch, file_paths in zip(name_batches, path_batches):
+            if should_stop is not None and should_stop():
+                logger.info("Classification cancelled")
+                predictions.close()
+                break
+
+            start = time.perf_counter()
+            batch_predictions = next(predictions)
+            seconds = (time.perf_counter() - start) / len(batch)
+
+            batch_results = []
+            rows, animal_rows, review_rows = [], [], []
+            events = {}
+            skipped = 0
+            for file_name, file_path, prediction, scores in zip(batch, file_paths, batch_predictions,
+                                                                predictor.last_scores):
+                if prediction is None:
+                    # Нечитаемый файл, ансамбль его пропустил (см. EnsembleModel.skip_unreadable)
+                    skipped += 1
+                    continue
+                if crop_classify:
+                    final_class, animals = prediction['final_class'], prediction['animals']
+                else:
+                    final_class, animals = prediction, []
+                # Построчный вывод в консоль Windows заметно замедлял обработку, поэтому только на уровне DEBUG
+                logger.debug("%s: %s", file_path, model_names[final_class])
+
+                for animal in animals:
+                    x1, y1, x2, y2 = animal['box']
+                    animal_rows.append({'img_name': file_name, 'class': for_csv[model_names[animal['class']]],
+                                        'confidence': animal['confidence'], 'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2})
+                    animal_counts[for_csv[model_names[animal['class']]]] += 1
+
+                if final_class == 0:
+                    dest_path = deer_path
+                elif final_class == 1:
+                    dest_path = musk_deer_path
+                elif final_class == 2:
+                    dest_path = roe_deer_path
+                elif final_class == 3:
+                    dest_path = empty_path
+                else:
+                    dest_path = uncertain_path
+
+                # Файлы из разных папок станций не должны перезаписывать друг друга в папке класса
+                dest_name = flat_name(file_name)
+                if 'event' in scores:
+                    scores = dict(scores, event=os.path.relpath(scores['event'], current_folder))
+                    if 'propagated_from' in scores:
+                        scores['propagated_from'] = os.path.relpath(scores['propagated_from'], current_folder)
+                    events.setdefault(scores['event'], []).append((final_class, 'propagated_from' not in scores))
+                uncertainty = scores['uncertainty'] if final_class != 3 else None
+                if uncertainty is not None:
+                    review_rows.append({'img_name': file_name, 'dest_name': dest_name,
+                                        'class_folder': model_names[final_class], **uncertainty})
+                    if needs_review(uncertainty, review_threshold, review_metric):
+                        dest_path = uncertain_path
+                        ensemble_model.timer.count('review')
+                rows.append({'img_name': file_name, 'file_path': file_path, 'class': for_csv[model_names[final_class]],
+                             'dest_path': dest_path, 'seconds': round(seconds, 4), 'probs': scores})
+                batch_results.append({'img_name': file_name, 'file_path': file_path, 'dest_path': dest_path,
+                                      'dest_name': dest_name, 'animals': animals})
 
-            print(file_path)
-            final_class = ensemble_model.predict(file_path)
-            model_names = {0: 'Олень', 1: 'Кабарга', 2: 'Косуля'}
-            for_csv = {'Кабарга': 0, 'Косуля': 1, 'Олень': 2}
-            print(f"Final Prediction: {model_names[final_class]}")
+            # Класс серии - самый частый класс ее кадров
+            event_rows = []
+            for event, frames in events.items():
+                event_class = Counter(final_class for final_class, _ in frames).most_common(1)[0][0]
+                event_rows.append({'event': event, 'frames': len(frames), 'inferred': sum(inferred for _, inferred in frames),
+                                   'class': for_csv[model_names[event_class]]})
+                event_counts[model_names[event_class]] += 1
 
-            data.append({'img_name': file_name, 'class':for_csv[model_names[final_class]]})
+            # Файлы раскладываются в фоне, пока модели обрабатывают следующий батч
+            futures = placer.submit([result['file_path'] for result in batch_results],
+                                    [result['dest_path'] for result in batch_results],
+                                    [result['dest_name'] for result in batch_results])
+            pending.append((futures, rows, animal_rows, review_rows, event_rows, batch_results, skipped))
+            while len(pending) > 1:
+                done += finish_batch(*pending.popleft())
 
-            if final_class == 0:
-                shutil.copy(file_path, deer_path)
-            elif final_class == 1:
-                shutil.copy(file_path, musk_deer_path)
-            elif final_class == 2:
-                shutil.copy(file_path, roe_deer_path)
-            else:
-                shutil.copy(file_path, uncertain_path)
+        while pending:
+            done += finish_batch(*pending.popleft())
 
-        df = pd.DataFrame(data, columns=['img_name', 'class'])
+        if crop_classify:
+            logger.info("Animals per class: %s", dict(animal_counts))
+        if bursts:
+            logger.info("Events per class: %s", dict(event_counts))
 
-        df.to_csv('result.csv', index=False)
+        session.evict_cache()
+        session_report = session.report(ensemble_model)
+        report = "\n".join([placer.report()] + (["Session:", session_report] if session_report else [])
+                           + ["Stages:", ensemble_model.timer.report()])
+        logger.info("%s", report)
+        if on_report is not None:
+            on_report(report)
 
-    except Exception as e:
-        print(f"Error during classification: {e}")
+    except Exception:
+        # Ошибка передается вызывающему коду: CLI завершается с ненулевым кодом, GUI показывает сообщение.
+        # Записанное до ошибки сохраняется в result.csv и продолжается с resume=True
+        logger.exception("Error during classification")
+        raise
     finally:
-        return [deer_path, musk_deer_path, roe_deer_path, uncertain_path]
+        if placer is not None:
+            placer.close()
+        if writer is not None:
+            writer.close()
+    return class_folders(classified_folder_path, with_empty)
@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+from runtime import DEVICES
+
+# Модули с torch, ultralytics и Qt импортируются только после разбора аргументов,
+# поэтому --help и ошибки в параметрах выводятся сразу
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Классификация фотоловушек без графического интерфейса')
+    parser.add_argument('folder', help='папка с изображениями')
+    parser.add_argument('--output', help='папка для результатов (по умолчанию <folder>/classified)')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=1, help='число процессов с копией ансамбля')
+    parser.add_argument('--threads-per-worker', type=int, default=None)
+    parser.add_argument('--backend', choices=['pt', 'onnx', 'openvino'], default='pt')
+    parser.add_argument('--precision', choices=['fp32', 'fp16', 'int8'], default='fp32')
+    parser.add_argument('--device', default='auto',
+                        help='auto, cpu, cuda, mps или номер GPU, например 0 (auto: CUDA, затем MPS, затем процессор)')
+    parser.add_argument('--dtype', choices=['auto', 'fp32', 'fp16', 'bf16'], default='auto',
+                        help='точность вычислений моделей .pt (auto: fp16 на GPU, fp32 на процессоре)')
+    parser.add_argument('--no-channels-last', action='store_true', help='не переводить модели в формат channels_last')
+    parser.add_argument('--compile', action='store_true', help='torch.compile с кэшем в weights/compile_cache')
+    parser.add_argument('--threshold', type=float, default=0.7, help='порог уверенности рамок детекторов')
+    parser.add_argument('--review-threshold', type=float, default=0.5,
+                        help='кадры с оценкой ниже порога идут в папку "Низкая уверенность"')
+    parser.add_argument('--review-metric', choices=['confidence', 'max_prob', 'margin', 'agreement'], default='confidence')
+    parser.add_argument('--no-review', action='store_true', help='не отбирать кадры для ручной проверки')
+    parser.add_argument('--cascade-threshold', type=float, default=None, help='включить каскадный режим')
+    parser.add_argument('--prefilter', type=float, default=None, metavar='CONFIDENCE', help='отсеивать кадры без животных')
+    parser.add_argument('--crops', action='store_true', help='классифицировать каждое найденное животное')
+    parser.add_argument('--bursts', action='store_true',
+                        help='классифицировать серию кадров одного срабатывания по представительным кадрам')
+    parser.add_argument('--output-mode', choices=['copy', 'hardlink', 'reflink', 'symlink', 'manifest'], default='copy')
+    parser.add_argument('--details-format', choices=['csv', 'sqlite', 'parquet'], default='csv')
+    parser.add_argument('--resume', action='store_true', help='продолжить прерванный запуск')
+    parser.add_argument('--no-recursive', action='store_true', help='не заходить во вложенные папки')
+    parser.add_argument('--no-cache', action='store_true', help='не использовать кэш результатов моделей')
+    parser.add_argument('--server', metavar='URL', help='использовать сервер классификации, например http://127.0.0.1:8765')
+    parser.add_argument('--upload', action='store_true', help='передавать файлы серверу, а не пути к ним')
+    parser.add_argument('--report', choices=['text', 'json'], default='text', help='формат итогового отчета')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='WARNING',
+                        help='DEBUG выводит класс каждого изображения')
+    parser.add_argument('--log-format', choices=['text', 'json'], default='text')
+    parser.add_argument('--metrics', metavar='FILE', help='сохранить счетчики и время этапов в формате Prometheus')
+    parser.add_argument('--profile', metavar='FILE', help='профиль cProfile для python -m pstats или snakeviz')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.folder):
+        parser.error(f"folder not found: {args.folder}")
+    if args.bursts and args.crops:
+        parser.error("--bursts cannot be combined with --crops")
+    if args.device not in DEVICES and not args.device.isdigit():
+        parser.error(f"--device must be auto, cpu, cuda, mps or a GPU index, got {args.device}")
+    if args.batch_size < 1 or args.workers < 1:
+        parser.error("--batch-size and --workers must be positive")
+    for name in ('threshold', 'review_threshold', 'cascade_threshold', 'prefilter'):
+        value = getattr(args, name)
+        if value is not None and not 0 <= value <= 1:
+            parser.error(f"--{name.replace('_', '-')} must be between 0 and 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from telemetry import profiled, setup_logging
+    setup_logging(args.log_level, args.log_format == 'json')
+    device = args.device
+    if device.isdigit():
+        # Номер GPU задается видимостью до импорта torch, процессы пула наследуют переменную
+        os.environ['CUDA_VISIBLE_DEVICES'] = device
+        device = 'cuda'
+
+    from classifier import classify_images
+    from session import EnsembleSession
+
+    output = args.output or os.path.join(args.folder, 'classified')
+    runtime = {'device': device, 'dtype': args.dtype, 'channels_last': not args.no_channels_last, 'compile': args.compile}
+    session = EnsembleSession(confidence=args.threshold, backend=args.backend, precision=args.precision,
+                              server_url=args.server, upload=args.upload, runtime=runtime,
+                              **({'cache_path': None} if args.no_cache else {}))
+    progress = {'done': 0, 'total': 0}
+    # Итоговый отчет печатается независимо от --log-level
+    reports = []
+
+    def on_batch(results, done, total):
+        progress.update(done=done, total=total)
+
+    start = time.perf_counter()
+    failed = False
+    try:
+        with profiled(args.profile):
+            try:
+                classify_images(
+                    args.folder, output, args.threshold, batch_size=args.batch_size, session=session, on_batch=on_batch,
+                    workers=args.workers, threads_per_worker=args.threads_per_worker,
+                    cascade_threshold=args.cascade_threshold, prefilter_confidence=args.prefilter,
+                    crop_classify=args.crops, details_format=args.details_format, resume=args.resume,
+                    output_mode=args.output_mode, recursive=not args.no_recursive,
+                    review_threshold=None if args.no_review else args.review_threshold,
+                    review_metric=args.review_metric, bursts=args.bursts, on_report=reports.append,
+                )
+            except Exception:
+                # Подробности уже в логе; обработанное до ошибки продолжается с --resume
+                failed = True
+        elapsed = time.perf_counter() - start
+        predictor = session.pool if args.workers > 1 and args.server is None else session.ensemble
+        if args.metrics and predictor is not None:
+            with open(args.metrics, 'w', encoding='utf-8') as f:
+                f.write(predictor.timer.prometheus())
+        summary = {
+            'images': progress['done'],
+            'seconds': elapsed,
+            'images_per_second': progress['done'] / elapsed if elapsed > 0 else 0.0,
+            'stages': predictor.timer.summary() if predictor is not None else {},
+            'counters': dict(predictor.timer.counters) if predictor is not None else {},
+            'output': output,
+            'failed': failed,
+        }
+    finally:
+        session.close()
+
+    if args.report == 'json':
+        print(json.dumps(summary, ensure_ascii=False))
+    else:
+        print(f"Classified {summary['images']} images in {summary['seconds']:.1f} s "
+              f"({summary['images_per_second']:.2f} images/s), results in {output}")
+        for report in reports:
+            print(report)
+    if failed:
+        print(f"Classification failed after {summary['images']} images, see the log above", file=sys.stderr)
+        return 1
+    return 0 if predictor is not None and progress['done'] == progress['total'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
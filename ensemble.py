@@ -1,79 +1,323 @@
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
 import numpy as np
 from collections import Counter
 from ultralytics import YOLO
+from preprocessing import LoadedImage, load_image, letterbox, resize_short_side, unletterbox_boxes, crop_box
+from scanner import read_image
+from timing import StageTimer
+from runtime import configure_threads, inference_mode, predict_args, prepare_model, resolve_runtime
+from fusion import FUSION_RULES, detection_probs, fuse_models, stack_probs, temperature_scale, uncertainty_scores
 
+DETECTION_WEIGHTS = ["weights/yolov8s_640_10ep_16b.pt", "weights/yolov8m_640_30ep_16b.pt"]
+CLASSIFIER_WEIGHTS = ["weights/yolov8m-cls-50ep-16b.pt", "weights/yolov8x-cls-30ep-16b.pt", "weights/yolov8x-cls_640_10ep.pt"]
 
-def detect_objects_and_get_probs(detection_model, image, confidence=0.7):
+DETECTION_IMGSZ = 640
+DEFAULT_CLASSIFIER_IMGSZ = 224
+DETECTION_CONFIDENCE = 0.7
+# Версия формата сырых выходов в кэше
+RAW_FORMAT_VERSION = 2
+
+logger = logging.getLogger(__name__)
+
+# Каскадный режим: сначала самые легкие модели (yolov8s и yolov8m-cls),
+# остальные запускаются только для неуверенных кадров
+CASCADE_FIRST_STAGE = {'detectors': [0], 'classifiers': [0]}
+CASCADE_METRICS = ('margin', 'entropy')
+
+# Режим вырезания животных: рамки берутся от yolov8m и расширяются на 10 % перед классификацией
+CROP_DETECTOR = 1
+CROP_MARGIN = 0.1
+
+# Предфильтр пустых кадров: если yolov8s не нашел ни одной рамки, остальные модели не запускаются
+PREFILTER_DETECTOR = 0
+EMPTY_CLASS = 3
+
+# pt - чекпойнты PyTorch, onnx и openvino - модели, выгруженные export.py
+BACKENDS = ('pt', 'onnx', 'openvino')
+PRECISIONS = ('fp32', 'fp16', 'int8')
+EXPORT_MANIFEST = "weights/export_manifest.json"
+
+
+def exported_weights_path(model_path, backend='pt', precision='fp32'):
+    if backend == 'pt':
+        return model_path
+    stem = os.path.splitext(model_path)[0]
+    if precision != 'fp32':
+        stem = f"{stem}-{precision}"
+    if backend == 'onnx':
+        return stem + '.onnx'
+    if backend == 'openvino':
+        # ultralytics определяет формат OpenVINO по суффиксу папки
+        return stem + '_openvino_model'
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def load_export_manifest():
+    if not os.path.exists(EXPORT_MANIFEST):
+        return {}
+    with open(EXPORT_MANIFEST, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def model_imgsz(model, model_path, default):
+    # Размер входа, с которым обучалась модель, хранится в аргументах чекпойнта,
+    # а для выгруженных моделей - в манифесте, который пишет export.py
+    imgsz = model.overrides.get('imgsz')
+    if imgsz is None:
+        imgsz = load_export_manifest().get(model_path, {}).get('imgsz', default)
+    if isinstance(imgsz, (list, tuple)):
+        imgsz = imgsz[0]
+    return int(imgsz)
+
+
+def load_yolo(model_path, task):
+    start = time.perf_counter()
+    model = YOLO(model_path, task=task, verbose=False)
+    # fuse() доступен только для моделей PyTorch
+    if model_path.endswith('.pt'):
+        model.fuse()
+    logger.info("Loaded %s", os.path.basename(model_path),
+                extra={'fields': {'task': task, 'seconds': round(time.perf_counter() - start, 3)}})
+    return model
+
+
+def result_boxes(result):
+    # Сырые результаты детекции: массив (число рамок, 6) - уверенность, класс и xyxy в координатах letterbox
+    boxes = result.boxes
+    return np.concatenate([boxes.conf.cpu().numpy()[:, None], boxes.cls.cpu().numpy()[:, None], boxes.xyxy.cpu().numpy()],
+                          axis=1).astype(np.float32)
+
+
+def boxes_to_probs(boxes, num_classes, confidence=DETECTION_CONFIDENCE):
+    # Усредняем по всем обнаруженным объектам выше порога вектора, где у класса объекта стоит его уверенность
+    probs, _ = detection_probs([[boxes]], 1, num_classes, confidence)
+    return probs[0, 0]
+
+
+def detection_result_to_probs(result, num_classes, confidence=DETECTION_CONFIDENCE):
+    return boxes_to_probs(result_boxes(result), num_classes, confidence)
+
+
+def detect_objects_and_get_probs(detection_model, image, confidence=DETECTION_CONFIDENCE):
     detections = detection_model.predict(image)
-    class_probs = []
-
-    for conf, cls in zip(detections[0].boxes.conf.cpu(), detections[0].boxes.cls.cpu()):
-        if conf > confidence:
-            # Создаем массив вероятностей для каждого класса
-            prob = np.zeros(len(detection_model.names))
-            prob[int(cls)] = conf
-            class_probs.append(prob)
-
-    # Усредняем вероятности классов для всех обнаруженных объектов
-    if class_probs:
-        avg_class_probs = np.mean(class_probs, axis=0)
-    else:
-        avg_class_probs = np.zeros(len(detection_model.names))
+    return detection_result_to_probs(detections[0], len(detection_model.names), confidence)
+
+
+def subset(indices, images, prepared, raws, keys):
+    # Часть батча: записи raws общие с исходным списком и дополняются на месте
+    return ([images[index] for index in indices],
+            {position: prepared[index] for position, index in enumerate(indices) if index in prepared},
+            [raws[index] for index in indices],
+            [keys[index] for index in indices])
+
+
+def format_cascade_report(cascade_stats):
+    total = cascade_stats['first_stage'] + cascade_stats['full']
+    if not total:
+        return ""
+    return (f"cascade: {cascade_stats['first_stage'] / total * 100:.1f} % exited after first stage, "
+            f"{cascade_stats['full'] / total * 100:.1f} % ran the full ensemble")
 
-    return avg_class_probs
+
+def format_prefilter_report(prefilter_stats):
+    if not prefilter_stats['frames']:
+        return ""
+    # Экономия оценивается по среднему времени полного инференса на кадр с животными
+    per_frame = prefilter_stats['inference_time'] / prefilter_stats['inferred'] if prefilter_stats['inferred'] else 0.0
+    return (f"prefilter: {prefilter_stats['empty']}/{prefilter_stats['frames']} empty frames skipped, "
+            f"~{prefilter_stats['empty'] * per_frame:.1f} s saved")
 
 
 class ObjectDetectionModel:
-    def __init__(self, model_paths, confidence):
-        self.models = [self.load_model(path) for path in model_paths]
+    # runtime - настройки инференса (runtime.resolve_runtime), None - значения ultralytics по умолчанию
+    def __init__(self, model_paths, confidence, registry=None, runtime=None):
+        self.registry = registry
+        self.runtime = runtime
+        self.model_paths = model_paths
+        self.models = [self.get_model(path) for path in model_paths]
         self.confidence = confidence
+        self.imgsz = DETECTION_IMGSZ
+
+    def get_model(self, model_path):
+        # Если передан реестр, веса загружаются один раз и переиспользуются между запусками
+        if self.registry is None:
+            return self.load_model(model_path)
+        return self.registry.get(model_path, self.load_model)
 
     def load_model(self, model_path):
-        model = YOLO(model_path, verbose=False)
-        model.fuse()
-        return model
+        model = load_yolo(model_path, 'detect')
+        return prepare_model(model, self.runtime) if self.runtime is not None else model
 
     def detect(self, image):
-        all_class_probs = []
-        for model in self.models:
-            class_probs = detect_objects_and_get_probs(model, image)
-            all_class_probs.append(class_probs)
-        # Усредняем вероятности классов для всех моделей
-        avg_class_probs = np.mean(all_class_probs, axis=0)
-        return avg_class_probs
+        return self.detect_batch([image])[0]
+
+    @property
+    def num_classes(self):
+        return len(self.models[0].names)
+
+    def detect_batch(self, images):
+        return self.probs_from_raw(self.detect_raw_batch(images))
+
+    def detect_raw_batch(self, images):
+        # Для каждого изображения возвращается список рамок от каждой модели
+        per_model = [self.run_model(index, images) for index in range(len(self.models))]
+        return [list(image_raw) for image_raw in zip(*per_model)]
+
+    def run_model(self, index, images):
+        # Модель получает весь батч за один вызов predict
+        with inference_mode():
+            results = self.models[index].predict(images, imgsz=self.imgsz, verbose=False,
+                                                 **predict_args(self.runtime, self.model_paths[index]))
+        return [result_boxes(result) for result in results]
+
+    def probs_from_raw(self, raw, weights=None, rule='mean'):
+        # None - модель не запускалась для изображения (каскадный режим), объединяем по остальным.
+        # Рамки ниже порога уверенности (ползунок в интерфейсе, --threshold) не учитываются
+        probs, mask = detection_probs(raw, len(self.models), self.num_classes, self.confidence)
+        return fuse_models(probs, mask, weights, rule)
 
 
 class ClassifierModel:
-    def __init__(self, model_paths):
-        self.models = [self.load_model(path) for path in model_paths]
+    def __init__(self, model_paths, registry=None, runtime=None):
+        self.registry = registry
+        self.runtime = runtime
+        self.model_paths = model_paths
+        self.models = [self.get_model(path) for path in model_paths]
+        self.imgsz = [model_imgsz(model, path, DEFAULT_CLASSIFIER_IMGSZ) for model, path in zip(self.models, model_paths)]
+
+    def get_model(self, model_path):
+        if self.registry is None:
+            return self.load_model(model_path)
+        return self.registry.get(model_path, self.load_model)
 
     def load_model(self, model_path):
-        model = YOLO(model_path, verbose=False)
-        model.fuse()
-        return model
+        model = load_yolo(model_path, 'classify')
+        return prepare_model(model, self.runtime) if self.runtime is not None else model
 
     def extract_probs(self, result):
         # Предполагается, что результат содержит атрибут probs с вероятностями классов
-        return result.probs.data.cpu().detach().numpy()
+        return result.probs.data.float().cpu().detach().numpy()
 
     def predict(self, images):
-        all_predictions = []
-        for image in images:
-            model_predictions = []
-            for model in self.models:
-                result = model.predict(image)
-                preds = self.extract_probs(result[0])  # Извлекаем вероятности классов из объекта Results
-                model_predictions.append(preds)
-            avg_prediction = np.mean(model_predictions, axis=0)
-            all_predictions.append(avg_prediction)
+        # Усредняем по моделям: (изображения, модели, классы) -> (изображения, классы)
+        all_predictions = list(self.probs_from_raw(self.predict_raw(images)))
         return all_predictions
 
+    def predict_raw(self, images):
+        per_model = [self.run_model(index, images) for index in range(len(self.models))]
+        return [list(image_raw) for image_raw in zip(*per_model)]
+
+    def run_model(self, index, images):
+        # images - список словарей {imgsz: изображение}, подготовленных EnsembleModel.prepare_inputs.
+        # Модель получает весь батч за один вызов predict
+        imgsz = self.imgsz[index]
+        with inference_mode():
+            results = self.models[index].predict([image[imgsz] for image in images], imgsz=imgsz, verbose=False,
+                                                 **predict_args(self.runtime, self.model_paths[index]))
+        return [self.extract_probs(result) for result in results]  # Извлекаем вероятности классов из объектов Results
+
+    @property
+    def num_classes(self):
+        return len(self.models[0].names)
+
+    def probs_from_raw(self, raw, weights=None, temperatures=None, rule='mean'):
+        probs, mask = stack_probs(raw, len(self.models), self.num_classes)
+        return fuse_models(temperature_scale(probs, temperatures), mask, weights, rule)
+
 
 class EnsembleModel:
-    def __init__(self, alpha=0.5, confidence=0.7):
-        self.od_model = ObjectDetectionModel(["weights/yolov8s_640_10ep_16b.pt","weights/yolov8m_640_30ep_16b.pt"], confidence)
-        self.clf_model = ClassifierModel(["weights/yolov8m-cls-50ep-16b.pt", "weights/yolov8x-cls-30ep-16b.pt", "weights/yolov8x-cls_640_10ep.pt"])
+    # runtime - словарь с ключами runtime.DEFAULT_RUNTIME (устройство, точность, channels_last, torch.compile, потоки),
+    # одинаковый для всех пяти моделей. По умолчанию выбирается по доступному оборудованию
+    def __init__(self, alpha=0.5, confidence=0.7, registry=None, backend='pt', precision='fp32', runtime=None):
+        self.backend = backend
+        self.precision = precision
+        self.runtime = resolve_runtime(runtime)
+        configure_threads(self.runtime['threads'])
+        self.od_model = ObjectDetectionModel([exported_weights_path(path, backend, precision) for path in DETECTION_WEIGHTS],
+                                             confidence, registry, self.runtime)
+        self.clf_model = ClassifierModel([exported_weights_path(path, backend, precision) for path in CLASSIFIER_WEIGHTS],
+                                         registry, self.runtime)
         self.alpha = alpha
+        self.timer = StageTimer()
+        self.cache = None  # ResultCache, подключается через EnsembleSession
+        self.cascade_threshold = None  # None - всегда запускаются все пять моделей
+        self.cascade_metric = 'margin'
+        self.cascade_stats = Counter()
+        self.prefilter_confidence = None  # None - предфильтр пустых кадров выключен
+        self.prefilter_stats = Counter()
+        # Правило объединения моделей, веса детекторов и классификаторов, температуры классификаторов
+        self.last_scores = []  # вероятности каждой модели для изображений последнего батча
+        self.fusion = {'rule': 'mean', 'detector_weights': None, 'classifier_weights': None, 'temperatures': None}
+
+    def fingerprint(self):
+        # Идентифицирует набор весов и предобработку, чтобы кэш не отдавал результаты других моделей
+        # Точность инференса тоже влияет на выходы моделей
+        digest = hashlib.sha1(f"{self.backend}:{self.precision}:{self.runtime['dtype']}:{DETECTION_IMGSZ}:"
+                              f"{RAW_FORMAT_VERSION}".encode())
+        for model_path in self.od_model.model_paths + self.clf_model.model_paths:
+            stat = os.stat(model_path)
+            digest.update(f"{model_path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return digest.hexdigest()
+
+    def reset_stats(self):
+        self.timer.reset()
+        self.cascade_stats.clear()
+        self.prefilter_stats.clear()
+        if self.cache is not None:
+            self.cache.reset_counters()
+
+    def cache_counters(self):
+        if self.cache is None:
+            return {'hits': 0, 'misses': 0}
+        return {'hits': self.cache.hits, 'misses': self.cache.misses}
+
+    def configure(self, alpha=None, confidence=None):
+        # alpha и порог уверенности используются только при объединении результатов,
+        # поэтому их можно менять без перезагрузки весов
+        if alpha is not None:
+            self.alpha = alpha
+        if confidence is not None:
+            self.od_model.confidence = confidence
+
+    def set_cascade(self, threshold, metric='margin'):
+        if metric not in CASCADE_METRICS:
+            raise ValueError(f"Unknown cascade metric: {metric}")
+        self.cascade_threshold = threshold
+        self.cascade_metric = metric
+
+    def cascade_report(self):
+        return format_cascade_report(self.cascade_stats)
+
+    def set_fusion(self, rule='mean', detector_weights=None, classifier_weights=None, temperatures=None):
+        if rule not in FUSION_RULES:
+            raise ValueError(f"Unknown fusion rule: {rule}")
+        self.fusion = {'rule': rule, 'detector_weights': detector_weights,
+                       'classifier_weights': classifier_weights, 'temperatures': temperatures}
+
+    def set_prefilter(self, confidence):
+        # confidence - минимальная уверенность рамки, при которой кадр считается непустым
+        self.prefilter_confidence = confidence
+
+    def prefilter_report(self):
+        return format_prefilter_report(self.prefilter_stats)
+
+    def has_animal(self, raw):
+        boxes = raw['boxes'][PREFILTER_DETECTOR]
+        return bool(len(boxes)) and bool((boxes[:, 0] > self.prefilter_confidence).any())
+
+    def is_confident(self, ensemble_probs):
+        # Уверенность по разрыву между двумя лучшими классами или по нормированной энтропии
+        if self.cascade_metric == 'margin':
+            top2 = np.sort(ensemble_probs, axis=-1)[..., -2:]
+            return top2[..., 1] - top2[..., 0] >= self.cascade_threshold
+        probs = ensemble_probs / np.clip(ensemble_probs.sum(axis=-1, keepdims=True), 1e-12, None)
+        entropy = -(probs * np.log(np.clip(probs, 1e-12, None))).sum(axis=-1) / np.log(probs.shape[-1])
+        return entropy <= self.cascade_threshold
 
     def ensemble_predictions(self, od_probs, clf_probs):
         # Усреднение вероятностей с весовым коэффициентом alpha
@@ -81,22 +325,268 @@ class EnsembleModel:
         return ensemble_prob
 
     def final_prediction(self, ensemble_probs):
-        final_class = np.argmax(ensemble_probs)
+        final_class = np.argmax(ensemble_probs, axis=-1)
         return final_class
 
+    def prepare_inputs(self, image):
+        # Декодируем файл один раз и масштабируем один раз на каждый размер входа,
+        # после чего одни и те же массивы получают все пять моделей
+        if isinstance(image, (str, LoadedImage)):
+            with self.timer.stage('decode'):
+                image = load_image(image)
+
+        with self.timer.stage('resize'):
+            od_input = letterbox(image, self.od_model.imgsz)
+            clf_input = {imgsz: resize_short_side(image, imgsz) for imgsz in set(self.clf_model.imgsz)}
+        return od_input, clf_input
+
     def predict(self, image):
-        # Получение усреднённых вероятностей классов от моделей Object Detection
-        od_probs = self.od_model.detect(image)
+        return self.predict_batch([image])[0]
 
-        # Классификация объектов
-        clf_probs = self.clf_model.predict([image])[0]
+    def image_key(self, image):
+        # Ключ кэша: хэш содержимого файла. Для заранее прочитанных изображений он уже посчитан
+        if isinstance(image, LoadedImage):
+            return image.key if image.key is not None else self.cache.file_key(image.path)
+        return self.cache.file_key(image) if isinstance(image, str) else None
 
-        # Объединение результатов
-        ensemble_probs = self.ensemble_predictions(od_probs, clf_probs)
+    def lookup(self, images):
+        # Ищет сохраненные выходы моделей в кэше. Для новых изображений создает пустые записи:
+        # {'boxes': [рамки каждого детектора], 'clf': [вероятности каждого классификатора]},
+        # где None стоит на месте модели, которая для изображения еще не запускалась
+        raws = [None] * len(images)
+        keys = [None] * len(images)
+        if self.cache is not None:
+            with self.timer.stage('cache'):
+                keys = [self.image_key(image) for image in images]
+                cached = self.cache.get_many([key for key in keys if key is not None])
+                for index, key in enumerate(keys):
+                    if key in cached:
+                        raws[index] = cached[key]
+        for index, raw in enumerate(raws):
+            if raw is None:
+                raws[index] = {'boxes': [None] * len(self.od_model.models), 'clf': [None] * len(self.clf_model.models)}
+        return raws, keys
 
-        # Финальное предсказание
-        final_class = self.final_prediction(ensemble_probs)
-        return final_class
+    def infer_batch(self, images, detectors=None, classifiers=None, prepared=None, raws=None, keys=None):
+        # Сырые выходы моделей для каждого изображения (см. lookup).
+        # detectors/classifiers - индексы моделей, которые нужно запустить (по умолчанию все),
+        # prepared - словарь уже подготовленных входов, общий для нескольких вызовов,
+        # raws/keys - результат lookup, если он уже был выполнен
+        detectors = range(len(self.od_model.models)) if detectors is None else detectors
+        classifiers = range(len(self.clf_model.models)) if classifiers is None else classifiers
+        prepared = {} if prepared is None else prepared
+        if raws is None:
+            raws, keys = self.lookup(images)
+
+        updated = set()
+        for kind, model_indices, wrapper in (('boxes', detectors, self.od_model), ('clf', classifiers, self.clf_model)):
+            for model_index in model_indices:
+                pending = [index for index, raw in enumerate(raws) if raw[kind][model_index] is None]
+                if not pending:
+                    continue
+                for index in pending:
+                    if index not in prepared:
+                        prepared[index] = self.prepare_inputs(images[index])
+                inputs = [prepared[index][0 if kind == 'boxes' else 1] for index in pending]
+
+                # Рамки от моделей Object Detection или вероятности классификаторов
+                outputs = self.run_model('detection' if kind == 'boxes' else 'classification', wrapper, model_index, inputs)
+                for index, output in zip(pending, outputs):
+                    raws[index][kind][model_index] = output
+                updated.update(pending)
+
+        if self.cache is not None and updated:
+            with self.timer.stage('cache'):
+                self.cache.put_many({keys[index]: raws[index] for index in updated if keys[index] is not None})
+        return raws
+
+    def run_model(self, stage, wrapper, index, inputs):
+        # Каждый вызов predict учитывается в этапе и отдельно по файлу весов
+        name = os.path.basename(wrapper.model_paths[index])
+        with self.timer.stage(stage), self.timer.stage(f"model:{name}"):
+            outputs = wrapper.run_model(index, inputs)
+        self.timer.count(f"model_images:{name}", len(inputs))
+        return outputs
+
+    def score(self, raws):
+        # Объединение сохраненных выходов моделей. Не требует инференса,
+        # поэтому смена alpha или порога пересчитывается по кэшу
+        od_probs = self.od_model.probs_from_raw([raw['boxes'] for raw in raws],
+                                                self.fusion['detector_weights'], self.fusion['rule'])
+        clf_probs = self.clf_model.probs_from_raw([raw['clf'] for raw in raws], self.fusion['classifier_weights'],
+                                                  self.fusion['temperatures'], self.fusion['rule'])
+        return self.ensemble_predictions(od_probs, clf_probs)
+
+    def uncertainty(self, raws, ensemble_probs):
+        # Уверенность каждого кадра по выходам всех моделей сразу (см. fusion.uncertainty_scores)
+        od_probs, od_mask = detection_probs([raw['boxes'] for raw in raws], len(self.od_model.models),
+                                            self.od_model.num_classes, self.od_model.confidence)
+        clf_probs, clf_mask = stack_probs([raw['clf'] for raw in raws], len(self.clf_model.models), self.clf_model.num_classes)
+        clf_probs = temperature_scale(clf_probs, self.fusion['temperatures'])
+        return uncertainty_scores(ensemble_probs, np.concatenate([od_probs, clf_probs], axis=1),
+                                  np.concatenate([od_mask, clf_mask], axis=1))
+
+    def model_scores(self, raw, ensemble_probs=None, uncertainty=None):
+        # Вероятности классов от каждой модели, None - модель для изображения не запускалась.
+        # uncertainty - оценки уверенности кадра, по ним кадр направляется на ручную проверку
+        return {
+            'detectors': [None if boxes is None else
+                          np.round(boxes_to_probs(boxes, self.od_model.num_classes, self.od_model.confidence), 4).tolist()
+                          for boxes in raw['boxes']],
+            'classifiers': [None if probs is None else np.round(probs, 4).tolist() for probs in raw['clf']],
+            'ensemble': None if ensemble_probs is None else np.round(ensemble_probs, 4).tolist(),
+            'uncertainty': None if uncertainty is None else {name: round(float(value), 4) for name, value in uncertainty.items()},
+        }
+
+    def load_images(self, images):
+        # Пути декодируются до инференса, как в prefetch_batches. Нечитаемый файл (поврежден, удален
+        # во время обработки) дает None и пропускается, а не прерывает батч процесса пула, сервера или режима серий
+        with self.timer.stage('decode'):
+            return [read_image(image, with_key=self.cache is not None) if isinstance(image, str) else image
+                    for image in images]
+
+    def skip_unreadable(self, images, predict):
+        # На местах нечитаемых изображений в предсказаниях и last_scores стоит None
+        images = self.load_images(images)
+        loaded = [image for image in images if image is not None]
+        if len(loaded) < len(images):
+            self.timer.count('unreadable', len(images) - len(loaded))
+        predictions = iter(predict(loaded) if loaded else [])
+        scores = iter(self.last_scores if loaded else [])
+        self.last_scores = [None if image is None else next(scores) for image in images]
+        return [None if image is None else next(predictions) for image in images]
+
+    def predict_batch(self, images):
+        return self.skip_unreadable(images, self.predict_loaded_batch)
+
+    def predict_loaded_batch(self, images):
+        self.timer.count('images', len(images))
+        prepared = {}
+        raws, keys = self.lookup(images)
+        all_raws = raws
+        all_probs = [None] * len(images)
+        active = list(range(len(images)))
+        if self.prefilter_confidence is not None:
+            # Результат yolov8s используется и дальше в ансамбле, поэтому предфильтр не требует лишнего инференса
+            self.infer_batch(images, [PREFILTER_DETECTOR], [], prepared, raws, keys)
+            active = [index for index in active if self.has_animal(raws[index])]
+            self.prefilter_stats['frames'] += len(images)
+            self.prefilter_stats['empty'] += len(images) - len(active)
+
+        final_classes = np.full(len(images), EMPTY_CLASS)
+        all_uncertainty = [None] * len(images)
+        if active:
+            images, prepared, raws, keys = subset(active, images, prepared, raws, keys)
+            start = time.perf_counter()
+            if self.cascade_threshold is None:
+                self.infer_batch(images, prepared=prepared, raws=raws, keys=keys)
+            else:
+                self.infer_cascade(images, prepared, raws, keys)
+            self.prefilter_stats['inference_time'] += time.perf_counter() - start
+            self.prefilter_stats['inferred'] += len(active)
+
+            # Объединение результатов
+            with self.timer.stage('fusion'):
+                ensemble_probs = self.score(raws)
+
+                # Финальное предсказание
+                final_classes[active] = self.final_prediction(ensemble_probs)
+                uncertainty = self.uncertainty(raws, ensemble_probs)
+            for position, (index, probs) in enumerate(zip(active, ensemble_probs)):
+                all_probs[index] = probs
+                all_uncertainty[index] = {name: values[position] for name, values in uncertainty.items()}
+        self.last_scores = [self.model_scores(raw, probs, uncertainty)
+                            for raw, probs, uncertainty in zip(all_raws, all_probs, all_uncertainty)]
+        return [int(final_class) for final_class in final_classes]
+
+    def infer_cascade(self, images, prepared=None, raws=None, keys=None):
+        # Первая ступень - легкие модели на всем батче. Если объединенный результат
+        # неуверенный, для этих кадров дозапускаются остальные модели
+        prepared = {} if prepared is None else prepared
+        if raws is None:
+            raws, keys = self.lookup(images)
+        self.infer_batch(images, CASCADE_FIRST_STAGE['detectors'], CASCADE_FIRST_STAGE['classifiers'], prepared, raws, keys)
+        with self.timer.stage('fusion'):
+            confident = self.is_confident(self.score(raws))
+
+        hard = [index for index, is_confident in enumerate(confident) if not is_confident]
+        self.cascade_stats['first_stage'] += len(images) - len(hard)
+        self.cascade_stats['full'] += len(hard)
+        if hard:
+            # Записи в raws дополняются на месте
+            hard_images, hard_prepared, hard_raws, hard_keys = subset(hard, images, prepared, raws, keys)
+            self.infer_batch(hard_images, prepared=hard_prepared, raws=hard_raws, keys=hard_keys)
+        return raws
+
+    def predict_batches(self, batches):
+        for images in batches:
+            yield self.predict_batch(images)
+
+    def predict_crops_batch(self, images):
+        return self.skip_unreadable(images, self.predict_loaded_crops_batch)
+
+    def predict_loaded_crops_batch(self, images):
+        # Детекция, затем классификация каждого найденного животного.
+        # Все вырезанные животные батча проходят через каждый классификатор за один вызов
+        self.timer.count('images', len(images))
+        decoded = []
+        for image in images:
+            if isinstance(image, (str, LoadedImage)):
+                with self.timer.stage('decode'):
+                    image = load_image(image)
+            decoded.append(image)
+
+        raws, keys = self.lookup(images)
+        with self.timer.stage('resize'):
+            prepared = {index: (letterbox(image, self.od_model.imgsz), None)
+                        for index, (image, raw) in enumerate(zip(decoded, raws)) if raw['boxes'][CROP_DETECTOR] is None}
+        self.infer_batch(images, [CROP_DETECTOR], [], prepared, raws, keys)
+
+        crops, owners = [], []
+        with self.timer.stage('crop'):
+            for index, (image, raw) in enumerate(zip(decoded, raws)):
+                boxes = raw['boxes'][CROP_DETECTOR]
+                boxes = boxes[boxes[:, 0] > self.od_model.confidence]
+                for box, xyxy in zip(boxes, unletterbox_boxes(boxes[:, 2:6], image.shape, self.od_model.imgsz)):
+                    crop = crop_box(image, xyxy, CROP_MARGIN)
+                    if crop.size:
+                        crops.append(crop)
+                        owners.append((index, box, xyxy))
+
+        animals = [[] for _ in images]
+        if crops:
+            with self.timer.stage('resize'):
+                clf_inputs = [{imgsz: resize_short_side(crop, imgsz) for imgsz in set(self.clf_model.imgsz)} for crop in crops]
+            per_model = [self.run_model('classification', self.clf_model, index, clf_inputs)
+                         for index in range(len(self.clf_model.models))]
+            clf_raw = [list(crop_raw) for crop_raw in zip(*per_model)]
+
+            with self.timer.stage('fusion'):
+                clf_probs = self.clf_model.probs_from_raw(clf_raw, self.fusion['classifier_weights'],
+                                                          self.fusion['temperatures'], self.fusion['rule'])
+                # Для каждого животного детектор дает один класс со своей уверенностью
+                od_probs = np.zeros_like(clf_probs)
+                od_probs[np.arange(len(owners)), [int(box[1]) for _, box, _ in owners]] = [box[0] for _, box, _ in owners]
+                crop_probs = self.ensemble_predictions(od_probs, clf_probs)
+                labels = self.final_prediction(crop_probs)
+            for (index, _, xyxy), label, probs in zip(owners, labels, crop_probs):
+                animals[index].append({'class': int(label), 'confidence': float(probs[label]), 'box': [float(v) for v in xyxy]})
+
+        results = []
+        for image_animals in animals:
+            if image_animals:
+                # Класс кадра - самый частый класс животных, при равенстве - с большей суммарной уверенностью
+                counts = Counter(animal['class'] for animal in image_animals)
+                final_class = max(counts, key=lambda cls: (counts[cls], sum(a['confidence'] for a in image_animals if a['class'] == cls)))
+            else:
+                final_class = EMPTY_CLASS
+            results.append({'final_class': int(final_class), 'animals': image_animals})
+        self.last_scores = [self.model_scores(raw) for raw in raws]
+        return results
+
+    def predict_crops_batches(self, batches):
+        for images in batches:
+            yield self.predict_crops_batch(images)
 
 
 if __name__ == "__main__":
@@ -104,9 +594,15 @@ if __name__ == "__main__":
     # od_model_paths = ["weights/yolov8s_640_10ep_16b.pt", "weights/yolov8m_640_30ep_16b.pt"]  # "weights/yolov9c_640_20ep.pt",   Пути к моделям Object Detection
     # clf_model_paths = ["weights/yolov8m-cls-50ep-16b.pt", "weights/yolov8x-cls-30ep-16b.pt", "weights/yolov8x-cls_640_10ep.pt"]  # Пути к классификаторам
 
-    # image = load_image("path_to_image.jpg")  # Функция загрузки изображения
-    image = "test_data/Im_0002350_1_jpg.rf.0b1232557814e2a273d91197a49731e8.jpg"
+    # Путь к изображению передается аргументом, без него используется синтетический кадр из benchmark.py
+    if len(sys.argv) > 1:
+        image_path = sys.argv[1]
+    else:
+        from benchmark import make_synthetic_folder
+        image_path = make_synthetic_folder(count=1)[0]
+    image = load_image(image_path)
     ensemble_model = EnsembleModel(alpha=0.5, confidence=0.8)
     final_class = ensemble_model.predict(image)
     model_names = {0: 'deer', 1: 'muskdeer', 2: 'roe'}
     print(f"Final Prediction: {model_names[final_class]}")
+    print(ensemble_model.timer.report())
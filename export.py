@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import torch
+from ultralytics import YOLO
+from ensemble import (
+    DETECTION_WEIGHTS, CLASSIFIER_WEIGHTS, DETECTION_IMGSZ, DEFAULT_CLASSIFIER_IMGSZ, EXPORT_MANIFEST,
+    EnsembleModel, exported_weights_path, load_export_manifest, model_imgsz,
+)
+from classifier import batched, DEFAULT_BATCH_SIZE
+from preprocessing import IMAGE_EXTENSIONS
+from runtime import DEVICES, DTYPES, describe, resolve_runtime
+
+
+def export_device(backend, precision):
+    # ultralytics выгружает ONNX в fp16 только на GPU: на процессоре half=True игнорируется
+    # и под именем fp16 сохраняется fp32 модель
+    if backend == 'onnx' and precision == 'fp16':
+        if not torch.cuda.is_available():
+            raise RuntimeError("fp16 ONNX export requires a CUDA GPU")
+        return 0
+    return None
+
+
+def calibration_data(folder):
+    # Описание датасета для калибровки int8 OpenVINO на кадрах фотоловушек (без него ultralytics берет COCO).
+    # Разметка не нужна: калибруются только диапазоны активаций. JSON - подмножество YAML
+    path = os.path.join(tempfile.mkdtemp(prefix='calibration_'), 'calibration.yaml')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'path': os.path.abspath(folder), 'train': '.', 'val': '.', 'names': ['animal']}, f, ensure_ascii=False)
+    return path
+
+
+def export_model(model_path, task, backend, precision, calibration=None):
+    model = YOLO(model_path, task=task, verbose=False)
+    imgsz = DETECTION_IMGSZ if task == 'detect' else model_imgsz(model, model_path, DEFAULT_CLASSIFIER_IMGSZ)
+    target_path = exported_weights_path(model_path, backend, precision)
+
+    if backend == 'onnx' and precision == 'int8':
+        # ultralytics не квантует ONNX, поэтому квантуем веса уже выгруженной fp32 модели
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        fp32_path = exported_weights_path(model_path, backend, 'fp32')
+        if not os.path.exists(fp32_path):
+            export_model(model_path, task, backend, 'fp32', calibration)
+        quantize_dynamic(fp32_path, target_path, weight_type=QuantType.QUInt8)
+    else:
+        # dynamic=True для ONNX и OpenVINO: EnsembleModel подает батчи по DEFAULT_BATCH_SIZE кадров,
+        # а модель со статической формой входа принимает только один кадр
+        options = {'device': export_device(backend, precision)}
+        if precision == 'int8':
+            if calibration is None:
+                raise ValueError("int8 OpenVINO export requires calibration images")
+            options['data'] = calibration_data(calibration)
+        exported_path = model.export(format=backend, imgsz=imgsz, half=precision == 'fp16',
+                                     int8=precision == 'int8', dynamic=True, **options)
+        if os.path.normpath(exported_path) != os.path.normpath(target_path):
+            if os.path.isdir(target_path):
+                shutil.rmtree(target_path)
+            os.replace(exported_path, target_path)
+
+    return target_path, {'source': model_path, 'task': task, 'imgsz': imgsz, 'backend': backend, 'precision': precision}
+
+
+def export_weights(backend='onnx', precisions=('fp32',), calibration=None):
+    # calibration - папка с кадрами фотоловушек для калибровки int8 OpenVINO
+    manifest = load_export_manifest()
+    for precision in precisions:
+        for model_path, task in [(path, 'detect') for path in DETECTION_WEIGHTS] + [(path, 'classify') for path in CLASSIFIER_WEIGHTS]:
+            target_path, info = export_model(model_path, task, backend, precision, calibration)
+            manifest[target_path] = info
+            print(f"Exported {model_path} -> {target_path}")
+
+    with open(EXPORT_MANIFEST, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def check_parity(file_paths, backend, precision='fp32', batch_size=DEFAULT_BATCH_SIZE, runtime=None):
+    # Сравнивает выходы каждой модели проверяемого ансамбля (выгруженного или .pt с настройками runtime)
+    # с чекпойнтами PyTorch в fp32 без channels_last и torch.compile на том же устройстве
+    runtime = resolve_runtime(runtime)
+    reference = EnsembleModel(backend='pt', runtime=dict(runtime, dtype='fp32', channels_last=False, compile=False))
+    exported = EnsembleModel(backend=backend, precision=precision, runtime=runtime)
+    od_diffs, clf_diffs, agreements = [], [], []
+
+    for batch in batched(file_paths, batch_size):
+        inputs = [reference.prepare_inputs(file_path) for file_path in batch]
+        od_inputs = [od_input for od_input, _ in inputs]
+        clf_inputs = [clf_input for _, clf_input in inputs]
+
+        od_ref = reference.od_model.detect_batch(od_inputs)
+        od_exp = exported.od_model.detect_batch(od_inputs)
+        clf_ref = np.array(reference.clf_model.predict(clf_inputs))
+        clf_exp = np.array(exported.clf_model.predict(clf_inputs))
+
+        od_diffs.append(np.abs(od_ref - od_exp).max(axis=1))
+        clf_diffs.append(np.abs(clf_ref - clf_exp).max(axis=1))
+        agreements.append(reference.final_prediction(reference.ensemble_predictions(od_ref, clf_ref)) ==
+                          exported.final_prediction(exported.ensemble_predictions(od_exp, clf_exp)))
+
+    od_diffs, clf_diffs, agreements = np.concatenate(od_diffs), np.concatenate(clf_diffs), np.concatenate(agreements)
+    return {
+        'images': len(file_paths),
+        'detection_max_abs_diff': float(od_diffs.max()),
+        'classification_max_abs_diff': float(clf_diffs.max()),
+        'final_class_agreement': float(agreements.mean()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Выгрузка весов ансамбля в ONNX / OpenVINO')
+    parser.add_argument('--backend', choices=['pt', 'onnx', 'openvino'], default='onnx',
+                        help='pt - только проверка настроек инференса (--skip-export --check)')
+    parser.add_argument('--precision', choices=['fp32', 'fp16', 'int8'], nargs='+', default=['fp32'])
+    parser.add_argument('--check', metavar='FOLDER', help='сравнить выгруженные модели с .pt на изображениях из папки')
+    parser.add_argument('--skip-export', action='store_true', help='только проверка, без выгрузки')
+    parser.add_argument('--calibration', metavar='FOLDER', help='кадры фотоловушек для калибровки int8 OpenVINO')
+    parser.add_argument('--device', choices=DEVICES, default='auto', help='устройство для проверки')
+    parser.add_argument('--dtype', choices=DTYPES, default='auto', help='точность вычислений моделей .pt при проверке')
+    parser.add_argument('--no-channels-last', action='store_true')
+    parser.add_argument('--compile', action='store_true', help='проверить модели после torch.compile')
+    args = parser.parse_args()
+    if args.backend == 'pt' and not (args.skip_export and args.check):
+        parser.error("--backend pt requires --skip-export and --check")
+    if not args.skip_export:
+        if args.backend == 'onnx' and 'fp16' in args.precision and not torch.cuda.is_available():
+            parser.error("fp16 ONNX export requires a CUDA GPU (on CPU ultralytics exports fp32)")
+        if args.backend == 'openvino' and 'int8' in args.precision:
+            if args.calibration is None:
+                parser.error("int8 OpenVINO export requires --calibration FOLDER with camera-trap images")
+            if not os.path.isdir(args.calibration):
+                parser.error(f"folder not found: {args.calibration}")
+        export_weights(args.backend, args.precision, args.calibration)
+
+    if args.check:
+        file_paths = sorted(os.path.join(args.check, f) for f in os.listdir(args.check) if f.lower().endswith(IMAGE_EXTENSIONS))
+        runtime = resolve_runtime({'device': args.device, 'dtype': args.dtype,
+                                   'channels_last': not args.no_channels_last, 'compile': args.compile})
+        for precision in args.precision:
+            report = check_parity(file_paths, args.backend, precision, runtime=runtime)
+            print(f"{args.backend} {precision} ({describe(runtime)}): {json.dumps(report)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import numpy as np
+
+FUSION_RULES = ('mean', 'geometric', 'max')
+UNCERTAINTY_METRICS = ('confidence', 'max_prob', 'margin', 'agreement')
+EPS = 1e-12
+
+
+def detection_probs(raw_boxes, num_models, num_classes, confidence):
+    # raw_boxes - по каждому изображению список рамок (n, 6) от каждого детектора или None.
+    # Возвращает массив (изображения, модели, классы): для каждой модели сумма уверенностей
+    # рамок класса выше порога, деленная на число таких рамок, и маску запускавшихся моделей
+    num_images = len(raw_boxes)
+    mask = np.zeros((num_images, num_models), dtype=bool)
+    chunks, image_index, model_index = [], [], []
+    for image, image_boxes in enumerate(raw_boxes):
+        for model, boxes in enumerate(image_boxes):
+            if boxes is None:
+                continue
+            mask[image, model] = True
+            if len(boxes):
+                chunks.append(boxes[:, :2])
+                image_index.append(np.full(len(boxes), image))
+                model_index.append(np.full(len(boxes), model))
+
+    sums = np.zeros((num_images, num_models, num_classes))
+    counts = np.zeros((num_images, num_models))
+    if chunks:
+        boxes = np.concatenate(chunks)
+        image_index, model_index = np.concatenate(image_index), np.concatenate(model_index)
+        keep = boxes[:, 0] > confidence
+        image_index, model_index, boxes = image_index[keep], model_index[keep], boxes[keep]
+        np.add.at(sums, (image_index, model_index, boxes[:, 1].astype(int)), boxes[:, 0])
+        np.add.at(counts, (image_index, model_index), 1)
+    probs = np.divide(sums, counts[..., None], out=np.zeros_like(sums), where=counts[..., None] > 0)
+    return probs, mask
+
+
+def stack_probs(raw_probs, num_models, num_classes):
+    # raw_probs - по каждому изображению список векторов вероятностей от каждого классификатора или None
+    probs = np.zeros((len(raw_probs), num_models, num_classes))
+    mask = np.zeros((len(raw_probs), num_models), dtype=bool)
+    for image, image_probs in enumerate(raw_probs):
+        for model, model_probs in enumerate(image_probs):
+            if model_probs is not None:
+                probs[image, model] = model_probs
+                mask[image, model] = True
+    return probs, mask
+
+
+def temperature_scale(probs, temperatures):
+    # Калибровка классификаторов: softmax(logits / T), выраженный через вероятности, T по каждой модели
+    if temperatures is None:
+        return probs
+    temperatures = np.asarray(temperatures, dtype=float)[None, :, None]
+    scaled = np.power(np.clip(probs, EPS, None), 1.0 / temperatures)
+    return scaled / scaled.sum(axis=-1, keepdims=True)
+
+
+def fuse_models(probs, mask, weights=None, rule='mean'):
+    # Объединение по оси моделей: (изображения, модели, классы) -> (изображения, классы).
+    # Учитываются только модели, которые запускались для изображения (mask)
+    if rule not in FUSION_RULES:
+        raise ValueError(f"Unknown fusion rule: {rule}")
+    weights = np.ones(probs.shape[1]) if weights is None else np.asarray(weights, dtype=float)
+    weights = weights[None, :] * mask
+    total = weights.sum(axis=1, keepdims=True)
+    weights = np.divide(weights, total, out=np.zeros_like(weights), where=total > 0)
+
+    if rule == 'mean':
+        return np.einsum('im,imc->ic', weights, probs)
+    if rule == 'geometric':
+        fused = np.exp(np.einsum('im,imc->ic', weights, np.log(np.clip(probs, EPS, None))))
+        # Классы, которые ни одна модель не предсказала, остаются нулевыми
+        return np.where(np.einsum('im,imc->ic', weights, probs) > 0, fused, 0.0)
+    return np.where(mask[..., None], probs, -np.inf).max(axis=1).clip(0, None)
+
+
+def uncertainty_scores(ensemble_probs, model_probs, model_mask):
+    # Оценка уверенности кадров: ensemble_probs (изображения, классы), model_probs (изображения, модели, классы) -
+    # детекторы и классификаторы вместе, model_mask - запускавшиеся модели.
+    # max_prob и margin считаются по нормированному ансамблю, agreement - доля моделей, чей лучший класс
+    # совпал с классом ансамбля (детектор без рамок не голосует), confidence = max_prob * agreement
+    total = ensemble_probs.sum(axis=-1, keepdims=True)
+    probs = np.divide(ensemble_probs, total, out=np.zeros_like(ensemble_probs), where=total > 0)
+    top2 = np.sort(probs, axis=-1)[:, -2:]
+    voting = model_mask & (model_probs.sum(axis=-1) > 0)
+    votes = (voting & (model_probs.argmax(axis=-1) == probs.argmax(axis=-1)[:, None])).sum(axis=1)
+    voters = voting.sum(axis=1)
+    agreement = np.divide(votes, voters, out=np.ones(len(probs)), where=voters > 0)
+    return {
+        'confidence': top2[:, 1] * agreement,
+        'max_prob': top2[:, 1],
+        'margin': top2[:, 1] - top2[:, 0],
+        'agreement': agreement,
+    }
@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QObject, QRunnable, QSize, QThreadPool, pyqtSignal
+from PyQt6.QtGui import QIcon, QImage, QImageReader, QPixmap
+from PyQt6.QtWidgets import QListView
+from preprocessing import IMAGE_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = 128
+THUMBNAIL_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.oleni_minpriroda', 'thumbnails')
+MEMORY_THUMBNAILS = 2000
+THUMBNAIL_WORKERS = 4
+
+
+def list_images(folder_path):
+    with os.scandir(folder_path) as entries:
+        return sorted(entry.name for entry in entries if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+class ThumbnailCache:
+    # Миниатюры на диске. Ключ - путь, время изменения и размер миниатюры,
+    # поэтому измененный файл получает новую миниатюру, а старая просто не используется
+    def __init__(self, path=THUMBNAIL_CACHE_PATH, size=THUMBNAIL_SIZE):
+        self.path = path
+        self.size = size
+
+    def file_path(self, image_path):
+        stat = os.stat(image_path)
+        key = hashlib.blake2b(f"{os.path.abspath(image_path)}|{stat.st_mtime_ns}|{self.size}".encode(), digest_size=16).hexdigest()
+        return os.path.join(self.path, key[:2], key + '.jpg')
+
+    def load(self, image_path):
+        # Возвращает QImage из кэша, при его отсутствии строит миниатюру и сохраняет ее
+        cache_path = self.file_path(image_path)
+        image = QImage(cache_path)
+        if not image.isNull():
+            return image
+
+        reader = QImageReader(image_path)
+        reader.setAutoTransform(True)
+        # Декодирование сразу в уменьшенном размере: для JPEG это в разы быстрее полного
+        source_size = reader.size()
+        if source_size.isValid():
+            reader.setScaledSize(source_size.scaled(self.size, self.size, Qt.AspectRatioMode.KeepAspectRatio))
+        image = reader.read()
+        if image.isNull():
+            return image
+        if max(image.width(), image.height()) > self.size:
+            image = image.scaled(self.size, self.size, Qt.AspectRatioMode.KeepAspectRatio,
+                                 Qt.TransformationMode.SmoothTransformation)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        image.save(cache_path + '.tmp', 'JPG', 85)
+        os.replace(cache_path + '.tmp', cache_path)
+        return image
+
+
+class ThumbnailSignals(QObject):
+    ready = pyqtSignal(int, str, QImage)  # поколение модели, путь, миниатюра
+
+
+class ThumbnailTask(QRunnable):
+    def __init__(self, cache, generation, image_path, signals):
+        super().__init__()
+        self.cache = cache
+        self.generation = generation
+        self.image_path = image_path
+        self.signals = signals
+
+    def run(self):
+        try:
+            image = self.cache.load(self.image_path)
+        except OSError as e:
+            logger.warning("Error creating thumbnail: %s", e)
+            image = QImage()
+        self.signals.ready.emit(self.generation, self.image_path, image)
+
+
+class GalleryModel(QAbstractListModel):
+    # Файлы открытой папки. Миниатюра запрашивается, только когда представление рисует элемент,
+    # и строится в пуле потоков; до этого показывается стандартная иконка
+    def __init__(self, default_icon, cache=None, parent=None):
+        super().__init__(parent)
+        self.default_icon = default_icon
+        self.cache = cache or ThumbnailCache()
+        self.folder = None
+        self.files = []
+        self.rows = {}
+        self.icons = OrderedDict()
+        self.pending = set()
+        self.generation = 0
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(THUMBNAIL_WORKERS)
+        self.signals = ThumbnailSignals()
+        self.signals.ready.connect(self.on_thumbnail)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.files)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        file_name = self.files[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return file_name
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return self.file_path(index)
+        if role == Qt.ItemDataRole.DecorationRole:
+            path = self.file_path(index)
+            if path in self.icons:
+                self.icons.move_to_end(path)
+                return self.icons[path]
+            if path not in self.pending:
+                self.pending.add(path)
+                self.pool.start(ThumbnailTask(self.cache, self.generation, path, self.signals))
+            return self.default_icon
+        return None
+
+    def file_path(self, index):
+        return os.path.join(self.folder, self.files[index.row()])
+
+    def file_name(self, index):
+        return self.files[index.row()]
+
+    def set_folder(self, folder_path, file_names=None):
+        # Задачи предыдущей папки отменяются, их результаты отбрасываются по номеру поколения
+        self.pool.clear()
+        self.beginResetModel()
+        self.generation += 1
+        self.folder = folder_path
+        self.files = list_images(folder_path) if file_names is None else list(file_names)
+        self.rows = {file_name: row for row, file_name in enumerate(self.files)}
+        self.pending.clear()
+        self.endResetModel()
+
+    def append(self, file_names):
+        file_names = [file_name for file_name in file_names if file_name not in self.rows]
+        if not file_names:
+            return
+        self.beginInsertRows(QModelIndex(), len(self.files), len(self.files) + len(file_names) - 1)
+        for file_name in file_names:
+            self.rows[file_name] = len(self.files)
+            self.files.append(file_name)
+        self.endInsertRows()
+
+    def remove(self, file_names):
+        # Строки удаляются непрерывными диапазонами с конца, чтобы номера еще не удаленных строк не сдвигались;
+        # индекс строк перестраивается один раз
+        rows = sorted({self.rows[file_name] for file_name in file_names if file_name in self.rows}, reverse=True)
+        if not rows:
+            return
+        ranges = []
+        for row in rows:
+            if ranges and ranges[-1][0] == row + 1:
+                ranges[-1][0] = row
+            else:
+                ranges.append([row, row])
+        for first, last in ranges:
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self.files[first:last + 1]
+            self.endRemoveRows()
+        self.rows = {name: index for index, name in enumerate(self.files)}
+
+    def on_thumbnail(self, generation, path, image):
+        if generation != self.generation:
+            return
+        self.pending.discard(path)
+        if image.isNull():
+            return
+        self.icons[path] = QIcon(QPixmap.fromImage(image))
+        while len(self.icons) > MEMORY_THUMBNAILS:
+            self.icons.popitem(last=False)
+        row = self.rows.get(os.path.basename(path))
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+
+class GalleryView(QListView):
+    # Сетка миниатюр. Одинаковый размер элементов и пакетная раскладка позволяют
+    # не измерять каждый из десятков тысяч элементов
+    def __init__(self, parent=None, icon_size=THUMBNAIL_SIZE):
+        super().__init__(parent)
+        self.setViewMode(QListView.ViewMode.IconMode)
+        self.setResizeMode(QListView.ResizeMode.Adjust)
+        self.setMovement(QListView.Movement.Static)
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QListView.LayoutMode.Batched)
+        self.setBatchSize(256)
+        self.setIconSize(QSize(icon_size, icon_size))
+        self.setGridSize(QSize(icon_size + 24, icon_size + 36))
+        self.setWordWrap(True)
+        self.setSelectionMode(QListView.SelectionMode.SingleSelection)
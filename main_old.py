@@ -6,6 +6,7 @@ from PyQt6.QtWidgets import QApplication, QWidget, \
     QScrollArea, QStackedWidget
 from PyQt6.QtGui import QIcon, QPixmap
 from PyQt6.QtCore import Qt
+from gallery import GalleryModel, GalleryView
 
 class ImageViewer(QWidget):
     def __init__(self):
@@ -27,13 +28,14 @@ class ImageViewer(QWidget):
         self.folder_list.setSelectionMode(QListWidget.SelectionMode.SingleSelection)  # Изменение режима выбора на одиночный
         self.folder_list.itemClicked.connect(self.load_selected_folder)
 
-        self.image_list = QListWidget(self)
-        self.image_list.setViewMode(QListWidget.ViewMode.IconMode)
-        self.image_list.itemClicked.connect(self.show_image)
-
         self.default_folder_icon = QIcon('default_folder.png')  # Путь к вашей иконке для папок по умолчанию
         self.default_image_icon = QIcon('default_image.png')  # Путь к вашей иконке для изображений по умолчанию
 
+        self.image_model = GalleryModel(self.default_image_icon, parent=self)
+        self.image_list = GalleryView(self)
+        self.image_list.setModel(self.image_model)
+        self.image_list.clicked.connect(self.show_image)
+
         self.button_layout = QVBoxLayout()
         self.button_layout.addWidget(self.button)
         self.button_layout.addWidget(self.folder_list)
@@ -74,12 +76,8 @@ class ImageViewer(QWidget):
        
         
     def on_resize(self, event):
-        # Get the current folder path
-        current_folder_item = self.folder_list.currentItem()
-        if current_folder_item:
-            folder_path = current_folder_item.text()
-            # Update the icons in the current folder
-            self.load_icons(folder_path)
+        # Представление само перестраивает сетку миниатюр, перечитывать папку не нужно
+        self.stack.resize(self.size())
 
     def select_folder(self):
         folder_path = QFileDialog.getExistingDirectory(self, "Выбрать папку", options=QFileDialog.Option.DontUseNativeDialog)
@@ -89,22 +87,20 @@ class ImageViewer(QWidget):
             self.set_current_folder(folder_path)
 
     def load_icons(self, folder_path):
-        self.image_list.clear()
-        image_files = [f for f in os.listdir(folder_path) if f.endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp'))]
+        image_files = [f for f in os.listdir(folder_path) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp'))]
 
-        if image_files:
-            for index, image_file in enumerate(image_files):
+        file_names = []
+        for index, image_file in enumerate(image_files):
+            new_name = os.path.join(folder_path, f"img_{index}.png")
+            while os.path.exists(new_name):
+                index += 1
                 new_name = os.path.join(folder_path, f"img_{index}.png")
-                while os.path.exists(new_name):
-                    index += 1
-                    new_name = os.path.join(folder_path, f"img_{index}.png")
-                old_path = os.path.join(folder_path, image_file)
-                os.rename(old_path, new_name)
-                item = QListWidgetItem(self.default_image_icon, f"img_{index}.png")
-                self.image_list.addItem(item)
-        else:
-            item = QListWidgetItem(self.default_image_icon, "В выбранной папке нет изображений.")
-            self.image_list.addItem(item)
+            old_path = os.path.join(folder_path, image_file)
+            os.rename(old_path, new_name)
+            file_names.append(f"img_{index}.png")
+        self.image_model.set_folder(folder_path, file_names)
+        if not file_names:
+            QMessageBox.information(self, "Папка", "В выбранной папке нет изображений.")
 
 
 
@@ -127,8 +123,8 @@ class ImageViewer(QWidget):
         folder_path = item.text()
         self.load_icons(folder_path)
 
-    def show_image(self, item):
-        image_name = item.text()
+    def show_image(self, index):
+        image_name = self.image_model.file_name(index)
         current_folder_items = self.folder_list.selectedItems()
         if current_folder_items:
             folder_path = current_folder_items[0].text()
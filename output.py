@@ -0,0 +1,107 @@
+import csv
+import os
+import shutil
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from writer import open_csv, sync
+
+OUTPUT_MODES = ('copy', 'hardlink', 'reflink', 'symlink', 'manifest')
+MANIFEST_COLUMNS = ['file_path', 'dest_path', 'name']
+FICLONE = 0x40049409  # ioctl клонирования файла в Linux (btrfs, xfs, ...)
+
+
+def flat_name(relative_path):
+    # Имя файла в папке класса для пути относительно исходной папки: разделитель папок кодируется как %2F,
+    # сам '%' - как %25, поэтому разные пути не дают одинаковых имен. Имена файлов верхнего уровня без '%' не меняются
+    return '%2F'.join(part.replace('%', '%25') for part in relative_path.split(os.sep))
+
+
+def reflink(src, dest):
+    import fcntl
+    with open(src, 'rb') as source, open(dest, 'wb') as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+
+
+def place_file(src, dest_dir, mode, name=None):
+    # Размещает файл в папке класса. Если ссылку создать нельзя (другой диск, ФС без
+    # поддержки, нет прав на символические ссылки в Windows) - копирует. Возвращает итоговый способ
+    dest = os.path.join(dest_dir, name or os.path.basename(src))
+    if mode == 'copy':
+        shutil.copy(src, dest)
+        return mode
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        if mode == 'hardlink':
+            os.link(src, dest)
+        elif mode == 'symlink':
+            os.symlink(os.path.abspath(src), dest)
+        else:
+            reflink(src, dest)
+        return mode
+    except (OSError, ImportError):
+        if os.path.lexists(dest):
+            os.remove(dest)
+        shutil.copy(src, dest)
+        return 'copy'
+
+
+class FilePlacer:
+    # Раскладывает файлы по папкам классов в пуле потоков, пока идет инференс следующих батчей.
+    # В режиме manifest файлы не трогаются: в manifest.csv пишется, в какую папку попал каждый файл,
+    # а папки классов строятся по нему (см. class_view и materialize_views)
+    def __init__(self, output_folder, mode='copy', workers=4, resume=False):
+        if mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode: {mode}")
+        self.mode = mode
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self.executor = None
+        self.manifest_file = self.manifest_writer = None
+        if mode == 'manifest':
+            self.manifest_file, self.manifest_writer = open_csv(
+                os.path.join(output_folder, 'manifest.csv'), MANIFEST_COLUMNS, resume)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='place')
+
+    def submit(self, file_paths, dest_paths, names):
+        # Возвращает список future по файлам батча
+        if self.executor is None:
+            self.manifest_writer.writerows({'file_path': os.path.abspath(file_path), 'dest_path': dest_path, 'name': name}
+                                           for file_path, dest_path, name in zip(file_paths, dest_paths, names))
+            sync(self.manifest_file)
+            self.stats['manifest'] += len(file_paths)
+            return []
+        return [self.executor.submit(self._place, file_path, dest_path, name)
+                for file_path, dest_path, name in zip(file_paths, dest_paths, names)]
+
+    def _place(self, file_path, dest_path, name):
+        used = place_file(file_path, dest_path, self.mode, name)
+        with self._lock:
+            self.stats[used] += 1
+
+    def report(self):
+        return "Placed files: " + ", ".join(f"{mode} {count}" for mode, count in sorted(self.stats.items()))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        if self.manifest_file is not None:
+            self.manifest_file.close()
+
+
+def class_view(output_folder, dest_path):
+    # Исходные пути файлов, отнесенных к папке класса, по manifest.csv
+    with open(os.path.join(output_folder, 'manifest.csv'), newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if os.path.normpath(row['dest_path']) == os.path.normpath(dest_path):
+                yield row['file_path']
+
+
+def materialize_views(output_folder, mode='symlink'):
+    # Создает в папках классов ссылки или копии по manifest.csv
+    with open(os.path.join(output_folder, 'manifest.csv'), newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            os.makedirs(row['dest_path'], exist_ok=True)
+            place_file(row['file_path'], row['dest_path'], mode, row['name'])
@@ -0,0 +1,171 @@
+import logging
+import multiprocessing
+import os
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from telemetry import setup_logging
+from timing import StageTimer
+
+# Модели загружаются в каждом процессе-обработчике один раз при старте пула
+_worker_ensemble = None
+
+
+def default_threads_per_worker(workers):
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _init_worker(threads, backend, precision, cache_options, log_level=logging.WARNING, runtime=None):
+    global _worker_ensemble
+    setup_logging(log_level)
+    # Ограничиваем число потоков до импорта torch, чтобы процессы не конкурировали за ядра.
+    # Потоки torch задает сам EnsembleModel (runtime.configure_threads)
+    for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[name] = str(threads)
+
+    from ensemble import EnsembleModel
+    _worker_ensemble = EnsembleModel(backend=backend, precision=precision, runtime=dict(runtime or {}, threads=threads))
+    if cache_options is not None:
+        # Все процессы работают с одним файлом кэша, SQLite сам разграничивает запись
+        from cache import ResultCache
+        _worker_ensemble.cache = ResultCache(fingerprint=_worker_ensemble.fingerprint(), **cache_options)
+
+
+def predict_with_settings(ensemble, images, settings):
+    # Применяет настройки клиента (пула процессов или сервера) и возвращает предсказания со статистикой батча
+    ensemble.configure(alpha=settings['alpha'], confidence=settings['confidence'])
+    ensemble.set_cascade(settings['cascade_threshold'], settings['cascade_metric'])
+    ensemble.set_prefilter(settings['prefilter_confidence'])
+    ensemble.set_fusion(**settings['fusion'])
+    ensemble.reset_stats()
+    if settings['crops']:
+        predictions = ensemble.predict_crops_batch(images)
+    else:
+        predictions = ensemble.predict_batch(images)
+    stats = {
+        'totals': dict(ensemble.timer.totals),
+        'counts': dict(ensemble.timer.counts),
+        'counters': dict(ensemble.timer.counters),
+        'cache': ensemble.cache_counters(),
+        'cascade': dict(ensemble.cascade_stats),
+        'prefilter': dict(ensemble.prefilter_stats),
+        'scores': ensemble.last_scores,
+    }
+    return predictions, stats
+
+
+def _predict_batch(file_paths, settings):
+    return predict_with_settings(_worker_ensemble, file_paths, settings)
+
+
+class EnsembleClient:
+    # Общая часть предсказателей, которые передают настройки ансамбля вместе с каждым батчем
+    # и собирают статистику, посчитанную в другом процессе (ParallelEnsemble, RemoteEnsemble)
+    def __init__(self, alpha=0.5, confidence=0.7):
+        self.alpha = alpha
+        self.confidence = confidence
+        self.cascade_threshold = None
+        self.cascade_metric = 'margin'
+        self.prefilter_confidence = None
+        self.fusion = {}
+        self.timer = StageTimer()
+        self.cache_stats = Counter()
+        self.cascade_stats = Counter()
+        self.prefilter_stats = Counter()
+        self.last_scores = []
+        self.cache = None
+
+    def configure(self, alpha=None, confidence=None):
+        if alpha is not None:
+            self.alpha = alpha
+        if confidence is not None:
+            self.confidence = confidence
+
+    def set_cascade(self, threshold, metric='margin'):
+        self.cascade_threshold = threshold
+        self.cascade_metric = metric
+
+    def cascade_report(self):
+        from ensemble import format_cascade_report
+        return format_cascade_report(self.cascade_stats)
+
+    def set_prefilter(self, confidence):
+        self.prefilter_confidence = confidence
+
+    def set_fusion(self, rule='mean', detector_weights=None, classifier_weights=None, temperatures=None):
+        self.fusion = {'rule': rule, 'detector_weights': detector_weights,
+                       'classifier_weights': classifier_weights, 'temperatures': temperatures}
+
+    def prefilter_report(self):
+        from ensemble import format_prefilter_report
+        return format_prefilter_report(self.prefilter_stats)
+
+    def reset_stats(self):
+        self.timer.reset()
+        self.cache_stats.clear()
+        self.cascade_stats.clear()
+        self.prefilter_stats.clear()
+
+    def cache_counters(self):
+        return {'hits': self.cache_stats['hits'], 'misses': self.cache_stats['misses']}
+
+    def predict_batch(self, file_paths):
+        return next(self.predict_batches([file_paths]))
+
+    def predict_batches(self, batches):
+        return self._run(batches, crops=False)
+
+    def predict_crops_batches(self, batches):
+        return self._run(batches, crops=True)
+
+    def settings(self, crops):
+        return {'alpha': self.alpha, 'confidence': self.confidence,
+                'cascade_threshold': self.cascade_threshold, 'cascade_metric': self.cascade_metric,
+                'prefilter_confidence': self.prefilter_confidence, 'fusion': self.fusion, 'crops': crops}
+
+    def _merge(self, predictions, stats):
+        self.timer.merge(stats['totals'], stats['counts'], stats.get('counters'))
+        self.cache_stats.update(stats['cache'])
+        self.cascade_stats.update(stats['cascade'])
+        self.prefilter_stats.update(stats['prefilter'])
+        self.last_scores = stats['scores']
+        return predictions
+
+
+class ParallelEnsemble(EnsembleClient):
+    # Пул процессов, в каждом из которых загружена собственная копия ансамбля.
+    # Батчи раздаются процессам по очереди, результаты возвращаются в исходном порядке
+    def __init__(self, workers, threads_per_worker=None, alpha=0.5, confidence=0.7, backend='pt', precision='fp32',
+                 cache_options=None, runtime=None):
+        super().__init__(alpha, confidence)
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or default_threads_per_worker(workers)
+        # spawn вместо fork: после инициализации torch fork небезопасен, а в Windows он недоступен
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker, backend, precision, cache_options, logging.getLogger().getEffectiveLevel(),
+                      runtime),
+        )
+
+    def _run(self, batches, crops):
+        # Держим в очереди не больше двух батчей на процесс, чтобы остановка срабатывала быстро
+        pending = deque()
+        batches = iter(batches)
+        settings = self.settings(crops)
+        try:
+            for file_paths in batches:
+                pending.append(self.executor.submit(_predict_batch, list(file_paths), settings))
+                if len(pending) >= self.workers * 2:
+                    yield self._collect(pending.popleft())
+            while pending:
+                yield self._collect(pending.popleft())
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _collect(self, future):
+        return self._merge(*future.result())
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
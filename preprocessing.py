@@ -0,0 +1,71 @@
+from collections import namedtuple
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp')
+
+# Изображение, заранее прочитанное фоновым потоком: путь, декодированный массив и хэш содержимого (или None)
+LoadedImage = namedtuple('LoadedImage', ['path', 'image', 'key'])
+
+
+def decode_image(data, image_path):
+    image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Cannot decode image: {image_path}")
+    return image
+
+
+def load_image(image_path):
+    # Читаем байты через numpy: cv2.imread не открывает пути с кириллицей в Windows
+    if isinstance(image_path, LoadedImage):
+        return image_path.image
+    return decode_image(np.fromfile(image_path, dtype=np.uint8), image_path)
+
+
+def letterbox(image, size, color=(114, 114, 114)):
+    # Приводим изображение к квадрату size x size с сохранением пропорций,
+    # так же как это делает ultralytics перед детекцией
+    height, width = image.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width, new_height = int(round(width * ratio)), int(round(height * ratio))
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+
+    pad_w, pad_h = (size - new_width) / 2, (size - new_height) / 2
+    top, bottom = int(round(pad_h - 0.1)), int(round(pad_h + 0.1))
+    left, right = int(round(pad_w - 0.1)), int(round(pad_w + 0.1))
+    return cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+
+
+def resize_short_side(image, size):
+    # Классификаторы ultralytics масштабируют короткую сторону до imgsz и делают центральный кроп,
+    # поэтому заранее уменьшаем изображение до того же размера
+    height, width = image.shape[:2]
+    ratio = size / min(height, width)
+    if ratio == 1:
+        return image
+    new_width, new_height = int(round(width * ratio)), int(round(height * ratio))
+    interpolation = cv2.INTER_AREA if ratio < 1 else cv2.INTER_LINEAR
+    return cv2.resize(image, (new_width, new_height), interpolation=interpolation)
+
+
+def unletterbox_boxes(boxes, image_shape, size):
+    # Переводит рамки xyxy из координат квадрата letterbox обратно в координаты исходного изображения
+    height, width = image_shape[:2]
+    ratio = min(size / height, size / width)
+    pad_w = (size - int(round(width * ratio))) / 2
+    pad_h = (size - int(round(height * ratio))) / 2
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4).copy()
+    boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - int(round(pad_w - 0.1))) / ratio).clip(0, width)
+    boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - int(round(pad_h - 0.1))) / ratio).clip(0, height)
+    return boxes
+
+
+def crop_box(image, box, margin=0.0):
+    # Вырезает рамку с запасом margin от ее размера с каждой стороны
+    height, width = image.shape[:2]
+    x1, y1, x2, y2 = box
+    dx, dy = (x2 - x1) * margin, (y2 - y1) * margin
+    x1, y1 = max(0, int(x1 - dx)), max(0, int(y1 - dy))
+    x2, y2 = min(width, int(round(x2 + dx))), min(height, int(round(y2 + dy)))
+    return image[y1:y2, x1:x2]
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from PyQt6.QtCore import Qt, QObject, QRunnable, QSize, QThreadPool, pyqtSignal
+from PyQt6.QtGui import QImage, QImageReader
+
+PREVIEW_CACHE_SIZE = 32
+PREVIEW_WORKERS = 2
+
+
+def decode_preview(image_path, max_size):
+    # Декодирование сразу в размер экрана: для JPEG 12-24 Мп это в разы быстрее полного
+    reader = QImageReader(image_path)
+    reader.setAutoTransform(True)
+    source_size = reader.size()
+    if source_size.isValid() and (source_size.width() > max_size.width() or source_size.height() > max_size.height()):
+        reader.setScaledSize(source_size.scaled(max_size, Qt.AspectRatioMode.KeepAspectRatio))
+    return reader.read()
+
+
+class PreviewSignals(QObject):
+    ready = pyqtSignal(str, QImage)
+
+
+class PreviewTask(QRunnable):
+    def __init__(self, image_path, max_size, signals):
+        super().__init__()
+        self.image_path = image_path
+        self.max_size = max_size
+        self.signals = signals
+
+    def run(self):
+        self.signals.ready.emit(self.image_path, decode_preview(self.image_path, self.max_size))
+
+
+class PreviewLoader(QObject):
+    # Уменьшенные копии изображений для просмотра. Декодирование идет в пуле потоков,
+    # последние изображения хранятся в LRU-кэше, соседние загружаются заранее
+    ready = pyqtSignal(str, QImage)
+
+    def __init__(self, max_size=QSize(1920, 1080), cache_size=PREVIEW_CACHE_SIZE, parent=None):
+        super().__init__(parent)
+        self.max_size = max_size
+        self.cache_size = cache_size
+        self.images = OrderedDict()
+        self.pending = set()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(PREVIEW_WORKERS)
+        self.signals = PreviewSignals()
+        self.signals.ready.connect(self.on_ready)
+
+    def set_max_size(self, max_size):
+        if max_size != self.max_size:
+            self.max_size = max_size
+            self.images.clear()
+
+    def request(self, image_path):
+        # Если изображение уже в кэше, сигнал ready отправляется сразу
+        if image_path in self.images:
+            self.images.move_to_end(image_path)
+            self.ready.emit(image_path, self.images[image_path])
+        else:
+            self.load(image_path, priority=1)
+
+    def prefetch(self, image_paths):
+        for image_path in image_paths:
+            if image_path not in self.images:
+                self.load(image_path, priority=0)
+
+    def load(self, image_path, priority):
+        if image_path not in self.pending:
+            self.pending.add(image_path)
+            self.pool.start(PreviewTask(image_path, self.max_size, self.signals), priority)
+
+    def on_ready(self, image_path, image):
+        self.pending.discard(image_path)
+        if not image.isNull():
+            self.images[image_path] = image
+            while len(self.images) > self.cache_size:
+                self.images.popitem(last=False)
+        self.ready.emit(image_path, image)
+
+    def discard(self, image_path):
+        self.images.pop(image_path, None)
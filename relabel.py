@@ -0,0 +1,38 @@
+import os
+import shutil
+from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
+
+
+def move_files(file_names, source_folder, target_folder):
+    # Возвращает перемещенные файлы и ошибки по остальным. Файл с тем же именем в целевой папке
+    # не перезаписывается: перемещение такого файла считается конфликтом
+    moved, errors = [], []
+    for file_name in file_names:
+        source = os.path.join(source_folder, file_name)
+        target = os.path.join(target_folder, file_name)
+        if os.path.lexists(target):
+            errors.append(f"{source}: file already exists in {target_folder}")
+            continue
+        try:
+            shutil.move(source, target)
+            moved.append(file_name)
+        except OSError as e:
+            errors.append(f"{source}: {e}")
+    return moved, errors
+
+
+class MoveSignals(QObject):
+    finished = pyqtSignal(object, object, object)  # операция, перемещенные файлы, ошибки
+
+
+class MoveTask(QRunnable):
+    # operation - словарь {'files', 'source', 'target', 'from_class', 'to_class', 'undo'},
+    # 'automatic' - пересортировка по порогу проверки, а не ручное исправление
+    def __init__(self, operation, signals):
+        super().__init__()
+        self.operation = operation
+        self.signals = signals
+
+    def run(self):
+        moved, errors = move_files(self.operation['files'], self.operation['source'], self.operation['target'])
+        self.signals.finished.emit(self.operation, moved, errors)
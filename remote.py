@@ -0,0 +1,79 @@
+import base64
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from parallel import EnsembleClient
+
+REQUEST_RETRIES = 30
+REQUESTS_IN_FLIGHT = 2
+
+
+class RemoteEnsemble(EnsembleClient):
+    # Ансамбль на сервере классификации (server.py). Батчи отправляются по HTTP,
+    # пока обрабатывается один батч, следующий уже передается серверу.
+    # upload=False - сервер сам читает файлы по путям (общий диск, сервер запущен с --path-root),
+    # upload=True - файлы передаются в запросе
+    def __init__(self, url, alpha=0.5, confidence=0.7, upload=False, timeout=600):
+        super().__init__(alpha, confidence)
+        self.url = url.rstrip('/')
+        self.upload = upload
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=REQUESTS_IN_FLIGHT, thread_name_prefix='remote')
+
+    def _run(self, batches, crops):
+        pending = deque()
+        settings = self.settings(crops)
+        try:
+            for file_paths in batches:
+                pending.append(self.executor.submit(self.request, list(file_paths), settings))
+                if len(pending) >= REQUESTS_IN_FLIGHT:
+                    yield self._collect(pending.popleft())
+            while pending:
+                yield self._collect(pending.popleft())
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _collect(self, future):
+        with self.timer.stage('remote'):
+            response = future.result()
+        return self._merge(response['predictions'], response['stats'])
+
+    def request(self, file_paths, settings):
+        if self.upload:
+            payload = {'images': [{'name': os.path.basename(file_path), 'data': read_base64(file_path)}
+                                  for file_path in file_paths]}
+        else:
+            payload = {'paths': [os.path.abspath(file_path) for file_path in file_paths]}
+        payload['settings'] = settings
+        return self.post('/predict', payload)
+
+    def post(self, path, payload):
+        data = json.dumps(payload).encode()
+        for _ in range(REQUEST_RETRIES):
+            request = urllib.request.Request(self.url + path, data=data, headers={'Content-Type': 'application/json'})
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    return json.loads(response.read())
+            except urllib.error.HTTPError as e:
+                # 503 - очередь сервера заполнена, повторяем после паузы
+                if e.code != 503:
+                    raise RuntimeError(f"Server error {e.code}: {e.read().decode(errors='replace')}") from e
+                time.sleep(float(e.headers.get('Retry-After', 1)))
+        raise RuntimeError(f"Server {self.url} is overloaded")
+
+    def metrics(self):
+        with urllib.request.urlopen(self.url + '/metrics', timeout=self.timeout) as response:
+            return response.read().decode()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def read_base64(file_path):
+    with open(file_path, 'rb') as f:
+        return base64.b64encode(f.read()).decode('ascii')
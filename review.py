@@ -0,0 +1,74 @@
+import argparse
+import os
+import shutil
+from collections import Counter
+from writer import LOW_CONFIDENCE_FOLDER, load_corrections, read_reviews
+
+REVIEW_METRICS = ('confidence', 'max_prob', 'margin', 'agreement')  # см. fusion.uncertainty_scores
+DEFAULT_REVIEW_THRESHOLD = 0.5
+DEFAULT_REVIEW_METRIC = 'confidence'
+
+
+def needs_review(uncertainty, threshold, metric=DEFAULT_REVIEW_METRIC):
+    # threshold=None - ручная проверка выключена. Без оценки (пустой кадр, режим вырезания животных)
+    # кадр остается в папке своего класса
+    return threshold is not None and uncertainty is not None and uncertainty[metric] < threshold
+
+
+def plan_rethreshold(output_folder, threshold, metric=DEFAULT_REVIEW_METRIC):
+    # Перемещения между папкой предсказанного класса и папкой 'Низкая уверенность' по оценкам из review.csv,
+    # без повторного инференса. Файлы, исправленные вручную, и файлы, которых нет ни в одной из двух папок
+    # (перенесены в другой класс или запуск с output_mode='manifest'), не трогаются.
+    # Возвращает список (имя файла, из папки, в папку)
+    corrected = load_corrections(output_folder)
+    moves = []
+    for row in read_reviews(output_folder):
+        if row['dest_name'] in corrected:
+            continue
+        target = LOW_CONFIDENCE_FOLDER if needs_review(row, threshold, metric) else row['class_folder']
+        for current in (row['class_folder'], LOW_CONFIDENCE_FOLDER):
+            if os.path.exists(os.path.join(output_folder, current, row['dest_name'])):
+                break
+        else:
+            continue
+        if current != target:
+            moves.append((row['dest_name'], current, target))
+    return moves
+
+
+def group_moves(moves):
+    # {(из папки, в папку): [имена файлов]}
+    groups = {}
+    for file_name, source, target in moves:
+        groups.setdefault((source, target), []).append(file_name)
+    return groups
+
+
+def rethreshold(output_folder, threshold, metric=DEFAULT_REVIEW_METRIC, dry_run=False):
+    # Возвращает Counter {(из папки, в папку): число файлов}
+    moved = Counter()
+    for file_name, source, target in plan_rethreshold(output_folder, threshold, metric):
+        if not dry_run:
+            shutil.move(os.path.join(output_folder, source, file_name), os.path.join(output_folder, target, file_name))
+        moved[(source, target)] += 1
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пересортировать готовые результаты по новому порогу ручной проверки')
+    parser.add_argument('folder', help='папка результатов (classified)')
+    parser.add_argument('--threshold', type=float, required=True, help='кадры с оценкой ниже порога идут на проверку')
+    parser.add_argument('--metric', choices=['confidence', 'max_prob', 'margin', 'agreement'], default=DEFAULT_REVIEW_METRIC)
+    parser.add_argument('--dry-run', action='store_true', help='только показать, сколько файлов будет перемещено')
+    args = parser.parse_args()
+
+    rows = read_reviews(args.folder)
+    queue = sum(needs_review(row, args.threshold, args.metric) for row in rows)
+    moved = rethreshold(args.folder, args.threshold, args.metric, args.dry_run)
+    print(f"{queue}/{len(rows)} frames below {args.metric} {args.threshold:.2f}")
+    for (source, target), count in sorted(moved.items()):
+        print(f"{source} -> {target}: {count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Настройки инференса для всех пяти моделей. 'auto' выбирается по оборудованию:
+# CUDA или Apple MPS - fp16, процессор - fp32 (bf16 на процессоре включается явно)
+DEVICES = ('auto', 'cpu', 'cuda', 'mps')
+DTYPES = ('auto', 'fp32', 'fp16', 'bf16')
+DEFAULT_RUNTIME = {'device': 'auto', 'dtype': 'auto', 'channels_last': True, 'compile': False, 'threads': None}
+COMPILE_CACHE = os.path.join('weights', 'compile_cache')
+
+_threads_configured = False
+
+
+def physical_cores():
+    try:
+        import psutil
+    except ImportError:
+        return os.cpu_count() or 1
+    return psutil.cpu_count(logical=False) or os.cpu_count() or 1
+
+
+def resolve_runtime(runtime=None):
+    # Возвращает настройки без 'auto': устройство в формате ultralytics ('cpu', 'cuda:0', 'mps') и точность
+    import torch
+
+    settings = dict(DEFAULT_RUNTIME, **(runtime or {}))
+    device, dtype = settings['device'], settings['dtype']
+    if device not in DEVICES and not device.startswith('cuda:'):
+        raise ValueError(f"Unknown device: {device}")
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown dtype: {dtype}")
+
+    if device == 'auto':
+        if torch.cuda.is_available():
+            device = 'cuda:0'
+        elif getattr(torch.backends, 'mps', None) is not None and torch.backends.mps.is_available():
+            device = 'mps'
+        else:
+            device = 'cpu'
+    elif device == 'cuda':
+        device = 'cuda:0'
+
+    if dtype == 'auto':
+        dtype = 'fp32' if device == 'cpu' else 'fp16'
+    elif dtype == 'fp16' and device == 'cpu':
+        logger.warning("fp16 is not supported on CPU, using fp32 (bf16 is available on CPU)")
+        dtype = 'fp32'
+    elif dtype == 'bf16' and device.startswith('cuda') and not torch.cuda.is_bf16_supported():
+        logger.warning("bf16 is not supported by %s, using fp16", torch.cuda.get_device_name(device))
+        dtype = 'fp16'
+
+    threads = settings['threads']
+    if threads is None and device == 'cpu':
+        threads = physical_cores()
+    return dict(settings, device=device, dtype=dtype, threads=threads)
+
+
+def configure_threads(threads):
+    # Число потоков задается один раз на процесс: после первого параллельного вызова torch не меняет interop-потоки
+    global _threads_configured
+    if threads is None or _threads_configured:
+        return
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    _threads_configured = True
+
+
+def to_float(output):
+    # Выходы модели под autocast возвращаются в fp32, чтобы NMS и извлечение вероятностей шли как обычно
+    import torch
+    if isinstance(output, torch.Tensor):
+        return output.float() if output.is_floating_point() else output
+    if isinstance(output, (list, tuple)):
+        return type(output)(to_float(item) for item in output)
+    if isinstance(output, dict):
+        return {key: to_float(value) for key, value in output.items()}
+    return output
+
+
+def prepare_model(model, settings):
+    # Применяется к каждой модели после загрузки и fuse(). Выгруженные ONNX/OpenVINO модели не меняются:
+    # их точность задается при выгрузке (export.py), устройство - аргументом predict
+    import torch
+
+    module = getattr(model, 'model', None)
+    if not isinstance(module, torch.nn.Module):
+        return model
+    module.to(settings['device']).eval()
+    if settings['channels_last']:
+        module.to(memory_format=torch.channels_last)
+
+    forward = module.forward
+    if settings['compile']:
+        # Скомпилированные графы сохраняются на диск и переиспользуются при следующих запусках
+        os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', os.path.abspath(COMPILE_CACHE))
+        os.environ.setdefault('TORCHINDUCTOR_FX_GRAPH_CACHE', '1')
+        try:
+            forward = torch.compile(forward, dynamic=True)
+        except Exception as e:
+            logger.warning("torch.compile is not available, running eagerly: %s", e)
+    if settings['dtype'] == 'bf16':
+        # Веса остаются в fp32 (ultralytics приводит модель к float при подготовке), свертки считаются в bf16
+        device_type = settings['device'].split(':')[0]
+        compiled = forward
+
+        def forward(*args, **kwargs):
+            with torch.autocast(device_type=device_type, dtype=torch.bfloat16):
+                return to_float(compiled(*args, **kwargs))
+    module.forward = forward
+    return model
+
+
+def predict_args(settings, model_path):
+    # Аргументы predict. fp16 для чекпойнтов PyTorch включает сам ultralytics (half=True)
+    if settings is None:
+        return {}
+    return {'device': settings['device'], 'half': model_path.endswith('.pt') and settings['dtype'] == 'fp16'}
+
+
+def inference_mode():
+    import torch
+    return torch.inference_mode()
+
+
+def describe(settings):
+    return (f"{settings['device']} {settings['dtype']}"
+            f"{' channels_last' if settings['channels_last'] else ''}{' compile' if settings['compile'] else ''}"
+            f"{' threads=' + str(settings['threads']) if settings['threads'] else ''}")
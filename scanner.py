@@ -0,0 +1,84 @@
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from cache import bytes_hash
+from preprocessing import LoadedImage, decode_image
+
+# Начала файлов форматов, которые умеет декодировать OpenCV
+IMAGE_SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'BM', b'II*\x00', b'MM\x00*')
+SCAN_WORKERS = 8
+PREFETCH_WORKERS = 4
+PREFETCH_DEPTH = 2
+
+logger = logging.getLogger(__name__)
+
+
+def is_image(file_path):
+    # Проверяем содержимое, а не расширение: камеры пишут .JPG, встречаются файлы без расширения
+    try:
+        with open(file_path, 'rb') as f:
+            header = f.read(12)
+    except OSError:
+        return False
+    return header.startswith(IMAGE_SIGNATURES) or (header[:4] == b'RIFF' and header[8:12] == b'WEBP')
+
+
+def same_folder_key(path):
+    return os.path.normcase(os.path.realpath(path))
+
+
+def scan_images(folder, recursive=True, exclude=(), workers=SCAN_WORKERS):
+    # Обходит дерево папок станций и дат через os.scandir. Заголовки файлов одной папки
+    # проверяются параллельно: на сетевых дисках время уходит на задержку каждого открытия.
+    # exclude - папки, в которые обход не заходит (папка результатов внутри исходной папки).
+    # Возвращает пути в порядке обхода, внутри папки - по имени
+    excluded = {same_folder_key(path) for path in exclude}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        folders = deque([folder])
+        while folders:
+            files, subfolders = [], []
+            with os.scandir(folders.popleft()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if same_folder_key(entry.path) not in excluded:
+                            subfolders.append(entry.path)
+                    elif entry.is_file():
+                        files.append(entry.path)
+            files.sort()
+            for file_path, valid in zip(files, executor.map(is_image, files)):
+                if valid:
+                    yield file_path
+            if recursive:
+                folders.extend(sorted(subfolders))
+
+
+def read_image(file_path, with_key=False):
+    # None - файл не читается или не декодируется (поврежден, удален во время обработки),
+    # такой файл пропускается, а не прерывает весь запуск
+    try:
+        data = np.fromfile(file_path, dtype=np.uint8)
+        image = decode_image(data, file_path)
+    except (OSError, ValueError) as e:
+        logger.warning("Skipping unreadable image %s: %s", file_path, e)
+        return None
+    key = bytes_hash(data.tobytes()) if with_key else None
+    return LoadedImage(file_path, image, key)
+
+
+def prefetch_batches(batches, with_key=False, depth=PREFETCH_DEPTH, workers=PREFETCH_WORKERS):
+    # Фоновые потоки читают и декодируют следующие depth батчей, пока текущий обрабатывается моделями.
+    # with_key - сразу считать хэш содержимого для кэша результатов, чтобы не читать файл повторно.
+    # На месте нечитаемых файлов в батче стоит None (см. EnsembleModel.skip_unreadable)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+    pending = deque()
+    try:
+        for batch in batches:
+            pending.append([executor.submit(read_image, file_path, with_key) for file_path in batch])
+            if len(pending) > depth:
+                yield [future.result() for future in pending.popleft()]
+        while pending:
+            yield [future.result() for future in pending.popleft()]
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
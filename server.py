@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+import numpy as np
+from cache import bytes_hash
+from parallel import predict_with_settings
+from preprocessing import LoadedImage, decode_image
+from telemetry import setup_logging
+from timing import StageTimer
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+MAX_BATCH = 32
+MAX_LATENCY = 0.02
+MAX_QUEUE = 256
+MAX_REQUEST_IMAGES = 256
+MAX_BODY_BYTES = 512 * 2 ** 20
+
+logger = logging.getLogger(__name__)
+
+
+def share_stats(stats, share):
+    # Статистика общего микробатча делится между запросами пропорционально числу изображений
+    result = {}
+    for name, values in stats.items():
+        if name == 'scores':
+            continue
+        result[name] = {key: value * share if isinstance(value, float) else int(round(value * share))
+                        for key, value in values.items()}
+    return result
+
+
+class Request:
+    def __init__(self, images, settings):
+        self.images = images
+        self.settings = settings
+        self.key = json.dumps(settings, sort_keys=True)
+        self.future = asyncio.get_running_loop().create_future()
+        self.received = time.perf_counter()
+
+
+class MicroBatcher:
+    # Объединяет одновременные запросы клиентов в один батч ансамбля. Батч отправляется, когда
+    # набралось max_batch изображений или первый запрос ждет дольше max_latency секунд.
+    # Очередь ограничена: при переполнении клиент получает 503 и повторяет запрос позже
+    def __init__(self, ensemble, max_batch=MAX_BATCH, max_latency=MAX_LATENCY, max_queue=MAX_QUEUE):
+        self.ensemble = ensemble
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.queue = asyncio.Queue(max_queue)
+        # Ансамбль не потокобезопасен, поэтому инференс идет в одном потоке
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference')
+        self.metrics = Counter()
+        self.timer = StageTimer()  # этапы ансамбля, время каждой модели и счетчики изображений
+
+    def submit(self, images, settings):
+        request = Request(images, settings)
+        self.queue.put_nowait(request)  # asyncio.QueueFull, если очередь заполнена
+        return request.future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            size = len(batch[0].images)
+            deadline = loop.time() + self.max_latency
+            while size < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(request)
+                size += len(request.images)
+
+            # Запросы с разными настройками (alpha, порог, каскад) не смешиваются
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.key, []).append(request)
+            for requests in groups.values():
+                await self.run_group(loop, requests)
+
+    async def run_group(self, loop, requests):
+        images = [image for request in requests for image in request.images]
+        try:
+            predictions, stats = await loop.run_in_executor(
+                self.executor, predict_with_settings, self.ensemble, images, requests[0].settings)
+        except Exception as e:
+            logger.exception("Inference failed for %d images", len(images))
+            self.metrics['errors'] += len(requests)
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+
+        self.metrics['batches'] += 1
+        self.metrics['batch_images'] += len(images)
+        self.timer.merge(stats['totals'], stats['counts'], stats['counters'])
+        self.metrics['cache_hits'] += stats['cache']['hits']
+        self.metrics['cache_misses'] += stats['cache']['misses']
+        start = 0
+        now = time.perf_counter()
+        for request in requests:
+            end = start + len(request.images)
+            request_stats = share_stats(stats, len(request.images) / len(images))
+            request_stats['scores'] = stats['scores'][start:end]
+            self.metrics['latency_seconds'] += now - request.received
+            if not request.future.done():
+                request.future.set_result((predictions[start:end], request_stats))
+            start = end
+
+    def metrics_text(self):
+        # Формат Prometheus
+        lines = []
+        for name in ('requests', 'images', 'rejected', 'errors', 'batches', 'batch_images', 'cache_hits', 'cache_misses'):
+            lines.append(f"# TYPE oleni_{name}_total counter")
+            lines.append(f"oleni_{name}_total {self.metrics[name]}")
+        lines.append("# TYPE oleni_request_latency_seconds_sum counter")
+        lines.append(f"oleni_request_latency_seconds_sum {self.metrics['latency_seconds']:.6f}")
+        lines.append("# TYPE oleni_queue_depth gauge")
+        lines.append(f"oleni_queue_depth {self.queue.qsize()}")
+        return "\n".join(lines) + "\n" + self.timer.prometheus()
+
+
+def decode_upload(item):
+    # Файл, который не декодируется, дает None, как при чтении по пути (см. EnsembleModel.skip_unreadable):
+    # в ответе на его месте null, остальные изображения запроса классифицируются
+    data = np.frombuffer(base64.b64decode(item['data']), dtype=np.uint8)
+    try:
+        image = decode_image(data, item.get('name', ''))
+    except ValueError as e:
+        logger.warning("Skipping unreadable upload: %s", e)
+        return None
+    return LoadedImage(item.get('name', ''), image, bytes_hash(data.tobytes()))
+
+
+class InferenceServer:
+    # Минимальный HTTP/1.1 сервер на asyncio:
+    #   POST /predict  {"paths": [...]} или {"images": [{"name", "data": base64}]}, "settings" - как у ParallelEnsemble
+    #   GET  /metrics  метрики в формате Prometheus
+    #   GET  /health
+    # Чтение файлов по путям клиента выключено, пока не заданы path_roots: иначе любой клиент
+    # мог бы прочитать любой файл сервера. Пути вне этих папок отклоняются с 403
+    def __init__(self, batcher, host=DEFAULT_HOST, port=DEFAULT_PORT, path_roots=()):
+        self.batcher = batcher
+        self.host = host
+        self.port = port
+        self.path_roots = [os.path.normcase(os.path.realpath(root)) for root in path_roots]
+        self.decoder = ThreadPoolExecutor(max_workers=4, thread_name_prefix='decode')
+
+    def path_allowed(self, path):
+        real = os.path.normcase(os.path.realpath(path))
+        for root in self.path_roots:
+            try:
+                if os.path.commonpath([real, root]) == root:
+                    return True
+            except ValueError:
+                # Разные диски в Windows
+                continue
+        return False
+
+    async def start(self):
+        # port=0 - свободный порт, фактический записывается в self.port
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        return server
+
+    async def serve(self):
+        server = await self.start()
+        logger.info("Serving on http://%s:%s", self.host, self.port)
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.batcher.run())
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_BYTES:
+                    await self.respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': 'body too large'})
+                    break
+                body = await reader.readexactly(length) if length else b''
+                status, payload, extra = await self.route(method, path, body)
+                await self.respond(writer, status, payload, extra)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if method == 'GET' and path == '/health':
+            return HTTPStatus.OK, {'status': 'ok'}, {}
+        if method == 'GET' and path == '/metrics':
+            return HTTPStatus.OK, self.batcher.metrics_text(), {}
+        if method != 'POST' or path != '/predict':
+            return HTTPStatus.NOT_FOUND, {'error': 'not found'}, {}
+
+        try:
+            request = json.loads(body)
+            if 'images' in request:
+                loop = asyncio.get_running_loop()
+                images = await asyncio.gather(*(loop.run_in_executor(self.decoder, decode_upload, item)
+                                                for item in request['images']))
+            else:
+                images = [str(path) for path in request['paths']]
+                if not self.path_roots:
+                    return HTTPStatus.FORBIDDEN, {'error': 'reading paths is disabled on this server, upload images'}, {}
+                denied = [path for path in images if not self.path_allowed(path)]
+                if denied:
+                    return HTTPStatus.FORBIDDEN, {'error': f'path outside allowed roots: {denied[0]}'}, {}
+            settings = request['settings']
+        except (KeyError, TypeError, ValueError) as e:
+            return HTTPStatus.BAD_REQUEST, {'error': str(e)}, {}
+        if not images:
+            return HTTPStatus.OK, {'predictions': [], 'stats': {}}, {}
+        if len(images) > MAX_REQUEST_IMAGES:
+            return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': f'at most {MAX_REQUEST_IMAGES} images per request'}, {}
+
+        try:
+            future = self.batcher.submit(images, settings)
+        except asyncio.QueueFull:
+            self.batcher.metrics['rejected'] += 1
+            return HTTPStatus.SERVICE_UNAVAILABLE, {'error': 'queue is full'}, {'Retry-After': '1'}
+        self.batcher.metrics['requests'] += 1
+        self.batcher.metrics['images'] += len(images)
+        try:
+            predictions, stats = await future
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}, {}
+        return HTTPStatus.OK, {'predictions': predictions, 'stats': stats}, {}
+
+    async def respond(self, writer, status, payload, extra=None):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(payload, ensure_ascii=False).encode(), 'application/json'
+        head = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Type: {content_type}", f"Content-Length: {len(body)}"]
+        head.extend(f"{name}: {value}" for name, value in (extra or {}).items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сервер классификации: один загруженный ансамбль для нескольких рабочих мест')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help='изображений в микробатче')
+    parser.add_argument('--max-latency-ms', type=float, default=MAX_LATENCY * 1000, help='ожидание добора батча')
+    parser.add_argument('--max-queue', type=int, default=MAX_QUEUE, help='запросов в очереди до отказа 503')
+    parser.add_argument('--path-root', action='append', default=[], metavar='FOLDER',
+                        help='разрешить клиентам передавать пути к файлам внутри папки (общий диск), можно несколько раз')
+    parser.add_argument('--backend', choices=['pt', 'onnx', 'openvino'], default='pt')
+    parser.add_argument('--precision', choices=['fp32', 'fp16', 'int8'], default='fp32')
+    parser.add_argument('--device', choices=['auto', 'cpu', 'cuda', 'mps'], default='auto')
+    parser.add_argument('--dtype', choices=['auto', 'fp32', 'fp16', 'bf16'], default='auto',
+                        help='точность вычислений моделей .pt (auto: fp16 на GPU, fp32 на процессоре)')
+    parser.add_argument('--no-channels-last', action='store_true')
+    parser.add_argument('--compile', action='store_true', help='torch.compile с кэшем в weights/compile_cache')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO')
+    parser.add_argument('--log-format', choices=['text', 'json'], default='text')
+    args = parser.parse_args()
+    setup_logging(args.log_level, args.log_format == 'json')
+
+    from session import EnsembleSession
+    from runtime import describe
+    runtime = {'device': args.device, 'dtype': args.dtype, 'channels_last': not args.no_channels_last,
+               'compile': args.compile}
+    ensemble = EnsembleSession(backend=args.backend, precision=args.precision, runtime=runtime).get_ensemble()
+    logger.info("Inference runtime: %s", describe(ensemble.runtime))
+
+    async def run():
+        batcher = MicroBatcher(ensemble, args.max_batch, args.max_latency_ms / 1000, args.max_queue)
+        await InferenceServer(batcher, args.host, args.port, args.path_root).serve()
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+import os
+import time
+from cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_ENTRIES, ResultCache
+from ensemble import EnsembleModel
+from parallel import ParallelEnsemble, default_threads_per_worker
+from remote import RemoteEnsemble
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def process_rss():
+    if psutil is None:
+        return None
+    return psutil.Process(os.getpid()).memory_info().rss
+
+
+def model_memory(model):
+    # Размер весов и буферов модели в байтах
+    module = getattr(model, 'model', None)
+    if module is None or not hasattr(module, 'parameters'):
+        return None
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+class ModelRegistry:
+    def __init__(self):
+        self.models = {}
+        self.stats = {}
+
+    def get(self, model_path, loader):
+        if model_path not in self.models:
+            rss_before = process_rss()
+            start = time.perf_counter()
+            model = loader(model_path)
+            load_time = time.perf_counter() - start
+            rss_after = process_rss()
+
+            self.models[model_path] = model
+            self.stats[model_path] = {
+                'load_time': load_time,
+                'weights_bytes': model_memory(model),
+                'rss_delta_bytes': rss_after - rss_before if rss_before is not None else None,
+            }
+        return self.models[model_path]
+
+    def clear(self):
+        self.models.clear()
+        self.stats.clear()
+
+    def report(self):
+        lines = []
+        for model_path, stats in self.stats.items():
+            weights_mb = f"{stats['weights_bytes'] / 2 ** 20:.1f} MB" if stats['weights_bytes'] is not None else "n/a"
+            rss_mb = f"{stats['rss_delta_bytes'] / 2 ** 20:.1f} MB" if stats['rss_delta_bytes'] is not None else "n/a"
+            lines.append(f"{os.path.basename(model_path):<32}load {stats['load_time']:>7.2f} s  weights {weights_mb:>10}  rss +{rss_mb:>10}")
+        return "\n".join(lines)
+
+
+class EnsembleSession:
+    # Держит загруженный ансамбль между запусками классификации.
+    # Веса загружаются при первом обращении, alpha и порог меняются без перезагрузки.
+    # cache_path=None отключает кэш результатов.
+    # server_url - использовать ансамбль сервера классификации (server.py) вместо локальных моделей.
+    # runtime - устройство, точность и channels_last для моделей (см. runtime.DEFAULT_RUNTIME)
+    def __init__(self, alpha=0.5, confidence=0.7, backend='pt', precision='fp32',
+                 cache_path=DEFAULT_CACHE_PATH, cache_max_entries=DEFAULT_MAX_ENTRIES, cache_max_bytes=None,
+                 server_url=None, upload=False, runtime=None):
+        self.alpha = alpha
+        self.confidence = confidence
+        self.backend = backend
+        self.precision = precision
+        self.runtime = dict(runtime or {})
+        self.cascade_threshold = None
+        self.cascade_metric = 'margin'
+        self.prefilter_confidence = None
+        self.fusion = {}
+        self.cache_options = None
+        if cache_path is not None:
+            self.cache_options = {'path': cache_path, 'max_entries': cache_max_entries, 'max_bytes': cache_max_bytes}
+        self.server_url = server_url
+        self.upload = upload
+        self.registry = ModelRegistry()
+        self.ensemble = None
+        self.pool = None
+
+    def get_ensemble(self, alpha=None, confidence=None):
+        self.configure(alpha, confidence)
+        if self.ensemble is None and self.server_url is not None:
+            self.ensemble = RemoteEnsemble(self.server_url, alpha=self.alpha, confidence=self.confidence, upload=self.upload)
+            self.ensemble.set_cascade(self.cascade_threshold, self.cascade_metric)
+            self.ensemble.set_prefilter(self.prefilter_confidence)
+            self.ensemble.set_fusion(**self.fusion)
+        if self.ensemble is None:
+            self.ensemble = EnsembleModel(alpha=self.alpha, confidence=self.confidence, registry=self.registry,
+                                          backend=self.backend, precision=self.precision, runtime=self.runtime)
+            self.ensemble.set_cascade(self.cascade_threshold, self.cascade_metric)
+            self.ensemble.set_prefilter(self.prefilter_confidence)
+            self.ensemble.set_fusion(**self.fusion)
+            if self.cache_options is not None:
+                self.ensemble.cache = ResultCache(fingerprint=self.ensemble.fingerprint(), **self.cache_options)
+        return self.ensemble
+
+    def get_pool(self, workers, threads_per_worker=None, alpha=None, confidence=None):
+        # Пул процессов тоже переиспользуется, пока не изменится число процессов или потоков.
+        # С сервером классификации пул не нужен: запросы разных клиентов объединяет сервер
+        if self.server_url is not None:
+            return self.get_ensemble(alpha, confidence)
+        self.configure(alpha, confidence)
+        threads_per_worker = threads_per_worker or default_threads_per_worker(workers)
+        if self.pool is not None and (self.pool.workers, self.pool.threads_per_worker) != (workers, threads_per_worker):
+            self.close()
+        if self.pool is None:
+            self.pool = ParallelEnsemble(workers, threads_per_worker, alpha=self.alpha, confidence=self.confidence,
+                                         backend=self.backend, precision=self.precision, cache_options=self.cache_options,
+                                         runtime=self.runtime)
+            self.pool.set_cascade(self.cascade_threshold, self.cascade_metric)
+            self.pool.set_prefilter(self.prefilter_confidence)
+            self.pool.set_fusion(**self.fusion)
+        return self.pool
+
+    def configure(self, alpha=None, confidence=None):
+        if alpha is not None:
+            self.alpha = alpha
+        if confidence is not None:
+            self.confidence = confidence
+        if self.ensemble is not None:
+            self.ensemble.configure(alpha=self.alpha, confidence=self.confidence)
+        if self.pool is not None:
+            self.pool.configure(alpha=self.alpha, confidence=self.confidence)
+
+    def set_cascade(self, threshold, metric='margin'):
+        # threshold=None - всегда полный ансамбль
+        self.cascade_threshold = threshold
+        self.cascade_metric = metric
+        for predictor in (self.ensemble, self.pool):
+            if predictor is not None:
+                predictor.set_cascade(threshold, metric)
+
+    def set_prefilter(self, confidence):
+        # confidence=None - предфильтр пустых кадров выключен
+        self.prefilter_confidence = confidence
+        for predictor in (self.ensemble, self.pool):
+            if predictor is not None:
+                predictor.set_prefilter(confidence)
+
+    def set_fusion(self, rule='mean', detector_weights=None, classifier_weights=None, temperatures=None):
+        # Правило объединения моделей ансамбля и их веса, веса не перезагружаются
+        self.fusion = {'rule': rule, 'detector_weights': detector_weights,
+                       'classifier_weights': classifier_weights, 'temperatures': temperatures}
+        for predictor in (self.ensemble, self.pool):
+            if predictor is not None:
+                predictor.set_fusion(**self.fusion)
+
+    def set_backend(self, backend, precision='fp32'):
+        # Смена среды выполнения требует загрузки других файлов весов
+        if (backend, precision) != (self.backend, self.precision):
+            self.backend = backend
+            self.precision = precision
+            self.reload()
+
+    def set_runtime(self, **runtime):
+        # Устройство и точность задаются при подготовке моделей, поэтому их смена тоже перезагружает веса
+        runtime = dict(self.runtime, **runtime)
+        if runtime != self.runtime:
+            self.runtime = runtime
+            self.reload()
+
+    def reload(self):
+        # Принудительная перезагрузка весов, например после замены файлов в weights/
+        self.registry.clear()
+        self.close()
+
+    def close(self):
+        if self.ensemble is not None and self.ensemble.cache is not None:
+            self.ensemble.cache.close()
+        if self.ensemble is not None and self.server_url is not None:
+            self.ensemble.close()
+        self.ensemble = None
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def evict_cache(self):
+        if self.ensemble is not None and self.ensemble.cache is not None:
+            self.ensemble.cache.evict()
+
+    def report(self, predictor=None):
+        lines = [self.registry.report()] if self.registry.stats else []
+        if predictor is not None and self.cache_options is not None:
+            counters = predictor.cache_counters()
+            lines.append(f"cache: {counters['hits']} hits, {counters['misses']} misses")
+        if predictor is not None:
+            lines.extend(line for line in (predictor.cascade_report(), predictor.prefilter_report()) if line)
+        return "\n".join(lines)
+
+
+_default_session = None
+
+
+def get_default_session():
+    global _default_session
+    if _default_session is None:
+        _default_session = EnsembleSession()
+    return _default_session
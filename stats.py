@@ -0,0 +1,71 @@
+import os
+from collections import Counter, defaultdict
+from output import flat_name
+from writer import read_done
+
+
+def path_groups(img_name):
+    # Станция и дата по относительному пути станция/дата/файл, '' если вложенности нет
+    parts = img_name.replace('\\', '/').split('/')
+    station = parts[0] if len(parts) > 1 else ''
+    date = parts[1] if len(parts) > 2 else ''
+    return station, date
+
+
+class ClassStats:
+    # Число изображений по папкам классов в памяти. Обновляется по результатам классификации
+    # и ручным перемещениям, папки сканируются только один раз при открытии результатов
+    def __init__(self):
+        self.counts = Counter()
+        self.files = set()  # (класс, имя файла в папке класса)
+        self.groups = {}  # имя файла в папке класса -> (станция, дата)
+        self.by_group = Counter()  # (станция, дата, класс) -> число изображений
+
+    def load(self, classified_folder_path, class_names):
+        # Файлы считаются по папкам классов (с учетом ручных перемещений), а станция и дата -
+        # по исходным относительным путям из result.csv, так как имена в папках классов плоские
+        self.counts.clear()
+        self.files.clear()
+        self.groups.clear()
+        self.by_group.clear()
+        img_names = {flat_name(img_name): img_name
+                     for img_name in read_done(os.path.join(classified_folder_path, 'result.csv'))}
+        for class_name in class_names:
+            path = os.path.join(classified_folder_path, class_name)
+            if os.path.isdir(path):
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            self.add(class_name, entry.name, img_names.get(entry.name))
+
+    def add(self, class_name, dest_name, img_name=None):
+        # Повторная запись того же файла в ту же папку (перезапуск без продолжения) не меняет счетчики
+        if (class_name, dest_name) in self.files:
+            return
+        if img_name is not None or dest_name not in self.groups:
+            self.groups[dest_name] = path_groups(img_name or dest_name)
+        station, date = self.groups[dest_name]
+        self.files.add((class_name, dest_name))
+        self.counts[class_name] += 1
+        self.by_group[(station, date, class_name)] += 1
+
+    def remove(self, class_name, dest_name):
+        if (class_name, dest_name) not in self.files:
+            return
+        station, date = self.groups.get(dest_name, ('', ''))
+        self.files.discard((class_name, dest_name))
+        self.counts[class_name] -= 1
+        self.by_group[(station, date, class_name)] -= 1
+
+    def move(self, dest_name, from_class, to_class):
+        self.remove(from_class, dest_name)
+        self.add(to_class, dest_name)
+
+    def breakdown(self, by='station'):
+        # {станция или дата: Counter(класс -> число)}
+        position = 0 if by == 'station' else 1
+        result = defaultdict(Counter)
+        for key, count in self.by_group.items():
+            if count:
+                result[key[position]][key[2]] += count
+        return dict(result)
@@ -0,0 +1,75 @@
+import cProfile
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Этапы StageTimer, сгруппированные для отчетов и панели скорости
+STAGE_GROUPS = {
+    'decode': ('decode', 'resize', 'crop', 'bursts'),
+    'inference': ('detection', 'classification', 'remote'),
+    'fusion': ('fusion',),
+    'io': ('copy', 'write', 'cache'),
+}
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+def group_stages(summary):
+    groups = {group: sum(summary[name]['total'] for name in names if name in summary)
+              for group, names in STAGE_GROUPS.items()}
+    return {'groups': groups, 'stages': summary}
+
+
+class TextFormatter(logging.Formatter):
+    # Поля из extra={'fields': {...}} дописываются к сообщению как key=value
+    def format(self, record):
+        message = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            message += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        return message
+
+
+class JsonFormatter(logging.Formatter):
+    # Одна JSON-строка на запись, для сбора логов с серверов
+    def format(self, record):
+        entry = {'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)),
+                 'level': record.levelname, 'logger': record.name, 'message': record.getMessage()}
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level='INFO', json_format=False, stream=None):
+    # Вызывается точкой входа до импорта ultralytics: YOLO_VERBOSE читается при импорте
+    os.environ.setdefault('YOLO_VERBOSE', 'False')
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if json_format else TextFormatter(LOG_FORMAT))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    # Собственные сообщения ultralytics о каждом вызове predict не нужны даже в режиме DEBUG
+    logging.getLogger('ultralytics').setLevel(logging.WARNING)
+
+
+@contextmanager
+def profiled(path=None):
+    # cProfile для потока, в котором выполняется блок. path=None - профилирование выключено.
+    # Результат открывается через python -m pstats или snakeviz
+    if path is None:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
+        logger.info("Profile saved to %s", path)
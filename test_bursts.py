@@ -0,0 +1,81 @@
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+
+from bursts import BurstClassifier, pack_bursts
+from timing import StageTimer
+
+
+class StubPool:
+    # Как ParallelEnsemble: predict_batches забирает следующие батчи, не дожидаясь результатов предыдущих.
+    # Класс кадра - число в имени файла перед расширением
+    def __init__(self, depth=2):
+        self.depth = depth
+        self.timer = StageTimer()
+        self.last_scores = []
+        self.in_flight = []
+        self.single_calls = []
+
+    def classify(self, file_paths):
+        self.last_scores = [{'uncertainty': {'confidence': 0.9}} for _ in file_paths]
+        return [int(file_path.rsplit('_', 1)[1].split('.')[0]) for file_path in file_paths]
+
+    def predict_batches(self, batches):
+        pending = []
+        for file_paths in batches:
+            pending.append(file_paths)
+            if len(pending) >= self.depth:
+                self.in_flight.append(len(pending))
+                yield self.classify(pending.pop(0))
+        while pending:
+            self.in_flight.append(len(pending))
+            yield self.classify(pending.pop(0))
+
+    def predict_batch(self, file_paths):
+        self.single_calls.append(list(file_paths))
+        return self.classify(file_paths)
+
+
+def test_representatives_are_pipelined_and_spread():
+    # Серия a - кадры одного класса, в серии b представительные кадры расходятся
+    bursts = [[f'a{index}_0.jpg' for index in range(4)],
+              ['b0_1.jpg', 'b1_1.jpg', 'b2_2.jpg', 'b3_2.jpg'],
+              ['c0_2.jpg'],
+              ['d0_0.jpg', 'd1_0.jpg']]
+    pool = StubPool()
+    classifier = BurstClassifier(pool, bursts)
+    batches = pack_bursts(bursts, 4)
+    assert len(batches) == 3
+
+    results = []
+    for file_paths, predictions in zip(batches, classifier.predict_batches(batches)):
+        results.append((file_paths, predictions, classifier.last_scores))
+
+    assert pool.in_flight[0] == 2
+    # Вне общего потока досчитываются только кадры серии b, не попавшие в представительные
+    assert pool.single_calls == [['b0_1.jpg', 'b2_2.jpg']]
+
+    (a_paths, a_predictions, a_scores), (b_paths, b_predictions, _), (_, cd_predictions, cd_scores) = results
+    assert a_predictions == [0, 0, 0, 0]
+    assert sum('propagated_from' in scores for scores in a_scores) == 2
+    assert all(scores['event'] == 'a0_0.jpg' for scores in a_scores)
+    assert b_predictions == [1, 1, 2, 2]
+    assert cd_predictions == [2, 0, 0]
+    assert [scores['event'] for scores in cd_scores] == ['c0_2.jpg', 'd0_0.jpg', 'd0_0.jpg']
+    assert pool.timer.counters['bursts'] == 4
+    assert pool.timer.counters['burst_propagated'] == 2
+
+
+def test_unreadable_representative_classifies_the_rest():
+    class WithUnreadable(StubPool):
+        def classify(self, file_paths):
+            self.last_scores = [None if 'bad' in path else {} for path in file_paths]
+            return [None if 'bad' in path else 1 for path in file_paths]
+
+    pool = WithUnreadable()
+    burst = ['y_1.jpg', 'x_bad.jpg', 'z_1.jpg']
+    classifier = BurstClassifier(pool, [burst], count=1)
+    assert classifier.predict_batch(burst) == [1, None, 1]
+    assert classifier.last_scores[1] is None
+    assert pool.single_calls == [['y_1.jpg', 'z_1.jpg']]
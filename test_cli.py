@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+pytest.importorskip('ultralytics')
+
+import cli
+import session
+from test_unreadable import StubRegistry, make_folder
+
+
+@pytest.fixture
+def photos(tmp_path, monkeypatch):
+    monkeypatch.setattr(session, 'ModelRegistry', StubRegistry)
+    folder = tmp_path / 'photos'
+    folder.mkdir()
+    make_folder(folder)
+    return folder
+
+
+def test_text_report_without_info_logging(photos, capsys):
+    assert cli.main([str(photos), '--no-cache', '--device', 'cpu']) == 0
+    out = capsys.readouterr().out
+    assert out.startswith('Classified 3 images')
+    assert 'Placed files: copy 2' in out
+    assert 'Stages:' in out
+    assert 'decode' in out
+
+
+def test_failure_exits_non_zero(photos, tmp_path, capsys):
+    output = tmp_path / 'output'
+    output.write_text('')
+    assert cli.main([str(photos), '--no-cache', '--device', 'cpu', '--output', str(output)]) == 1
+    assert 'Classification failed' in capsys.readouterr().err
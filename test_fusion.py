@@ -0,0 +1,119 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from fusion import detection_probs, fuse_models, stack_probs, uncertainty_scores
+
+NUM_CLASSES = 5
+CONFIDENCE = 0.25
+
+
+# Поштучная реализация до векторизации (boxes_to_probs и probs_from_raw из ensemble.py), эталон для сравнения
+def reference_boxes_to_probs(boxes, num_classes, confidence):
+    class_probs = []
+    for conf, cls in boxes[:, :2]:
+        if conf > confidence:
+            prob = np.zeros(num_classes)
+            prob[int(cls)] = conf
+            class_probs.append(prob)
+    return np.mean(class_probs, axis=0) if class_probs else np.zeros(num_classes)
+
+
+def reference_detection(raw, num_classes, confidence):
+    return np.array([
+        np.mean([reference_boxes_to_probs(boxes, num_classes, confidence) for boxes in image_raw if boxes is not None],
+                axis=0)
+        for image_raw in raw
+    ])
+
+
+def reference_classification(raw):
+    return np.array([np.mean([probs for probs in image_raw if probs is not None], axis=0) for image_raw in raw])
+
+
+def random_boxes(rng, count):
+    boxes = np.zeros((count, 6), dtype=np.float32)
+    boxes[:, 0] = rng.random(count)
+    boxes[:, 1] = rng.integers(0, NUM_CLASSES, count)
+    boxes[:, 2:] = rng.random((count, 4)) * 640
+    return boxes
+
+
+def random_raw(rng, num_images, num_models, make):
+    # В каскадном режиме часть моделей не запускается (None), но хотя бы одна модель есть у каждого кадра
+    raw = []
+    for _ in range(num_images):
+        present = rng.random(num_models) > 0.3
+        present[rng.integers(num_models)] = True
+        raw.append([make() if flag else None for flag in present])
+    return raw
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_detection_matches_per_image_loop(seed):
+    rng = np.random.default_rng(seed)
+    raw = random_raw(rng, 32, 2, lambda: random_boxes(rng, int(rng.integers(0, 8))))
+    probs, mask = detection_probs(raw, 2, NUM_CLASSES, CONFIDENCE)
+    np.testing.assert_allclose(fuse_models(probs, mask), reference_detection(raw, NUM_CLASSES, CONFIDENCE), atol=1e-6)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_classification_matches_per_image_loop(seed):
+    rng = np.random.default_rng(seed)
+    raw = random_raw(rng, 32, 3, lambda: rng.dirichlet(np.ones(NUM_CLASSES)).astype(np.float32))
+    probs, mask = stack_probs(raw, 3, NUM_CLASSES)
+    np.testing.assert_allclose(fuse_models(probs, mask), reference_classification(raw), atol=1e-6)
+
+
+def test_ensemble_matches_per_image_loop():
+    rng = np.random.default_rng(42)
+    alpha = 0.3
+    boxes = random_raw(rng, 16, 2, lambda: random_boxes(rng, int(rng.integers(0, 8))))
+    clf = random_raw(rng, 16, 3, lambda: rng.dirichlet(np.ones(NUM_CLASSES)))
+    od_probs = fuse_models(*detection_probs(boxes, 2, NUM_CLASSES, CONFIDENCE))
+    clf_probs = fuse_models(*stack_probs(clf, 3, NUM_CLASSES))
+    fused = alpha * od_probs + (1 - alpha) * clf_probs
+
+    for image in range(16):
+        expected = (alpha * reference_detection([boxes[image]], NUM_CLASSES, CONFIDENCE)[0]
+                    + (1 - alpha) * reference_classification([clf[image]])[0])
+        np.testing.assert_allclose(fused[image], expected, atol=1e-6)
+        assert fused[image].argmax() == expected.argmax()
+
+
+def test_boxes_below_threshold_are_ignored():
+    boxes = np.array([[0.2, 1, 0, 0, 1, 1], [0.9, 2, 0, 0, 1, 1], [0.7, 2, 0, 0, 1, 1]], dtype=np.float32)
+    probs, mask = detection_probs([[boxes, np.zeros((0, 6), dtype=np.float32)]], 2, NUM_CLASSES, CONFIDENCE)
+    assert mask.tolist() == [[True, True]]
+    np.testing.assert_allclose(probs[0, 0], [0, 0, 0.8, 0, 0], atol=1e-6)
+    np.testing.assert_allclose(probs[0, 1], np.zeros(NUM_CLASSES))
+
+
+def test_uncertainty_full_agreement():
+    ensemble = np.array([[0.1, 0.7, 0.2]])
+    models = np.array([[[0.0, 0.9, 0.1], [0.2, 0.6, 0.2], [0.1, 0.8, 0.1]]])
+    scores = uncertainty_scores(ensemble, models, np.ones((1, 3), dtype=bool))
+    np.testing.assert_allclose(scores['max_prob'], [0.7])
+    np.testing.assert_allclose(scores['margin'], [0.5])
+    np.testing.assert_allclose(scores['agreement'], [1.0])
+    np.testing.assert_allclose(scores['confidence'], [0.7])
+
+
+def test_uncertainty_disagreement_and_non_voting_models():
+    # Вероятности ансамбля нормируются; детектор без рамок (нулевой вектор) и незапускавшаяся модель не голосуют
+    ensemble = np.array([[0.2, 0.6, 0.2]])
+    models = np.array([[[0.0, 0.0, 0.0], [0.1, 0.8, 0.1], [0.7, 0.2, 0.1], [0.0, 0.9, 0.1]]])
+    mask = np.array([[True, True, True, False]])
+    scores = uncertainty_scores(ensemble, models, mask)
+    np.testing.assert_allclose(scores['max_prob'], [0.6])
+    np.testing.assert_allclose(scores['margin'], [0.4])
+    np.testing.assert_allclose(scores['agreement'], [0.5])
+    np.testing.assert_allclose(scores['confidence'], [0.3])
+
+
+def test_uncertainty_empty_frame():
+    # Без голосующих моделей согласие считается полным, уверенность - нулевая
+    scores = uncertainty_scores(np.zeros((1, 3)), np.zeros((1, 2, 3)), np.ones((1, 2), dtype=bool))
+    np.testing.assert_allclose(scores['agreement'], [1.0])
+    np.testing.assert_allclose(scores['confidence'], [0.0])
+    np.testing.assert_allclose(scores['margin'], [0.0])
@@ -0,0 +1,51 @@
+import csv
+
+from review import LOW_CONFIDENCE_FOLDER, rethreshold
+from writer import REVIEW_COLUMNS, CorrectionLog, load_corrections
+
+
+def make_output(folder, rows):
+    # rows - (имя файла, папка класса, оценка confidence, папка, где файл лежит сейчас)
+    with open(folder / 'review.csv', 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, REVIEW_COLUMNS)
+        writer.writeheader()
+        for file_name, class_folder, confidence, _ in rows:
+            writer.writerow({'img_name': file_name, 'dest_name': file_name, 'class_folder': class_folder,
+                             'confidence': confidence, 'max_prob': confidence, 'margin': confidence, 'agreement': 1.0})
+    for class_folder in ('Олень', 'Кабарга', 'Косуля', LOW_CONFIDENCE_FOLDER):
+        (folder / class_folder).mkdir()
+    for file_name, _, _, current in rows:
+        (folder / current / file_name).write_bytes(b'')
+
+
+def log_corrections(folder, entries):
+    log = CorrectionLog(str(folder))
+    for file_name, from_class, to_class, undo in entries:
+        log.write([file_name], from_class, to_class, undo)
+    log.close()
+
+
+def test_undo_cancels_the_last_move(tmp_path):
+    log_corrections(tmp_path, [
+        ('a.jpg', 'Олень', 'Косуля', False),
+        ('a.jpg', 'Косуля', 'Кабарга', False),
+        ('a.jpg', 'Кабарга', 'Косуля', True),
+        ('b.jpg', 'Олень', 'Косуля', False),
+        ('b.jpg', 'Косуля', 'Олень', True),
+        ('c.jpg', 'Олень', LOW_CONFIDENCE_FOLDER, False),
+    ])
+    assert load_corrections(str(tmp_path)) == {'a.jpg': 'Косуля'}
+
+
+def test_rethreshold_moves_file_after_undone_correction(tmp_path):
+    # Файл из 'Низкая уверенность' перенесли в 'Олень' и отменили перенос: он снова подчиняется порогу
+    make_output(tmp_path, [('a.jpg', 'Олень', 0.3, LOW_CONFIDENCE_FOLDER), ('b.jpg', 'Олень', 0.3, 'Косуля')])
+    log_corrections(tmp_path, [
+        ('a.jpg', LOW_CONFIDENCE_FOLDER, 'Олень', False),
+        ('a.jpg', 'Олень', LOW_CONFIDENCE_FOLDER, True),
+        ('b.jpg', LOW_CONFIDENCE_FOLDER, 'Косуля', False),
+    ])
+    moved = rethreshold(str(tmp_path), 0.2)
+    assert moved == {(LOW_CONFIDENCE_FOLDER, 'Олень'): 1}
+    assert (tmp_path / 'Олень' / 'a.jpg').exists()
+    assert (tmp_path / 'Косуля' / 'b.jpg').exists()
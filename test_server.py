@@ -0,0 +1,123 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('cv2')
+
+from parallel import EnsembleClient
+from server import InferenceServer, MicroBatcher
+
+SETTINGS = EnsembleClient().settings(crops=False)
+
+
+class StubEnsemble(EnsembleClient):
+    # Вместо моделей возвращает имена файлов; release позволяет задержать инференс батча
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def predict_batch(self, images):
+        self.batches.append(len(images))
+        self.started.set()
+        self.release.wait(10)
+        with self.timer.stage('detection'):
+            time.sleep(0.001)
+        self.last_scores = [{} for _ in images]
+        return [image.rsplit('/', 1)[-1] for image in images]
+
+
+async def http(port, method, path, payload=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Length: {len(body)}\r\n"
+                 f"Connection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines[1:])
+    return int(lines[0].split(' ')[1]), headers, body.decode()
+
+
+def predict(port, root, names):
+    return http(port, 'POST', '/predict', {'paths': [f"{root}/{name}" for name in names], 'settings': SETTINGS})
+
+
+def run_server(test, tmp_path, **options):
+    async def main():
+        ensemble = StubEnsemble()
+        batcher = MicroBatcher(ensemble, **options)
+        app = InferenceServer(batcher, '127.0.0.1', 0, path_roots=[str(tmp_path)])
+        server = await app.start()
+        runner = asyncio.create_task(batcher.run())
+        try:
+            await test(app.port, ensemble, batcher)
+        finally:
+            ensemble.release.set()
+            runner.cancel()
+            server.close()
+            await server.wait_closed()
+            batcher.executor.shutdown(wait=True)
+            app.decoder.shutdown(wait=True)
+    asyncio.run(main())
+
+
+def test_concurrent_requests_share_one_batch(tmp_path):
+    async def test(port, ensemble, batcher):
+        responses = await asyncio.gather(*(predict(port, tmp_path, [f'{client}_{index}.jpg' for index in range(2)])
+                                           for client in range(4)))
+        assert ensemble.batches == [8]
+        for client, (status, _, body) in enumerate(responses):
+            assert status == 200
+            assert json.loads(body)['predictions'] == [f'{client}_0.jpg', f'{client}_1.jpg']
+    run_server(test, tmp_path, max_batch=8, max_latency=1.0)
+
+
+def test_full_queue_is_rejected_with_retry_after(tmp_path):
+    async def test(port, ensemble, batcher):
+        ensemble.release.clear()
+        first = asyncio.create_task(predict(port, tmp_path, ['a.jpg']))
+        await asyncio.get_running_loop().run_in_executor(None, ensemble.started.wait, 10)
+        second = asyncio.create_task(predict(port, tmp_path, ['b.jpg']))
+        while batcher.queue.qsize() < 1:
+            await asyncio.sleep(0.01)
+
+        status, headers, _ = await predict(port, tmp_path, ['c.jpg'])
+        assert status == 503
+        assert headers['Retry-After'] == '1'
+
+        ensemble.release.set()
+        assert [(await task)[0] for task in (first, second)] == [200, 200]
+        assert batcher.metrics['rejected'] == 1
+    run_server(test, tmp_path, max_batch=1, max_latency=0.01, max_queue=1)
+
+
+def test_metrics(tmp_path):
+    async def test(port, ensemble, batcher):
+        await predict(port, tmp_path, ['a.jpg', 'b.jpg'])
+        status, headers, body = await http(port, 'GET', '/metrics')
+        assert status == 200
+        assert headers['Content-Type'].startswith('text/plain')
+        assert 'oleni_requests_total 1' in body
+        assert 'oleni_images_total 2' in body
+        assert 'oleni_batches_total 1' in body
+        assert 'oleni_stage_seconds_total{stage="detection"}' in body
+    run_server(test, tmp_path)
+
+
+def test_paths_outside_roots_are_forbidden(tmp_path):
+    async def test(port, ensemble, batcher):
+        status, _, _ = await http(port, 'POST', '/predict', {'paths': ['/etc/passwd'], 'settings': SETTINGS})
+        assert status == 403
+        status, _, _ = await predict(port, tmp_path, ['../outside.jpg'])
+        assert status == 403
+        assert ensemble.batches == []
+    run_server(test, tmp_path)
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip('numpy')
+cv2 = pytest.importorskip('cv2')
+pytest.importorskip('ultralytics')
+
+import parallel
+from classifier import classify_images
+from ensemble import EnsembleModel
+from parallel import EnsembleClient
+from server import InferenceServer, MicroBatcher
+from session import EnsembleSession, ModelRegistry
+from writer import read_done
+
+GOOD_IMAGES = ['a.jpg', 'c.jpg']
+CORRUPT_IMAGE = 'b.jpg'
+
+
+class Array:
+    # Вместо тензора torch: результаты ultralytics читаются через .cpu().numpy()
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=np.float32)
+
+    def cpu(self):
+        return self
+
+    float = detach = cpu
+
+    def numpy(self):
+        return self.values
+
+
+class StubYolo:
+    # Детектор находит одного оленя, классификатор уверен в классе 'Олень'
+    names = {0: 'deer', 1: 'musk_deer', 2: 'roe_deer'}
+    overrides = {'imgsz': 32}
+
+    def __init__(self, task):
+        self.task = task
+
+    def predict(self, images, **kwargs):
+        if self.task == 'detect':
+            boxes = SimpleNamespace(conf=Array([0.9]), cls=Array([0]), xyxy=Array([[100, 100, 500, 400]]))
+            return [SimpleNamespace(boxes=boxes) for _ in images]
+        return [SimpleNamespace(probs=SimpleNamespace(data=Array([0.9, 0.05, 0.05]))) for _ in images]
+
+
+class StubRegistry(ModelRegistry):
+    def get(self, model_path, loader):
+        return StubYolo('classify' if '-cls' in model_path else 'detect')
+
+
+class InProcessPool(EnsembleClient):
+    # Батчи идут через ту же функцию, что и в процессах ParallelEnsemble
+    def _run(self, batches, crops):
+        for file_paths in batches:
+            yield self._merge(*parallel._predict_batch(list(file_paths), self.settings(crops)))
+
+    def predict_batches(self, batches):
+        return self._run(batches, crops=False)
+
+
+def stub_ensemble():
+    return EnsembleModel(registry=StubRegistry(), runtime={'device': 'cpu'})
+
+
+@contextmanager
+def running_server(root):
+    ready = threading.Event()
+    state = {}
+
+    async def main():
+        batcher = MicroBatcher(stub_ensemble())
+        app = InferenceServer(batcher, '127.0.0.1', 0, path_roots=[root])
+        server = await app.start()
+        runner = asyncio.create_task(batcher.run())
+        state.update(port=app.port, loop=asyncio.get_running_loop(), stop=asyncio.Event())
+        ready.set()
+        await state['stop'].wait()
+        runner.cancel()
+        server.close()
+        await server.wait_closed()
+        batcher.executor.shutdown(wait=True)
+        app.decoder.shutdown(wait=True)
+
+    thread = threading.Thread(target=asyncio.run, args=(main(),))
+    thread.start()
+    ready.wait(10)
+    try:
+        yield f"http://127.0.0.1:{state['port']}"
+    finally:
+        state['loop'].call_soon_threadsafe(state['stop'].set)
+        thread.join()
+
+
+def make_folder(folder):
+    rng = np.random.default_rng(0)
+    for name in GOOD_IMAGES:
+        cv2.imwrite(str(folder / name), rng.integers(0, 255, (48, 64, 3), dtype=np.uint8))
+    # Сигнатура JPEG проходит отбор при сканировании, но файл не декодируется
+    (folder / CORRUPT_IMAGE).write_bytes(b'\xff\xd8\xff\xe0' + b'\x00' * 64)
+
+
+@pytest.mark.parametrize('mode', ['prefetch', 'crops', 'workers', 'bursts', 'server', 'upload'])
+def test_corrupt_file_is_skipped(tmp_path, monkeypatch, mode):
+    source = tmp_path / 'photos'
+    source.mkdir()
+    make_folder(source)
+    output = str(tmp_path / 'classified')
+    options = {'crop_classify': mode == 'crops', 'bursts': mode == 'bursts'}
+
+    if mode in ('server', 'upload'):
+        with running_server(str(source)) as url:
+            session = EnsembleSession(cache_path=None, server_url=url, upload=mode == 'upload')
+            classify_images(str(source), output, 0.7, session=session, **options)
+            session.close()
+    else:
+        session = EnsembleSession(cache_path=None, runtime={'device': 'cpu'})
+        session.registry = StubRegistry()
+        if mode == 'workers':
+            monkeypatch.setattr(parallel, '_worker_ensemble', stub_ensemble(), raising=False)
+            pool = InProcessPool()
+            monkeypatch.setattr(session, 'get_pool', lambda *args, **kwargs: pool)
+            options['workers'] = 2
+        classify_images(str(source), output, 0.7, session=session, **options)
+
+    assert read_done(os.path.join(output, 'result.csv')) == set(GOOD_IMAGES)
+    assert sorted(os.listdir(os.path.join(output, 'Олень'))) == GOOD_IMAGES
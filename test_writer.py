@@ -0,0 +1,58 @@
+import csv
+
+from writer import RESULT_COLUMNS, ResultWriter, open_csv, read_done
+
+
+def result_row(img_name, cls):
+    return {'img_name': img_name, 'file_path': img_name, 'class': cls, 'dest_path': '', 'seconds': 0.1, 'probs': {}}
+
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return [(row['img_name'], row['class']) for row in csv.DictReader(f)]
+
+
+def test_resume_drops_torn_result_row(tmp_path):
+    # Сбой во время записи оставил строку b.jpg без перевода строки: изображение не готово и классифицируется заново
+    (tmp_path / 'result.csv').write_bytes(b'img_name,class\na.jpg,1\nb.jpg,2')
+    writer = ResultWriter(str(tmp_path), resume=True)
+    assert writer.done == {'a.jpg'}
+    writer.write([result_row('b.jpg', 2)])
+    writer.close()
+    assert read_rows(tmp_path / 'result.csv') == [('a.jpg', '1'), ('b.jpg', '2')]
+
+
+def test_resume_drops_torn_row_longer_than_chunk(tmp_path):
+    long_name = 'x' * 100000 + '.jpg'
+    (tmp_path / 'result.csv').write_bytes(b'img_name,class\na.jpg,1\n' + long_name.encode())
+    writer = ResultWriter(str(tmp_path), resume=True)
+    assert writer.done == {'a.jpg'}
+    writer.close()
+    assert (tmp_path / 'result.csv').read_bytes() == b'img_name,class\na.jpg,1\n'
+
+
+def test_resume_keeps_complete_file(tmp_path):
+    (tmp_path / 'result.csv').write_bytes(b'img_name,class\r\na.jpg,1\r\nb.jpg,2\r\n')
+    writer = ResultWriter(str(tmp_path), resume=True)
+    assert writer.done == {'a.jpg', 'b.jpg'}
+    writer.write([result_row('c.jpg', 0)])
+    writer.close()
+    assert read_rows(tmp_path / 'result.csv') == [('a.jpg', '1'), ('b.jpg', '2'), ('c.jpg', '0')]
+
+
+def test_torn_header_starts_new_file(tmp_path):
+    path = tmp_path / 'result.csv'
+    path.write_bytes(b'img_na')
+    f, writer = open_csv(str(path), RESULT_COLUMNS, resume=True)
+    writer.writerow({'img_name': 'a.jpg', 'class': 1})
+    f.close()
+    assert read_done(str(path)) == {'a.jpg'}
+    assert read_rows(path) == [('a.jpg', '1')]
+
+
+def test_without_resume_file_is_rewritten(tmp_path):
+    (tmp_path / 'result.csv').write_bytes(b'img_name,class\na.jpg,1\n')
+    writer = ResultWriter(str(tmp_path))
+    assert writer.done == set()
+    writer.close()
+    assert read_rows(tmp_path / 'result.csv') == []
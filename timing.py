@@ -0,0 +1,76 @@
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+
+class StageTimer:
+    # Время и число вызовов по этапам. Этапы вида 'model:<файл весов>' вложены в detection/classification
+    # и не учитываются в долях отчета. counters - счетчики событий (изображения, файлы, строки)
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.counters = Counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[name] += time.perf_counter() - start
+            self.counts[name] += 1
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def merge(self, totals, counts, counters=None):
+        # Добавляет замеры, сделанные в другом процессе
+        for name, total in totals.items():
+            self.totals[name] += total
+            self.counts[name] += counts.get(name, 0)
+        self.counters.update(counters or {})
+
+    def reset(self):
+        self.totals.clear()
+        self.counts.clear()
+        self.counters.clear()
+
+    def summary(self):
+        return {
+            name: {
+                'total': total,
+                'count': self.counts[name],
+                'mean': total / self.counts[name] if self.counts[name] else 0.0,
+            }
+            for name, total in self.totals.items()
+        }
+
+    def report(self):
+        overall = sum(total for name, total in self.totals.items() if ':' not in name)
+        lines = []
+        for name, stats in self.summary().items():
+            share = stats['total'] / overall * 100 if overall and ':' not in name else 0.0
+            lines.append(f"{name:<16}{stats['total']:>10.3f} s{stats['count']:>8}x{stats['mean'] * 1000:>10.1f} ms{share:>7.1f} %")
+        return "\n".join(lines)
+
+    def prometheus(self, prefix='oleni'):
+        # Текстовый формат Prometheus. 'model:<имя>' становится меткой model, счетчики 'имя:<метка>' - меткой name
+        stages = [(name, name) for name in sorted(self.totals) if not name.startswith('model:')]
+        models = [(name, name[len('model:'):]) for name in sorted(self.totals) if name.startswith('model:')]
+        lines = []
+        for group, label in ((stages, 'stage'), (models, 'model')):
+            if not group:
+                continue
+            lines.append(f"# TYPE {prefix}_{label}_seconds_total counter")
+            lines.extend(f'{prefix}_{label}_seconds_total{{{label}="{value}"}} {self.totals[name]:.6f}' for name, value in group)
+            lines.append(f"# TYPE {prefix}_{label}_calls_total counter")
+            lines.extend(f'{prefix}_{label}_calls_total{{{label}="{value}"}} {self.counts[name]}' for name, value in group)
+        metrics = {}
+        for name in sorted(self.counters):
+            metric, _, label = name.partition(':')
+            metrics.setdefault(metric, []).append((label, self.counters[name]))
+        for metric, values in metrics.items():
+            lines.append(f"# TYPE {prefix}_{metric}_total counter")
+            lines.extend(f'{prefix}_{metric}_total{{name="{label}"}} {value}' if label else f"{prefix}_{metric}_total {value}"
+                         for label, value in values)
+        return "\n".join(lines) + "\n"
@@ -1,14 +1,24 @@
+import logging
 import os
-import shutil
 from PyQt6.QtWidgets import (
     QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QPushButton,
     QListWidget, QLabel, QFileDialog, QGraphicsView, QGraphicsScene,
-    QListWidgetItem, QMessageBox, QSlider, QSpinBox, QApplication
+    QListWidgetItem, QMessageBox, QSlider, QSpinBox, QApplication, QProgressBar, QCheckBox
 )
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QPixmap, QIcon, QFont
+from PyQt6.QtCore import Qt, QThread, QThreadPool, QSize
+from PyQt6.QtGui import QPixmap, QIcon, QFont, QKeySequence, QShortcut
 from PyQt6.QtCharts import QChart, QChartView, QPieSeries, QBarSeries, QBarSet, QBarCategoryAxis, QValueAxis
-from classifier import classify_images
+from classifier import class_folders, CLASS_FOLDERS, DEFAULT_BATCH_SIZE, DEFAULT_PREFILTER_CONFIDENCE, EMPTY_FOLDER
+from gallery import GalleryModel, GalleryView
+from preview import PreviewLoader
+from relabel import MoveSignals, MoveTask
+from review import DEFAULT_REVIEW_THRESHOLD, group_moves, plan_rethreshold
+from session import EnsembleSession
+from stats import ClassStats
+from worker import ClassificationWorker
+from writer import CorrectionLog
+
+logger = logging.getLogger(__name__)
 
 class ImageClassifierApp(QMainWindow):
     def __init__(self):
@@ -16,7 +26,23 @@ class ImageClassifierApp(QMainWindow):
         self.current_folder = None
         self.classified_folder_path = None
         self.button_active = False
-        self.confidence_threshold = 0.5  # Default confidence threshold
+        self.confidence_threshold = 0.7  # порог уверенности рамок детекторов
+        self.review_threshold = DEFAULT_REVIEW_THRESHOLD  # кадры с меньшей оценкой идут в 'Низкая уверенность'
+        # Модели загружаются один раз за сеанс. OLENI_SERVER_URL - использовать общий сервер классификации,
+        # OLENI_SERVER_UPLOAD=1 - передавать серверу файлы, а не пути
+        self.session = EnsembleSession(confidence=self.confidence_threshold, server_url=os.environ.get('OLENI_SERVER_URL'),
+                                       upload=os.environ.get('OLENI_SERVER_UPLOAD') == '1')
+        self.classification_thread = None
+        self.classification_worker = None
+        self.interrupted_run = None  # (исходная папка, папка вывода) остановленной классификации
+        self.undo_stack = []  # ручные перемещения для отмены по Ctrl+Z
+        self.rethreshold_progress = None  # {'pending': операций в работе, 'moved': перемещено} пересортировки по порогу
+        self.corrections = None
+        self.corrections_folder = None
+        self.move_pool = QThreadPool(self)
+        self.move_pool.setMaxThreadCount(1)  # перемещения выполняются по порядку
+        self.move_signals = MoveSignals()
+        self.move_signals.finished.connect(self.on_move_finished)
         self.initUI()
 
         icon = QIcon("134073936.png")
@@ -43,6 +69,31 @@ class ImageClassifierApp(QMainWindow):
         self.classify_button.clicked.connect(self.classify_images)
         left_panel.addWidget(self.classify_button)
 
+        self.prefilter_checkbox = QCheckBox('Отсеивать кадры без животных')
+        left_panel.addWidget(self.prefilter_checkbox)
+
+        self.bursts_checkbox = QCheckBox('Классифицировать серии кадров целиком')
+        left_panel.addWidget(self.bursts_checkbox)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        left_panel.addWidget(self.progress_bar)
+
+        self.progress_label = QLabel()
+        self.progress_label.setVisible(False)
+        left_panel.addWidget(self.progress_label)
+
+        # Скорость за последние батчи и доли этапов обработки
+        self.throughput_label = QLabel()
+        self.throughput_label.setFont(QFont('Consolas', 9))
+        self.throughput_label.setVisible(False)
+        left_panel.addWidget(self.throughput_label)
+
+        self.cancel_button = QPushButton('Остановить')
+        self.cancel_button.clicked.connect(self.cancel_classification)
+        self.cancel_button.setVisible(False)
+        left_panel.addWidget(self.cancel_button)
+
         self.folder_list = QListWidget(self)
         self.folder_list.setSelectionMode(QListWidget.SelectionMode.SingleSelection)
         self.folder_list.itemClicked.connect(self.load_selected_folder)
@@ -53,9 +104,15 @@ class ImageClassifierApp(QMainWindow):
         # Middle Panel
         middle_layout = QVBoxLayout()
 
-        self.file_list = QListWidget()
-        self.file_list.setViewMode(QListWidget.ViewMode.ListMode)
-        self.file_list.itemClicked.connect(self.show_image)
+        # Миниатюры строятся по мере прокрутки и сохраняются в кэше на диске
+        self.file_model = GalleryModel(self.default_image_icon, parent=self)
+        self.file_list = GalleryView()
+        self.file_list.setModel(self.file_model)
+        self.file_list.setSelectionMode(GalleryView.SelectionMode.ExtendedSelection)
+        self.file_list.clicked.connect(self.show_image)
+        # Переход по изображениям стрелками тоже открывает просмотр
+        self.file_list.selectionModel().currentChanged.connect(self.on_current_file_changed)
+        self.file_list.selectionModel().selectionChanged.connect(lambda *_: self.update_buttons_state())
         middle_layout.addWidget(self.file_list)
 
         button_layout = QHBoxLayout()
@@ -74,11 +131,21 @@ class ImageClassifierApp(QMainWindow):
 
         middle_layout.addLayout(button_layout)
 
+        # 1/2/3 - переместить выделенные изображения в класс, Ctrl+Z - отменить последнее перемещение
+        for key, button in (('1', self.deer_button), ('2', self.musk_deer_button), ('3', self.roe_deer_button)):
+            QShortcut(QKeySequence(key), self, activated=lambda button=button: button.isEnabled() and button.click())
+        QShortcut(QKeySequence.StandardKey.Undo, self, activated=self.undo_move)
+
         self.image_preview = QGraphicsView()
         self.scene = QGraphicsScene()
         self.image_preview.setScene(self.scene)
         middle_layout.addWidget(self.image_preview)
 
+        # Просмотр декодируется в фоне в размере экрана, соседние изображения загружаются заранее
+        self.preview_path = None
+        self.preview_loader = PreviewLoader(parent=self)
+        self.preview_loader.ready.connect(self.on_preview_ready)
+
         confidence_layout = QVBoxLayout()
         confidence_label = QLabel("Уровень уверенности:")
         confidence_layout.addWidget(confidence_label)
@@ -93,6 +160,17 @@ class ImageClassifierApp(QMainWindow):
         self.confidence_spinbox.valueChanged.connect(self.update_confidence_threshold)
         confidence_layout.addWidget(self.confidence_spinbox)
 
+        # Порог ручной проверки меняет только раскладку файлов и применяется к готовым результатам без инференса
+        confidence_layout.addWidget(QLabel("Порог ручной проверки:"))
+        self.review_spinbox = QSpinBox()
+        self.review_spinbox.setRange(0, 100)
+        self.review_spinbox.setValue(int(self.review_threshold * 100))
+        self.review_spinbox.valueChanged.connect(self.update_review_threshold)
+        confidence_layout.addWidget(self.review_spinbox)
+        self.review_button = QPushButton('Применить к результатам')
+        self.review_button.clicked.connect(self.apply_review_threshold)
+        confidence_layout.addWidget(self.review_button)
+
         middle_layout.addLayout(confidence_layout)
 
         main_layout.addLayout(middle_layout, 2)
@@ -109,6 +187,9 @@ class ImageClassifierApp(QMainWindow):
         self.pie_chart_view = QChartView()
         right_panel.addWidget(self.pie_chart_view)
 
+        self.stats = ClassStats()
+        self.init_charts()
+
         # Predefined folders panel
         predefined_panel = QVBoxLayout()
 
@@ -193,38 +274,37 @@ class ImageClassifierApp(QMainWindow):
             self.folder_list.setCurrentRow(0)
             self.load_selected_folder(self.folder_list.currentItem())
 
-    def show_image(self, item):
-        image_name = item.text()
+    def show_image(self, index):
+        image_name = self.file_model.file_name(index)
         if self.current_folder:
-            image_path = os.path.join(self.current_folder, image_name)
-
-            pixmap = QPixmap(image_path)
-            if pixmap.isNull():
-                QMessageBox.warning(self, "Ошибка", "Не удалось загрузить изображение.")
-                return
-
             screen_geometry = QApplication.primaryScreen().geometry()
-            max_width, max_height = int(screen_geometry.width() * 0.8), int(screen_geometry.height() * 0.8)
-            scaled_pixmap = pixmap.scaled(max_width, max_height, Qt.AspectRatioMode.KeepAspectRatio)
-
-            self.scene.clear()
-            self.scene.addPixmap(scaled_pixmap)
-            self.image_preview.fitInView(self.scene.itemsBoundingRect(), Qt.AspectRatioMode.KeepAspectRatio)
+            self.preview_loader.set_max_size(QSize(int(screen_geometry.width() * 0.8), int(screen_geometry.height() * 0.8)))
+            self.preview_path = os.path.join(self.current_folder, image_name)
+            self.preview_loader.request(self.preview_path)
+            neighbours = [self.file_model.index(row) for row in (index.row() + 1, index.row() - 1)
+                          if 0 <= row < self.file_model.rowCount()]
+            self.preview_loader.prefetch([self.file_model.file_path(neighbour) for neighbour in neighbours])
         else:
             QMessageBox.warning(self, "Предупреждение", "Пожалуйста, выберите папку")
 
+    def on_current_file_changed(self, current, previous):
+        if current.isValid():
+            self.show_image(current)
+
+    def on_preview_ready(self, image_path, image):
+        if image_path != self.preview_path:
+            return
+        if image.isNull():
+            QMessageBox.warning(self, "Ошибка", "Не удалось загрузить изображение.")
+            return
+
+        self.scene.clear()
+        self.scene.addPixmap(QPixmap.fromImage(image))
+        self.image_preview.fitInView(self.scene.itemsBoundingRect(), Qt.AspectRatioMode.KeepAspectRatio)
+
     def load_icons(self, folder_path):
-        self.file_list.clear()
         self.current_folder = folder_path
-        image_files = [f for f in os.listdir(folder_path) if f.endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp'))]
-
-        if image_files:
-            for image_file in image_files:
-                item = QListWidgetItem(self.default_image_icon, image_file)
-                self.file_list.addItem(item)
-        else:
-            item = QListWidgetItem(self.default_image_icon, "No images found")
-            self.file_list.addItem(item)
+        self.file_model.set_folder(folder_path)
 
     def select_folder(self):
         folder_path = QFileDialog.getExistingDirectory(self, 'Выберите папку', options=QFileDialog.Option.DontUseNativeDialog)
@@ -234,12 +314,28 @@ class ImageClassifierApp(QMainWindow):
     def load_selected_folder(self, item):
         folder_path = item.text()
         self.load_icons(folder_path)
+        self.open_results(folder_path)
         if "Низкая уверенность" in folder_path:
             self.button_active = True
         else:
             self.button_active = False
         self.update_buttons_state()
 
+    def open_results(self, folder_path):
+        # Готовые результаты (сама папка classified или исходная папка с ней внутри) открываются
+        # без повторной классификации: папки классов и статистика берутся из result.csv и папок классов
+        if self.classification_worker is not None:
+            return
+        for path in (folder_path, os.path.join(folder_path, 'classified')):
+            if os.path.exists(os.path.join(path, 'result.csv')):
+                break
+        else:
+            return
+        self.classified_folder_path = path
+        self.update_predefined_folders(class_folders(path, os.path.isdir(os.path.join(path, EMPTY_FOLDER))))
+        self.stats.load(path, CLASS_FOLDERS)
+        self.show_statistics()
+
     def load_predefined_folder(self, item):
         folder_path = item.text()
         self.load_icons(folder_path)
@@ -252,10 +348,79 @@ class ImageClassifierApp(QMainWindow):
             return
 
         self.classified_folder_path = os.path.join(classified_folder, 'classified')
-        classified_folders = classify_images(self.current_folder, self.classified_folder_path, self.confidence_threshold)
+        prefilter = self.prefilter_checkbox.isChecked()
+        self.update_predefined_folders(class_folders(self.classified_folder_path, prefilter))
+        # Повторный запуск после остановки продолжает с того места, где обработка прервалась
+        resume = self.interrupted_run == (self.current_folder, self.classified_folder_path)
+        self.stats.load(self.classified_folder_path, CLASS_FOLDERS)
+        self.show_statistics()
+
+        # Классификация выполняется в отдельном потоке, результаты приходят по батчам
+        self.classification_thread = QThread(self)
+        self.classification_worker = ClassificationWorker(
+            self.current_folder, self.classified_folder_path, self.confidence_threshold, self.session,
+            batch_size=DEFAULT_BATCH_SIZE, prefilter_confidence=DEFAULT_PREFILTER_CONFIDENCE if prefilter else None,
+            resume=resume, review_threshold=self.review_threshold, bursts=self.bursts_checkbox.isChecked())
+        self.classification_worker.moveToThread(self.classification_thread)
+        self.classification_thread.started.connect(self.classification_worker.run)
+        self.classification_worker.batch_ready.connect(self.on_classification_batch)
+        self.classification_worker.progress.connect(self.on_classification_progress)
+        self.classification_worker.throughput.connect(self.on_classification_throughput)
+        self.classification_worker.finished.connect(self.on_classification_finished)
+        self.classification_worker.finished.connect(self.classification_thread.quit)
+        self.classification_thread.finished.connect(self.classification_worker.deleteLater)
+
+        self.classify_button.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.progress_label.setText('Загрузка моделей...')
+        self.progress_label.setVisible(True)
+        self.cancel_button.setEnabled(True)
+        self.cancel_button.setVisible(True)
+        self.classification_thread.start()
+
+    def cancel_classification(self):
+        if self.classification_worker is not None:
+            self.classification_worker.cancel()
+            self.cancel_button.setEnabled(False)
+            self.progress_label.setText('Остановка после текущего батча...')
+
+    def on_classification_batch(self, results):
+        # Новые файлы сразу появляются в открытой папке класса
+        self.file_model.append([result['dest_name'] for result in results if self.current_folder == result['dest_path']])
+        for result in results:
+            self.stats.add(os.path.basename(result['dest_path']), result['dest_name'], result['img_name'])
+        self.show_statistics()
+
+    def on_classification_progress(self, done, total, images_per_second, eta):
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(done)
+        minutes, seconds = divmod(int(eta), 60)
+        self.progress_label.setText(f'{done}/{total}  {images_per_second:.1f} изобр./с  осталось {minutes}:{seconds:02d}')
+
+    def on_classification_throughput(self, recent_images_per_second, groups):
+        overall = sum(groups.values())
+        names = {'decode': 'чтение', 'inference': 'модели', 'fusion': 'объединение', 'io': 'запись'}
+        lines = [f'сейчас {recent_images_per_second:.1f} изобр./с']
+        lines.extend(f'{names[group]:<12}{seconds / overall * 100 if overall else 0.0:>5.0f} %'
+                     for group, seconds in groups.items())
+        self.throughput_label.setText('\n'.join(lines))
+        self.throughput_label.setVisible(True)
+
+    def on_classification_finished(self, classified_folders, cancelled):
+        self.interrupted_run = (self.classification_worker.current_folder,
+                                self.classification_worker.classified_folder_path) if cancelled else None
+        self.classification_worker = None
+        self.classify_button.setEnabled(True)
+        self.cancel_button.setVisible(False)
+        self.progress_bar.setVisible(False)
+        self.progress_label.setVisible(False)
+        self.throughput_label.setVisible(False)
         if classified_folders:
             self.update_predefined_folders(classified_folders)
             self.show_statistics()
+            if cancelled:
+                QMessageBox.information(self, "Остановлено", "Классификация остановлена пользователем.")
         else:
             QMessageBox.warning(self, "Ошибка", "Не удалось классифицировать изображения.")
 
@@ -266,68 +431,119 @@ class ImageClassifierApp(QMainWindow):
             self.predefined_folder_list.addItem(item)
 
     def move_image_to_class(self, class_name):
-        selected_items = self.file_list.selectedItems()
+        # Перемещает все выделенные файлы. Список и счетчики меняются сразу,
+        # сами файлы переносятся в фоне, ошибки возвращают файлы обратно в список
+        selected_indexes = self.file_list.selectedIndexes()
+        if not (selected_indexes and self.current_folder and self.classified_folder_path):
+            return
+        from_class = os.path.basename(self.current_folder)
+        target = os.path.join(self.classified_folder_path, class_name)
+        if os.path.normpath(target) == os.path.normpath(self.current_folder):
+            return
+        file_names = [self.file_model.file_name(index) for index in selected_indexes]
+        operation = {'files': file_names, 'source': self.current_folder, 'target': target,
+                     'from_class': from_class, 'to_class': class_name, 'undo': False}
+        self.start_move(operation)
+
+    def undo_move(self):
+        if not self.undo_stack:
+            return
+        operation = self.undo_stack.pop()
+        self.start_move({'files': operation['files'], 'source': operation['target'], 'target': operation['source'],
+                         'from_class': operation['to_class'], 'to_class': operation['from_class'], 'undo': True,
+                         'automatic': operation.get('automatic', False)})
+
+    def start_move(self, operation):
+        if os.path.normpath(operation['source']) == os.path.normpath(self.current_folder):
+            self.file_model.remove(operation['files'])
+        for file_name in operation['files']:
+            self.preview_loader.discard(os.path.join(operation['source'], file_name))
+            self.stats.move(file_name, operation['from_class'], operation['to_class'])
         self.show_statistics()
-        if selected_items and self.current_folder and self.classified_folder_path:
-            file_name = selected_items[0].text()
-            file_path = os.path.join(self.current_folder, file_name)
-            dest_path = os.path.join(self.classified_folder_path, class_name, file_name)
-            if os.path.exists(file_path):
-                shutil.move(file_path, dest_path)
-                self.load_icons(self.current_folder)
-            else:
-                QMessageBox.warning(self, "Ошибка", f"Файл не найден: {file_path}")
+        self.move_pool.start(MoveTask(operation, self.move_signals))
+
+    def on_move_finished(self, operation, moved, errors):
+        # Пересортировка по порогу проверки - не ручное исправление и в corrections.csv не попадает
+        if not operation.get('automatic'):
+            self.correction_log().write(moved, operation['from_class'], operation['to_class'], operation['undo'])
+        # Отменить можно только то, что действительно перемещено
+        if moved and not operation['undo']:
+            self.undo_stack.append(dict(operation, files=moved))
+        if os.path.normpath(operation['target']) == os.path.normpath(self.current_folder):
+            self.file_model.append(moved)
+        if errors:
+            # Неперемещенные файлы остаются в исходной папке
+            failed = [file_name for file_name in operation['files'] if file_name not in set(moved)]
+            for file_name in failed:
+                self.stats.move(file_name, operation['to_class'], operation['from_class'])
+            if os.path.normpath(operation['source']) == os.path.normpath(self.current_folder):
+                self.file_model.append(failed)
+            self.show_statistics()
+            QMessageBox.warning(self, "Ошибка", "Не удалось переместить файлы:\n" + "\n".join(errors[:10]))
+        if operation.get('automatic') and not operation['undo'] and self.rethreshold_progress is not None:
+            # Итог пересортировки показывается, когда завершились все ее перемещения
+            self.rethreshold_progress['pending'] -= 1
+            self.rethreshold_progress['moved'] += len(moved)
+            if not self.rethreshold_progress['pending']:
+                moved_total = self.rethreshold_progress['moved']
+                self.rethreshold_progress = None
+                QMessageBox.information(self, "Порог проверки", f"Перемещено файлов: {moved_total}")
+
+    def correction_log(self):
+        if self.corrections is None or self.corrections_folder != self.classified_folder_path:
+            if self.corrections is not None:
+                self.corrections.close()
+            self.corrections = CorrectionLog(self.classified_folder_path)
+            self.corrections_folder = self.classified_folder_path
+        return self.corrections
+
+    def init_charts(self):
+        # Графики создаются один раз, show_statistics только обновляет значения
+        self.bar_set = QBarSet('Classified Images')
+        for _ in CLASS_FOLDERS:
+            self.bar_set.append(0)
+        bar_series = QBarSeries()
+        bar_series.append(self.bar_set)
+
+        bar_chart = QChart()
+        bar_chart.addSeries(bar_series)
+        bar_chart.setTitle('Image Classification Statistics')
+
+        axisX = QBarCategoryAxis()
+        axisX.append(CLASS_FOLDERS)
+        bar_chart.addAxis(axisX, Qt.AlignmentFlag.AlignBottom)
+        bar_series.attachAxis(axisX)
+
+        self.bar_axis_y = QValueAxis()
+        self.bar_axis_y.setRange(0, 1)
+        bar_chart.addAxis(self.bar_axis_y, Qt.AlignmentFlag.AlignLeft)
+        bar_series.attachAxis(self.bar_axis_y)
+
+        self.bar_chart_view.setChart(bar_chart)
+
+        pie_series = QPieSeries()
+        self.pie_slices = [pie_series.append(class_name, 0) for class_name in CLASS_FOLDERS]
+
+        pie_chart = QChart()
+        pie_chart.addSeries(pie_series)
+        pie_chart.setTitle('Image Classification Distribution')
+
+        self.pie_chart_view.setChart(pie_chart)
 
     def show_statistics(self):
         try:
-            deer_count = len(os.listdir(os.path.join(self.classified_folder_path, 'Олень')))
-            musk_deer_count = len(os.listdir(os.path.join(self.classified_folder_path, 'Кабарга')))
-            roe_deer_count = len(os.listdir(os.path.join(self.classified_folder_path, 'Косуля')))
-            uncertain_count = len(os.listdir(os.path.join(self.classified_folder_path, 'Низкая уверенность')))
-
-            # Bar chart
-            bar_set = QBarSet('Classified Images')
-            bar_set << deer_count << musk_deer_count << roe_deer_count << uncertain_count
-
-            series = QBarSeries()
-            series.append(bar_set)
-
-            bar_chart = QChart()
-            bar_chart.addSeries(series)
-            bar_chart.setTitle('Image Classification Statistics')
-
-            categories = ['Олень', 'Кабарга', 'Косуля', 'Низкая уверенность']
-            axisX = QBarCategoryAxis()
-            axisX.append(categories)
-            bar_chart.addAxis(axisX, Qt.AlignmentFlag.AlignBottom)
-            series.attachAxis(axisX)
-
-            axisY = QValueAxis()
-            axisY.setRange(0, max(deer_count, musk_deer_count, roe_deer_count, uncertain_count) + 1)
-            bar_chart.addAxis(axisY, Qt.AlignmentFlag.AlignLeft)
-            series.attachAxis(axisY)
-
-            self.bar_chart_view.setChart(bar_chart)
-
-            # Pie chart
-            pie_series = QPieSeries()
-            pie_series.append('Олень', deer_count)
-            pie_series.append('Кабарга', musk_deer_count)
-            pie_series.append('Косуля', roe_deer_count)
-            pie_series.append('Низкая уверенность', uncertain_count)
-
-            pie_chart = QChart()
-            pie_chart.addSeries(pie_series)
-            pie_chart.setTitle('Image Classification Distribution')
-
-            self.pie_chart_view.setChart(pie_chart)
-        except Exception as e:
-            print(f"Error during statistics display: {e}")
+            counts = [self.stats.counts[class_name] for class_name in CLASS_FOLDERS]
+            for index, (count, pie_slice) in enumerate(zip(counts, self.pie_slices)):
+                self.bar_set.replace(index, count)
+                pie_slice.setValue(count)
+            self.bar_axis_y.setRange(0, max(counts) + 1)
+        except Exception:
+            logger.exception("Error during statistics display")
 
     def update_buttons_state(self):
-        selected_items = self.file_list.selectedItems()
+        selected_indexes = self.file_list.selectedIndexes()
         buttons_enabled = self.button_active or (
-                    bool(selected_items) and self.current_folder == self.classified_folder_path)
+                    bool(selected_indexes) and self.current_folder == self.classified_folder_path)
 
         self.deer_button.setEnabled(buttons_enabled)
         self.musk_deer_button.setEnabled(buttons_enabled)
@@ -344,8 +560,27 @@ class ImageClassifierApp(QMainWindow):
             self.scene.clear()
             self.scene.addPixmap(pixmap)
             self.image_preview.fitInView(self.scene.itemsBoundingRect(), Qt.AspectRatioMode.KeepAspectRatio)
-        except Exception as e:
-            print(f"Error during image preview: {e}")
+        except Exception:
+            logger.exception("Error during image preview")
+
+    def update_review_threshold(self, value):
+        self.review_threshold = value / 100.0
+
+    def apply_review_threshold(self):
+        if (not self.classified_folder_path or self.classification_worker is not None
+                or self.rethreshold_progress is not None):
+            return
+        groups = group_moves(plan_rethreshold(self.classified_folder_path, self.review_threshold))
+        if not groups:
+            QMessageBox.information(self, "Порог проверки", "Перемещено файлов: 0")
+            return
+        # Число перемещенных файлов сообщает on_move_finished, когда фоновые перемещения завершатся
+        self.rethreshold_progress = {'pending': len(groups), 'moved': 0}
+        for (source, target), file_names in groups.items():
+            operation = {'files': file_names, 'source': os.path.join(self.classified_folder_path, source),
+                         'target': os.path.join(self.classified_folder_path, target),
+                         'from_class': source, 'to_class': target, 'undo': False, 'automatic': True}
+            self.start_move(operation)
 
     def update_confidence_threshold(self, value):
         self.confidence_threshold = value / 100.0
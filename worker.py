@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+from collections import deque
+from PyQt6.QtCore import QObject, pyqtSignal
+from classifier import classify_images, DEFAULT_BATCH_SIZE
+from telemetry import group_stages, profiled
+
+# Текущая скорость считается по последним батчам, а не с начала запуска
+THROUGHPUT_WINDOW = 10
+
+
+class ClassificationWorker(QObject):
+    # Выполняет classify_images в отдельном QThread и передает результаты в GUI по сигналам
+    batch_ready = pyqtSignal(list)
+    progress = pyqtSignal(int, int, float, float)  # обработано, всего, изображений/с, оставшееся время в секундах
+    throughput = pyqtSignal(float, dict)  # изображений/с за последние батчи, секунды по группам этапов (decode, inference, ...)
+    finished = pyqtSignal(list, bool)  # папки классов, была ли остановка пользователем
+
+    def __init__(self, current_folder, classified_folder_path, confidence_threshold, session, batch_size=DEFAULT_BATCH_SIZE,
+                 prefilter_confidence=None, resume=False, output_mode='copy', review_threshold=None,
+                 bursts=False):
+        super().__init__()
+        self.current_folder = current_folder
+        self.classified_folder_path = classified_folder_path
+        self.confidence_threshold = confidence_threshold
+        self.session = session
+        self.batch_size = batch_size
+        self.prefilter_confidence = prefilter_confidence
+        self.resume = resume
+        self.output_mode = output_mode
+        self.review_threshold = review_threshold
+        self.bursts = bursts
+        self._cancel_event = threading.Event()
+        self._start_time = None
+        self._recent = deque(maxlen=THROUGHPUT_WINDOW)
+
+    def cancel(self):
+        # Обработка остановится перед следующим батчем
+        self._cancel_event.set()
+
+    def run(self):
+        self._start_time = time.perf_counter()
+        self._recent.clear()
+        self._recent.append((self._start_time, 0))
+        # OLENI_PROFILE=<файл> - профиль cProfile потока классификации
+        try:
+            with profiled(os.environ.get('OLENI_PROFILE')):
+                folders = classify_images(
+                    self.current_folder, self.classified_folder_path, self.confidence_threshold,
+                    batch_size=self.batch_size, session=self.session,
+                    on_batch=self._on_batch, should_stop=self._cancel_event.is_set,
+                    prefilter_confidence=self.prefilter_confidence, resume=self.resume,
+                    output_mode=self.output_mode, review_threshold=self.review_threshold, bursts=self.bursts,
+                )
+        except Exception:
+            # Ошибка уже записана в лог classify_images, пустой список папок GUI показывает как ошибку
+            folders = []
+        self.finished.emit(folders, self._cancel_event.is_set())
+
+    def _on_batch(self, results, done, total):
+        elapsed = time.perf_counter() - self._start_time
+        images_per_second = done / elapsed if elapsed > 0 else 0.0
+        eta = (total - done) / images_per_second if images_per_second > 0 else 0.0
+        self.batch_ready.emit(results)
+        self.progress.emit(done, total, images_per_second, eta)
+
+        now = time.perf_counter()
+        self._recent.append((now, done))
+        start, start_done = self._recent[0]
+        recent = (done - start_done) / (now - start) if now > start else 0.0
+        predictor = self.session.ensemble
+        groups = group_stages(predictor.timer.summary())['groups'] if predictor is not None else {}
+        self.throughput.emit(recent, groups)
@@ -0,0 +1,242 @@
+import csv
+import json
+import os
+import sqlite3
+import time
+
+DETAIL_FORMATS = ('csv', 'sqlite', 'parquet')
+RESULT_COLUMNS = ['img_name', 'class']
+DETAIL_COLUMNS = ['img_name', 'file_path', 'class', 'dest_path', 'seconds', 'probs']
+ANIMAL_COLUMNS = ['img_name', 'class', 'confidence', 'x1', 'y1', 'x2', 'y2']
+EVENT_COLUMNS = ['event', 'frames', 'inferred', 'class']
+REVIEW_COLUMNS = ['img_name', 'dest_name', 'class_folder', 'confidence', 'max_prob', 'margin', 'agreement']
+PARQUET_PART_ROWS = 5000
+LOW_CONFIDENCE_FOLDER = 'Низкая уверенность'
+
+
+def open_csv(path, columns, resume):
+    # При продолжении дописываем в существующий файл, отбрасывая строку, оборванную при сбое
+    if resume and os.path.exists(path) and os.path.getsize(path):
+        with open(path, 'rb+') as f:
+            end = f.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                # Ищем последний перевод строки с конца файла, не читая файл целиком
+                start = max(0, position - 65536)
+                f.seek(start)
+                chunk = f.read(position - start)
+                newline = chunk.rfind(b'\n')
+                if newline != -1:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position != end:
+                f.truncate(position)
+        if position:
+            f = open(path, 'a', newline='', encoding='utf-8')
+            return f, csv.DictWriter(f, columns)
+    f = open(path, 'w', newline='', encoding='utf-8')
+    writer = csv.DictWriter(f, columns)
+    writer.writeheader()
+    return f, writer
+
+
+def sync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def read_done(path):
+    # Имена изображений, уже записанных в result.csv
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline='', encoding='utf-8') as f:
+        return {row['img_name'] for row in csv.DictReader(f) if row.get('class')}
+
+
+class CsvDetails:
+    def __init__(self, output_folder, resume):
+        self.file, self.writer = open_csv(os.path.join(output_folder, 'details.csv'), DETAIL_COLUMNS, resume)
+
+    def write(self, rows):
+        # Возвращает True, когда все переданные до сих пор строки уже на диске
+        self.writer.writerows(rows)
+        sync(self.file)
+        return True
+
+    def close(self):
+        self.file.close()
+
+
+class SqliteDetails:
+    def __init__(self, output_folder, resume):
+        self.connection = sqlite3.connect(os.path.join(output_folder, 'details.sqlite'))
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS details (img_name TEXT PRIMARY KEY, file_path TEXT, class INTEGER, "
+            "dest_path TEXT, seconds REAL, probs TEXT)"
+        )
+        if not resume:
+            self.connection.execute("DELETE FROM details")
+        self.connection.commit()
+
+    def write(self, rows):
+        # Один батч - одна транзакция
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO details VALUES (?, ?, ?, ?, ?, ?)",
+            [tuple(row[column] for column in DETAIL_COLUMNS) for row in rows],
+        )
+        self.connection.commit()
+        return True
+
+    def close(self):
+        self.connection.close()
+
+
+class ParquetDetails:
+    # Parquet-файл нельзя дописывать, поэтому строки собираются в части по PARQUET_PART_ROWS.
+    # Пока часть не записана, ResultWriter не отмечает ее изображения в result.csv,
+    # поэтому после сбоя они обрабатываются заново и в подробностях не теряются
+    def __init__(self, output_folder, resume):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.parquet = pyarrow.parquet
+        self.folder = os.path.join(output_folder, 'details.parquet')
+        os.makedirs(self.folder, exist_ok=True)
+        parts = sorted(f for f in os.listdir(self.folder) if f.endswith('.parquet'))
+        if not resume:
+            for part in parts:
+                os.remove(os.path.join(self.folder, part))
+            parts = []
+        self.part = len(parts)
+        self.rows = []
+
+    def write(self, rows):
+        self.rows.extend(rows)
+        if len(self.rows) >= PARQUET_PART_ROWS:
+            self.flush()
+        return not self.rows
+
+    def flush(self):
+        if not self.rows:
+            return
+        table = self.pyarrow.Table.from_pylist(self.rows)
+        path = os.path.join(self.folder, f'part-{self.part:05d}.parquet')
+        # Запись через временный файл: часть либо записана целиком, либо отсутствует
+        self.parquet.write_table(table, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        self.part += 1
+        self.rows = []
+
+    def close(self):
+        self.flush()
+
+
+DETAIL_WRITERS = {'csv': CsvDetails, 'sqlite': SqliteDetails, 'parquet': ParquetDetails}
+
+
+class ResultWriter:
+    # Результаты записываются в папку вывода после каждого батча, а не одной таблицей в конце.
+    # result.csv служит контрольной точкой: при resume=True уже записанные изображения пропускаются.
+    # Вероятности каждой модели и время обработки пишутся в details.csv, details.sqlite или details.parquet/,
+    # оценки уверенности кадров - в review.csv, по ним готовый запуск пересортировывается без инференса (review.py)
+    def __init__(self, output_folder, details_format='csv', resume=False, with_animals=False, with_events=False):
+        if details_format not in DETAIL_FORMATS:
+            raise ValueError(f"Unknown details format: {details_format}")
+        # result.csv открывается первым: оборванная при сбое последняя строка отбрасывается
+        # до чтения готовых изображений, иначе изображение считалось бы готовым и терялось
+        result_path = os.path.join(output_folder, 'result.csv')
+        self.result_file, self.result_writer = open_csv(result_path, RESULT_COLUMNS, resume)
+        self.done = read_done(result_path) if resume else set()
+        self.details = DETAIL_WRITERS[details_format](output_folder, resume)
+        self.animals_file = self.animals_writer = None
+        if with_animals:
+            self.animals_file, self.animals_writer = open_csv(os.path.join(output_folder, 'animals.csv'), ANIMAL_COLUMNS, resume)
+        self.review_file, self.review_writer = open_csv(os.path.join(output_folder, 'review.csv'), REVIEW_COLUMNS, resume)
+        self.events_file = self.events_writer = None
+        if with_events:
+            # Серии кадров (режим серий): одна строка на срабатывание фотоловушки
+            self.events_file, self.events_writer = open_csv(os.path.join(output_folder, 'events.csv'), EVENT_COLUMNS, resume)
+        # Строки result.csv, чьи подробности еще в буфере (details.parquet)
+        self.pending = []
+
+    def write(self, rows, animals=(), reviews=(), events=()):
+        # rows - словари с полями DETAIL_COLUMNS, probs - вероятности каждой модели, reviews - с полями REVIEW_COLUMNS.
+        # result.csv пишется последним, чтобы изображение считалось готовым только после записи подробностей
+        self.pending.extend({'img_name': row['img_name'], 'class': row['class']} for row in rows)
+        durable = self.details.write([dict(row, probs=json.dumps(row['probs'])) for row in rows])
+        if self.animals_writer is not None:
+            self.animals_writer.writerows(animals)
+            sync(self.animals_file)
+        self.review_writer.writerows(reviews)
+        sync(self.review_file)
+        if self.events_writer is not None:
+            self.events_writer.writerows(events)
+            sync(self.events_file)
+        if durable:
+            self.write_results()
+
+    def write_results(self):
+        self.result_writer.writerows(self.pending)
+        sync(self.result_file)
+        self.pending = []
+
+    def close(self):
+        self.details.close()
+        self.write_results()
+        if self.animals_file is not None:
+            self.animals_file.close()
+        self.review_file.close()
+        if self.events_file is not None:
+            self.events_file.close()
+        self.result_file.close()
+
+
+def read_reviews(output_folder):
+    # Строки review.csv с оценками в виде чисел. Изображение, обработанное повторно после сбоя,
+    # встречается в файле дважды - остается последняя строка
+    path = os.path.join(output_folder, 'review.csv')
+    if not os.path.exists(path):
+        return []
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = {row['img_name']: dict(row, **{column: float(row[column]) for column in REVIEW_COLUMNS[3:]})
+                for row in csv.DictReader(f) if row.get('agreement')}
+    return list(rows.values())
+
+
+CORRECTION_COLUMNS = ['file_name', 'from_class', 'to_class', 'time', 'undo']
+
+
+class CorrectionLog:
+    # Ручные исправления классов в corrections.csv папки вывода. Отмена записывается
+    # отдельной строкой с undo=1, итоговые метки для дообучения дает load_corrections
+    def __init__(self, output_folder):
+        self.file, self.writer = open_csv(os.path.join(output_folder, 'corrections.csv'), CORRECTION_COLUMNS, True)
+
+    def write(self, file_names, from_class, to_class, undo=False):
+        now = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.writer.writerows({'file_name': file_name, 'from_class': from_class, 'to_class': to_class,
+                               'time': now, 'undo': int(undo)} for file_name in file_names)
+        sync(self.file)
+
+    def close(self):
+        self.file.close()
+
+
+def load_corrections(output_folder):
+    # {имя файла: класс после последнего исправления}. Строка undo=1 отменяет последнее перемещение файла,
+    # файл без оставшихся исправлений в результат не попадает. Перенос в 'Низкая уверенность' - не класс
+    path = os.path.join(output_folder, 'corrections.csv')
+    moves = {}
+    if os.path.exists(path):
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                history = moves.setdefault(row['file_name'], [])
+                if row['undo'] == '1':
+                    if history:
+                        history.pop()
+                else:
+                    history.append(row['to_class'])
+    return {file_name: history[-1] for file_name, history in moves.items()
+            if history and history[-1] != LOW_CONFIDENCE_FOLDER}